@@ -0,0 +1,287 @@
+"""Aggregates over the whole transaction history, a column at a time.
+
+load() reads the finished transactions of carpark.db, archived months
+included, into Columns, parallel arrays with one entry per transaction,
+in id order:
+
+    spot                 spot number
+    plate                plate code, an index into Columns.plates (sorted)
+    time_in, time_out    epoch seconds
+    wall_in, wall_out    the same local wall-clock times, as seconds since
+                         1970-01-01 00:00 (for hour-of-day/week buckets)
+    cents                amount in integer cents
+
+SQLite does the parsing (strftime, dense_rank), so loading is one pass
+over the rows. With NumPy installed the columns are NumPy arrays and the
+aggregates below are vectorized; without it (or with use_numpy=False)
+they are array.array columns and the same aggregates run as plain loops,
+giving identical results (all integer arithmetic).
+"""
+import sqlite3
+from array import array
+from datetime import datetime, timedelta
+
+import archive
+
+try:
+    import numpy as np
+except ImportError:  # optional: the loops below give the same answers
+    np = None
+
+COLUMNS = ('spot', 'plate', 'time_in', 'time_out', 'wall_in', 'wall_out', 'cents')
+_TYPECODES = {'spot': 'i', 'plate': 'i'}
+HOURS_PER_WEEK = 7 * 24
+# 1970-01-01 was a Thursday; hour-of-week 0 is Monday 00:00-01:00
+_EPOCH_WEEKDAY = 3
+_NAIVE_EPOCH = datetime(1970, 1, 1)
+_SECOND = timedelta(seconds=1)
+
+_LOAD_SQL = '''
+    WITH t AS (
+        SELECT id, spot, plate,
+               CAST(strftime('%s', time_in) AS INTEGER) AS time_in,
+               CAST(strftime('%s', time_out) AS INTEGER) AS time_out,
+               CAST(strftime('%s', substr(time_in, 1, 19)) AS INTEGER) AS wall_in,
+               CAST(strftime('%s', substr(time_out, 1, 19)) AS INTEGER) AS wall_out,
+               CAST(round(COALESCE(amount, 0) * 100) AS INTEGER) AS cents
+        FROM {table} WHERE time_out IS NOT NULL
+    )
+    SELECT COALESCE(spot, 0), dense_rank() OVER (ORDER BY plate) - 1, time_in, time_out, wall_in, wall_out, cents
+    FROM t WHERE time_in IS NOT NULL AND time_out IS NOT NULL ORDER BY id
+'''
+
+
+class Columns:
+    def __init__(self, plates, columns):
+        """plates: the sorted distinct plates; columns: name -> sequence, per COLUMNS."""
+        self.plates = plates
+        for name in COLUMNS:
+            setattr(self, name, columns[name])
+
+    def __len__(self):
+        return len(self.spot)
+
+    @property
+    def vectorized(self):
+        return np is not None and isinstance(self.spot, np.ndarray)
+
+
+def _make(plates, arrays, use_numpy):
+    """Columns from array.array columns, as NumPy arrays (no copy) if wanted and available."""
+    if use_numpy is None:
+        use_numpy = np is not None
+    if use_numpy and np is not None:
+        arrays = {name: np.frombuffer(arrays[name], dtype=arrays[name].typecode) if len(arrays[name])
+                  else np.array([], dtype=arrays[name].typecode) for name in COLUMNS}
+    return Columns(plates, arrays)
+
+
+def _empty_arrays():
+    return {name: array(_TYPECODES.get(name, 'q')) for name in COLUMNS}
+
+
+def load(db_path='carpark.db', use_numpy=None):
+    """The finished transactions of a database file as Columns."""
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        source = _history_table(conn)
+        rows = conn.execute(_LOAD_SQL.format(table=source))
+        if use_numpy is not False and np is not None:
+            dtype = [(name, _TYPECODES.get(name, 'q')) for name in COLUMNS]
+            table = np.fromiter(rows, dtype=dtype)
+            columns = {name: np.ascontiguousarray(table[name]) for name in COLUMNS}
+        else:
+            arrays = _empty_arrays()
+            appends = [arrays[name].append for name in COLUMNS]
+            for row in rows:
+                for append, value in zip(appends, row):
+                    append(value)
+            columns = arrays
+        plates = [plate for (plate,) in conn.execute(
+            f'SELECT DISTINCT plate FROM {source} WHERE time_out IS NOT NULL '
+            "AND strftime('%s', time_in) IS NOT NULL AND strftime('%s', time_out) IS NOT NULL ORDER BY plate")]
+    finally:
+        conn.close()
+    return Columns(plates, columns)
+
+
+def _history_table(conn):
+    """The table to read: transactions, or with archived months (see
+    archive.py) a temporary one holding the live rows and theirs."""
+    conn.execute('BEGIN')
+    try:
+        months = archive.segments(conn)
+        if months:
+            conn.execute('CREATE TEMP TABLE history AS SELECT id, spot, plate, time_in, time_out, amount '
+                         'FROM main.transactions WHERE time_out IS NOT NULL')
+    finally:
+        conn.execute('COMMIT')
+    for segment in months:
+        conn.executemany('INSERT INTO history VALUES (?, ?, ?, ?, ?, ?)', segment.execute(
+            'SELECT id, spot, plate, time_in, time_out, amount FROM transactions WHERE time_out IS NOT NULL'))
+    return 'history' if months else 'transactions'
+
+
+def _seconds(value):
+    """(epoch seconds, wall-clock seconds) of an ISO timestamp, or None."""
+    try:
+        dt = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    wall = (dt.replace(tzinfo=None) - _NAIVE_EPOCH) // _SECOND
+    offset = dt.utcoffset()
+    return wall - (offset // _SECOND if offset is not None else 0), wall
+
+
+def from_transactions(transactions, use_numpy=None):
+    """Columns of transaction dicts (e.g. CarPark.transactions), as load() would read them."""
+    rows = []
+    for tx in transactions:
+        start, end = _seconds(tx.get('time_in')), _seconds(tx.get('time_out'))
+        if start is None or end is None:
+            continue
+        rows.append((tx.get('spot') or 0, tx.get('plate'), start[0], end[0], start[1], end[1],
+                     int(round((tx.get('amount') or 0) * 100))))
+    plates = sorted({row[1] for row in rows})
+    codes = {plate: code for code, plate in enumerate(plates)}
+    arrays = _empty_arrays()
+    for spot, plate, *rest in rows:
+        for name, value in zip(COLUMNS, (spot, codes[plate], *rest)):
+            arrays[name].append(value)
+    return _make(plates, arrays, use_numpy)
+
+
+# ---------------------------------------------------------------------- aggregates
+def dwell_histogram(cols, bucket_minutes=15, max_minutes=24 * 60):
+    """Stays per dwell-time bucket: [0, b), [b, 2b), ... minutes; the last
+    bucket holds every stay of max_minutes or more."""
+    width = bucket_minutes * 60
+    last = max_minutes // bucket_minutes
+    if cols.vectorized:
+        dwell = np.maximum(cols.time_out - cols.time_in, 0)
+        return np.bincount(np.minimum(dwell // width, last), minlength=last + 1).tolist()
+    counts = [0] * (last + 1)
+    for start, end in zip(cols.time_in, cols.time_out):
+        counts[min(max(end - start, 0) // width, last)] += 1
+    return counts
+
+
+def revenue_per_spot(cols):
+    """spot -> total cents of its transactions (spots with any)."""
+    if cols.vectorized:
+        counts = np.bincount(cols.spot)
+        totals = _sums(cols.spot, cols.cents, len(counts))
+        spots = np.flatnonzero(counts)
+        return dict(zip(spots.tolist(), totals[spots].tolist()))
+    totals = {}
+    for spot, cents in zip(cols.spot, cols.cents):
+        totals[spot] = totals.get(spot, 0) + cents
+    return dict(sorted(totals.items()))
+
+
+def _sums(keys, values, length):
+    """Integer totals of values per key, 0 <= key < length.
+
+    bincount adds in float64, which is exact while totals stay below 2**53
+    (90 billion in currency as cents).
+    """
+    return np.rint(np.bincount(keys, weights=values, minlength=length)).astype(np.int64)
+
+
+def _hour_of_week(wall):
+    """Hour of the week (Monday 00:00 = 0) of wall-clock seconds."""
+    return (wall // 3600 + _EPOCH_WEEKDAY * 24) % HOURS_PER_WEEK
+
+
+def hour_of_week_profile(cols):
+    """Per hour of the week (168 entries, Monday 00:00 first): arrivals,
+    departures and the cents of the transactions ending in it."""
+    if cols.vectorized:
+        arrive, leave = _hour_of_week(cols.wall_in), _hour_of_week(cols.wall_out)
+        return {
+            'arrivals': np.bincount(arrive, minlength=HOURS_PER_WEEK).tolist(),
+            'departures': np.bincount(leave, minlength=HOURS_PER_WEEK).tolist(),
+            'cents': _sums(leave, cols.cents, HOURS_PER_WEEK).tolist(),
+        }
+    profile = {key: [0] * HOURS_PER_WEEK for key in ('arrivals', 'departures', 'cents')}
+    for wall_in, wall_out, cents in zip(cols.wall_in, cols.wall_out, cols.cents):
+        profile['arrivals'][_hour_of_week(wall_in)] += 1
+        leave = _hour_of_week(wall_out)
+        profile['departures'][leave] += 1
+        profile['cents'][leave] += cents
+    return profile
+
+
+def _occupied_seconds(cols):
+    """(first hour, car-seconds parked in each wall-clock hour from it on).
+
+    A stay adds its part of the hour it starts in and of the hour it ends
+    in (its whole length if that is the same hour), and 3600 to each hour
+    in between; those are counted with a difference array, so no sorting.
+    """
+    if cols.vectorized:
+        ins = cols.wall_in
+        outs = np.maximum(cols.wall_out, ins)
+        first = int(ins.min()) // 3600
+        start, end = ins // 3600 - first, outs // 3600 - first
+        size = int(end.max()) + 1
+        split = end > start
+        per_hour = np.bincount(start, weights=np.minimum(outs, (start + first + 1) * 3600) - ins, minlength=size)
+        per_hour += np.bincount(end, weights=np.where(split, outs - (end + first) * 3600, 0), minlength=size)
+        # +1 from the hour after the start, -1 from the end hour (a no-op
+        # for stays within one hour)
+        inside = (np.bincount(start + 1, minlength=size + 1)
+                  - np.bincount(np.maximum(end, start + 1), minlength=size + 1))
+        per_hour = np.rint(per_hour).astype(np.int64) + np.cumsum(inside[:size]) * 3600
+        return first, per_hour
+    first = min(cols.wall_in) // 3600
+    size = max(max(out, in_) for in_, out in zip(cols.wall_in, cols.wall_out)) // 3600 - first + 1
+    per_hour = [0] * size
+    inside = [0] * (size + 1)
+    for in_, out in zip(cols.wall_in, cols.wall_out):
+        out = max(out, in_)
+        start, end = in_ // 3600 - first, out // 3600 - first
+        if start == end:
+            per_hour[start] += out - in_
+        else:
+            per_hour[start] += (start + first + 1) * 3600 - in_
+            per_hour[end] += out - (end + first) * 3600
+            inside[start + 1] += 1
+            inside[end] -= 1
+    full = 0
+    for hour in range(size):
+        full += inside[hour]
+        per_hour[hour] += full * 3600
+    return first, per_hour
+
+
+def utilization_heatmap(cols, capacity=None):
+    """7 x 24 grid (Monday first) of parked car-hours per weekday and hour.
+
+    With capacity, each cell is instead the share of the available
+    spot-hours that were used, over the weeks the history covers.
+    """
+    grid = [[0.0] * 24 for _ in range(7)]
+    if not len(cols):
+        return grid
+    first, per_hour = _occupied_seconds(cols)
+    if cols.vectorized:
+        hours = np.arange(first, first + len(per_hour), dtype=np.int64)
+        seconds = _sums(_hour_of_week(hours * 3600), per_hour, HOURS_PER_WEEK).tolist()
+    else:
+        seconds = [0] * HOURS_PER_WEEK
+        for i, occupied in enumerate(per_hour):
+            seconds[_hour_of_week((first + i) * 3600)] += occupied
+    # how often each hour of the week occurs in the covered span
+    occurrences = [0] * HOURS_PER_WEEK
+    full_weeks, rest = divmod(len(per_hour), HOURS_PER_WEEK)
+    start = _hour_of_week(first * 3600)
+    for i in range(HOURS_PER_WEEK):
+        occurrences[(start + i) % HOURS_PER_WEEK] = full_weeks + (1 if i < rest else 0)
+    for how in range(HOURS_PER_WEEK):
+        if capacity:
+            value = seconds[how] / (capacity * 3600 * occurrences[how]) if occurrences[how] else 0.0
+        else:
+            value = seconds[how] / 3600
+        grid[how // 24][how % 24] = round(value, 4)
+    return grid
@@ -1,26 +1,103 @@
+import json
 import os
+import re
+import time
+import zlib
 from functools import wraps
 from typing import Any, Dict, List
 
 from flask import (
     Flask,
+    Response,
     jsonify,
     render_template,
     request,
     session,
 )
 
-from practice import CarPark
+import backup
+import db
+from change_feed import ChangeFeed
+from practice import MAX_OVERRIDE_HOURS, CarPark
 from user_manager import UserManager
 
 APP_SECRET = os.environ.get("FLASK_SECRET_KEY", "dev-secret-change-me")
 DB_PATH = os.environ.get("CARPARK_DB", "carpark.db")
+# in-memory history window per worker; older transactions stay in SQLite
+# (0 disables the bound)
+HISTORY_LIMIT = int(os.environ.get("CARPARK_HISTORY_LIMIT", "1000")) or None
+HISTORY_DAYS = int(os.environ.get("CARPARK_HISTORY_DAYS", "0")) or None
+# binary snapshot each worker starts from (see CarPark.save_snapshot), then
+# catching up through the change log; empty disables it
+SNAPSHOT_PATH = os.environ.get("CARPARK_SNAPSHOT", DB_PATH + ".snapshot") or None
+# answer a change only once it is on disk (fsyncs shared between concurrent
+# requests); 0 trades the last commits before a power cut for latency
+DURABLE = os.environ.get("CARPARK_DURABLE", "1") != "0"
+# /api/events: how often a stream checks the database for changes, how often
+# it sends a keep-alive comment, and how long it stays open before the
+# browser reconnects (which frees the worker thread it holds)
+EVENT_POLL_SECONDS = float(os.environ.get("CARPARK_EVENT_POLL", "0.5"))
+EVENT_PING_SECONDS = 15
+EVENT_STREAM_SECONDS = 300
+# nightly online backup into CARPARK_BACKUP_DIR (relative to the database's
+# folder) and maintenance window (ANALYZE, optimize, incremental vacuum),
+# local times; empty disables one (see backup.py). CARPARK_SCHEDULER=0 keeps
+# this process from running them, e.g. when another process does
+BACKUP_DIR = os.environ.get("CARPARK_BACKUP_DIR", "backups") or None
+if BACKUP_DIR:
+    BACKUP_DIR = os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), BACKUP_DIR)
+BACKUP_AT = os.environ.get("CARPARK_BACKUP_AT", "02:30") or None
+MAINTENANCE_AT = os.environ.get("CARPARK_MAINTENANCE_AT", "03:30") or None
+SCHEDULER = os.environ.get("CARPARK_SCHEDULER", "1") != "0"
 
 app = Flask(__name__, static_folder="static", template_folder="templates")
 app.config["SECRET_KEY"] = APP_SECRET
 
 user_manager = UserManager(DB_PATH)
-carpark = CarPark.load_from_db(DB_PATH) or CarPark(10)
+
+
+def new_carpark(capacity: int) -> CarPark:
+    """Create an empty park that becomes the write-through state of DB_PATH."""
+    park = CarPark(capacity)
+    park.history_limit = HISTORY_LIMIT
+    park.history_days = HISTORY_DAYS
+    park.attach_db(DB_PATH, durable=DURABLE)
+    park.snapshot_path = SNAPSHOT_PATH
+    return park
+
+
+def load_carpark():
+    return CarPark.load_from_db(
+        DB_PATH,
+        write_through=True,
+        history_limit=HISTORY_LIMIT,
+        history_days=HISTORY_DAYS,
+        snapshot=SNAPSHOT_PATH,
+        durable=DURABLE,
+    )
+
+
+carpark = load_carpark() or new_carpark(10)
+# started by the first request a worker serves, not on import; each run is
+# claimed in the database, so only one worker does it
+scheduler = backup.Scheduler(DB_PATH, BACKUP_DIR, BACKUP_AT, MAINTENANCE_AT)
+
+
+@app.before_request
+def sync_carpark():
+    # every gunicorn worker holds its own CarPark; pick up what the others
+    # committed (a single PRAGMA when nothing changed)
+    if carpark is not None:
+        carpark.refresh()
+    if SCHEDULER:
+        scheduler.start()
+
+
+@app.teardown_request
+def release_connections(exc=None):
+    # pooled connections stay open for the thread's next request; just
+    # make sure a failed request did not leave a transaction behind
+    db.release()
 
 
 def login_required(fn):
@@ -47,18 +124,22 @@ def admin_required(fn):
 def ensure_carpark():
     global carpark
     if carpark is None:
-        carpark = CarPark(10)
+        carpark = new_carpark(10)
     return carpark
 
 
+def car_record(park: CarPark, spot: int):
+    record = park.parked_cars.get(spot)
+    if record is None:
+        return None
+    record = dict(record)
+    record["spot"] = spot
+    return record
+
+
 def serialize_state(user: str) -> Dict[str, Any]:
     park = ensure_carpark()
-    parked: List[Dict[str, Any]] = []
-    for spot in range(1, park.capacity + 1):
-        if spot in park.parked_cars:
-            record = dict(park.parked_cars[spot])
-            record["spot"] = spot
-            parked.append(record)
+    parked: List[Dict[str, Any]] = [car_record(park, spot) for spot in sorted(park.parked_cars)]
 
     return {
         "current_user": user,
@@ -67,10 +148,48 @@ def serialize_state(user: str) -> Dict[str, Any]:
         "rate_per_hour": park.rate_per_hour,
         "available_spots": park.available_spots(),
         "parked_cars": parked,
-        "transactions": park.transactions[-50:],
+        "transactions": [tx.to_dict() for tx in park.transactions[-50:]],
+        # change-log version this state reflects; /api/events?since=version
+        # streams what happens after it
+        "version": park.version,
+    }
+
+
+def serialize_delta(user: str, since: int) -> Dict[str, Any]:
+    """What changed after version `since`: only the touched spots (car is
+    None when a spot was freed) and transactions. Falls back to the full
+    state, marked "delta": false, when the change log can no longer tell.
+    """
+    park = ensure_carpark()
+    changes = park.changes_since(since)
+    if changes is None:
+        full = serialize_state(user)
+        full["delta"] = False
+        return full
+    spots = sorted({spot for _, _, spot, _ in changes if spot is not None})
+    transactions = []
+    for tx_id in sorted({tx_id for _, _, _, tx_id in changes if tx_id is not None}):
+        tx = park.get_transaction(tx_id)
+        if tx is not None:
+            transactions.append(dict(tx))
+    return {
+        "delta": True,
+        "since": since,
+        "version": park.version,
+        "capacity": park.capacity,
+        "rate_per_hour": park.rate_per_hour,
+        "available_spots": park.available_spots(),
+        "spots": [{"spot": spot, "car": car_record(park, spot)} for spot in spots],
+        "transactions": transactions,
     }
 
 
+def request_since(park: CarPark) -> int:
+    """The version the caller's copy of the state is at (?since=), else the current one."""
+    since = request.args.get("since", type=int)
+    return park.version if since is None else since
+
+
 @app.get("/")
 def index():
     return render_template("index.html")
@@ -100,8 +219,27 @@ def logout():
 @app.get("/api/state")
 @login_required
 def state():
+    """Full state, revalidated with ETag/If-None-Match; ?since=<version>
+    returns only what changed after that version (see serialize_delta)."""
     user = session["username"]
-    return jsonify(serialize_state(user))
+    park = ensure_carpark()
+    if request.args.get("since"):
+        try:
+            since = int(request.args["since"])
+        except ValueError:
+            return jsonify({"error": "since must be a state version"}), 400
+        return jsonify(serialize_delta(user, since))
+
+    # the payload also depends on who asks
+    etag = f"{park.version}-{zlib.crc32(user.encode())}-{int(user_manager.is_admin(user))}"
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(serialize_state(user))
+    response.set_etag(etag, weak=True)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
 
 
 @app.post("/api/setup")
@@ -120,8 +258,9 @@ def setup():
 
     new_rate = float(rate)
 
-    carpark = CarPark(capacity)
-    carpark.rate_per_hour = new_rate
+    carpark.detach_db()
+    carpark = new_carpark(capacity)
+    carpark.set_rate(new_rate)
     return jsonify({"message": "Car park created", "state": serialize_state(session["username"])})
 
 
@@ -134,10 +273,11 @@ def park_car_endpoint():
     if not plate:
         return jsonify({"error": "License plate is required"}), 400
 
+    since = request_since(park)
     success = park.park_car(plate)
     if not success:
         return jsonify({"error": "Car park is full"}), 400
-    return jsonify({"message": "Car parked", "state": serialize_state(session["username"])})
+    return jsonify({"message": "Car parked", "delta": serialize_delta(session["username"], since)})
 
 
 @app.post("/api/remove")
@@ -158,10 +298,10 @@ def remove_car_endpoint():
     if hours_override is not None and hours_override != "":
         try:
             parsed_hours = float(hours_override)
-            if parsed_hours < 0:
+            if not 0 <= parsed_hours <= MAX_OVERRIDE_HOURS:
                 raise ValueError
         except Exception:
-            return jsonify({"error": "Hours must be a non-negative number"}), 400
+            return jsonify({"error": f"Hours must be a number from 0 to {MAX_OVERRIDE_HOURS}"}), 400
     if amount_override is not None and amount_override != "":
         try:
             parsed_amount = round(float(amount_override), 2)
@@ -170,6 +310,7 @@ def remove_car_endpoint():
         except Exception:
             return jsonify({"error": "Amount must be a non-negative number"}), 400
 
+    since = request_since(park)
     transaction = park.remove_car(
         spot,
         hours_override=parsed_hours,
@@ -179,26 +320,389 @@ def remove_car_endpoint():
         return jsonify({"error": "Invalid spot"}), 400
 
     return jsonify(
-        {"message": "Car removed", "transaction": transaction, "state": serialize_state(session["username"])}
+        {
+            "message": "Car removed",
+            "transaction": transaction.to_dict(),
+            "delta": serialize_delta(session["username"], since),
+        }
     )
 
 
+MAX_BATCH_OPERATIONS = 500
+
+
+@app.post("/api/batch")
+@login_required
+def batch_endpoint():
+    """Apply a burst of gate events in order, under one lock and one commit.
+
+    Body: {"operations": [{"op": "park", "plate": "AB123"},
+    {"op": "remove", "spot": 3}, {"op": "remove", "plate": "AB123"}, ...]}.
+    A remove by plate frees the spot that plate is parked at. Returns one
+    result per operation, in order ("ok" plus "spot" / "transaction", or
+    "error"), and a single delta for all of them. A malformed operation
+    rejects the whole batch before anything is applied.
+    """
+    from itertools import groupby
+
+    park = ensure_carpark()
+    data = request.get_json() or {}
+    operations = data.get("operations")
+    if not isinstance(operations, list) or not operations:
+        return jsonify({"error": "operations must be a non-empty list"}), 400
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        return jsonify({"error": f"At most {MAX_BATCH_OPERATIONS} operations per batch"}), 400
+    parsed = []
+    for index, op in enumerate(operations):
+        kind = op.get("op") if isinstance(op, dict) else None
+        plate = op.get("plate") if isinstance(op, dict) else None
+        plate = plate.strip() if isinstance(plate, str) else ""
+        if kind == "park" and plate:
+            parsed.append(("park", plate))
+        elif kind == "remove" and op.get("spot") is not None:
+            try:
+                parsed.append(("remove", int(op["spot"])))
+            except Exception:
+                return jsonify({"error": f"Operation {index}: spot must be an integer"}), 400
+        elif kind == "remove" and plate:
+            parsed.append(("remove", plate))
+        else:
+            return jsonify({"error": f"Operation {index}: expected park with plate, or remove with spot or plate"}), 400
+
+    since = request_since(park)
+    results = []
+    with park.batch():
+        for kind, run in groupby(parsed, key=lambda op: op[0]):
+            targets = [target for _, target in run]
+            if kind == "park":
+                for spot in park.park_many(targets):
+                    results.append({"ok": True, "spot": spot} if spot is not None
+                                   else {"ok": False, "error": "Car park is full"})
+                continue
+            # plates resolve to spots here, after the operations before them
+            spots = [park.find_plate(t) if isinstance(t, str) else t for t in targets]
+            for target, tx in zip(targets, park.remove_many(spots)):
+                if tx is not None:
+                    results.append({"ok": True, "spot": tx["spot"], "transaction": tx.to_dict()})
+                else:
+                    error = "Car not found" if isinstance(target, str) else "Invalid spot"
+                    results.append({"ok": False, "error": error})
+    return jsonify({"results": results, "delta": serialize_delta(session["username"], since)})
+
+
 @app.post("/api/spot/<int:spot>/comments")
 @login_required
 def update_comments(spot: int):
     park = ensure_carpark()
     data = request.get_json() or {}
     comments = data.get("comments", "")
+    since = request_since(park)
     if not park.update_comments(spot, comments):
         return jsonify({"error": "Spot is empty or does not exist"}), 404
     return jsonify(
         {
             "message": "Comments updated",
-            "state": serialize_state(session["username"]),
+            "delta": serialize_delta(session["username"], since),
+        }
+    )
+
+
+@app.get("/api/events")
+@login_required
+def events():
+    """Server-Sent Events stream of park/remove/comment/rate changes.
+
+    Each event's data is a ChangeFeed event as JSON and its id is the
+    change-log version, so a reconnecting browser (Last-Event-ID) resumes
+    where it stopped. Start from ?since=<state.version> to pick up right
+    after an /api/state snapshot.
+    """
+    since = request.headers.get("Last-Event-ID") or request.args.get("since")
+    try:
+        since = int(since) if since else None
+    except ValueError:
+        return jsonify({"error": "since must be a change-log version"}), 400
+    feed = ChangeFeed(DB_PATH)
+    if since is None:
+        since = feed.latest_version()
+
+    def stream():
+        version = since
+        try:
+            yield "retry: 3000\n\n"
+            started = last_sent = time.monotonic()
+            while time.monotonic() - started < EVENT_STREAM_SECONDS:
+                if feed.changed():
+                    version, changes = feed.events_since(version)
+                    for event in changes:
+                        yield f"id: {event['version']}\ndata: {json.dumps(event)}\n\n"
+                        last_sent = time.monotonic()
+                if time.monotonic() - last_sent >= EVENT_PING_SECONDS:
+                    yield ": ping\n\n"
+                    last_sent = time.monotonic()
+                time.sleep(EVENT_POLL_SECONDS)
+        finally:
+            feed.close()
+
+    return Response(
+        stream(),
+        mimetype="text/event-stream",
+        # X-Accel-Buffering: nginx must pass each event on as it is written
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+
+
+@app.get("/api/search")
+@login_required
+def search_plates():
+    """Plates matching ?q= (exact, prefix, then substring), for search-as-you-type.
+
+    Covers cars parked now and every plate in the transaction history.
+    Each result has the plate, its spot (null when not parked) and the
+    parked car's record.
+    """
+    park = ensure_carpark()
+    query = request.args.get("q", "")
+    try:
+        limit = min(max(int(request.args.get("limit", SEARCH_LIMIT)), 1), MAX_SEARCH_LIMIT)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    results = park.search_plates(query, limit)
+    for result in results:
+        result["car"] = car_record(park, result["spot"]) if result["spot"] is not None else None
+    return jsonify({"query": query, "results": results})
+
+
+TRANSACTION_FIELDS = ("id", "spot", "plate", "time_in", "time_out", "amount", "paid", "comments")
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+@app.get("/api/transactions")
+@login_required
+def list_transactions():
+    """One page of transaction history, newest first by default.
+
+    Query string: limit, cursor (the next_cursor of the previous page),
+    order=desc|asc, plate (+ match=exact|prefix|contains), spot, from/to
+    (YYYY-MM-DD, time_out date, inclusive), paid=true|false and
+    fields=comma,separated,names. The cursor is opaque; see
+    CarPark.page_transactions for why a page costs the same however deep
+    it is.
+    """
+    from datetime import date
+
+    park = ensure_carpark()
+    args = request.args
+    filters: Dict[str, Any] = {}
+    try:
+        limit = int(args.get("limit", PAGE_SIZE))
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            raise ValueError
+    except ValueError:
+        return jsonify({"error": f"limit must be between 1 and {MAX_PAGE_SIZE}"}), 400
+    order = args.get("order", "desc")
+    if order not in ("asc", "desc"):
+        return jsonify({"error": "order must be 'asc' or 'desc'"}), 400
+    newest_first = order == "desc"
+    if args.get("plate"):
+        filters["plate"] = args["plate"]
+        filters["plate_match"] = args.get("match", "exact")
+        if filters["plate_match"] not in ("exact", "prefix", "contains"):
+            return jsonify({"error": "match must be 'exact', 'prefix' or 'contains'"}), 400
+    if args.get("spot"):
+        try:
+            filters["spot"] = int(args["spot"])
+        except ValueError:
+            return jsonify({"error": "Spot must be an integer"}), 400
+    for param, key in (("from", "date_from"), ("to", "date_to")):
+        if args.get(param):
+            try:
+                filters[key] = date.fromisoformat(args[param]).isoformat()
+            except ValueError:
+                return jsonify({"error": f"{param} must be a date (YYYY-MM-DD)"}), 400
+    if args.get("paid"):
+        paid = args["paid"].lower()
+        if paid not in ("true", "false", "1", "0"):
+            return jsonify({"error": "paid must be true or false"}), 400
+        filters["paid"] = paid in ("true", "1")
+    fields = TRANSACTION_FIELDS
+    if args.get("fields"):
+        fields = tuple(f.strip() for f in args["fields"].split(",") if f.strip())
+        unknown = [f for f in fields if f not in TRANSACTION_FIELDS]
+        if unknown:
+            return jsonify({"error": f"Unknown field(s): {', '.join(unknown)}"}), 400
+
+    try:
+        page, next_cursor = park.page_transactions(
+            cursor=args.get("cursor") or None, limit=limit, newest_first=newest_first, **filters
+        )
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
+    return jsonify(
+        {
+            "transactions": [{f: tx.get(f) for f in fields} for tx in page],
+            "next_cursor": next_cursor,
+        }
+    )
+
+
+@app.get("/api/transactions/search")
+@login_required
+def search_transactions():
+    """Transactions whose plate or comments match ?q=, best match first.
+
+    Every word must appear, the last one may be a prefix ("rear bump"
+    finds "damage on rear bumper"); see CarPark.search_transactions.
+    """
+    park = ensure_carpark()
+    query = request.args.get("q", "")
+    try:
+        limit = int(request.args.get("limit", PAGE_SIZE))
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            raise ValueError
+    except ValueError:
+        return jsonify({"error": f"limit must be between 1 and {MAX_PAGE_SIZE}"}), 400
+    return jsonify({"query": query, "transactions": [dict(tx) for tx in park.search_transactions(query, limit)]})
+
+
+@app.post("/api/transactions/paid")
+@admin_required
+def mark_transactions_paid():
+    park = ensure_carpark()
+    data = request.get_json() or {}
+    ids = data.get("ids")
+    if not isinstance(ids, list):
+        return jsonify({"error": "ids must be a list of transaction ids"}), 400
+    try:
+        ids = [int(tx_id) for tx_id in ids]
+    except Exception:
+        return jsonify({"error": "ids must be a list of transaction ids"}), 400
+    since = request_since(park)
+    count = park.mark_paid(ids, paid=bool(data.get("paid", True)))
+    return jsonify(
+        {
+            "message": f"{count} transaction(s) updated",
+            "updated": count,
+            "delta": serialize_delta(session["username"], since),
+        }
+    )
+
+
+REPORT_DAYS = 30
+
+
+@app.get("/api/reports/daily")
+@login_required
+def daily_report():
+    """Totals of one day (?day=YYYY-MM-DD, default today) and its hours.
+
+    Read from the rollup tables: a handful of rows, however long the
+    history is.
+    """
+    from datetime import date, datetime
+
+    park = ensure_carpark()
+    try:
+        day = date.fromisoformat(request.args["day"]) if request.args.get("day") else datetime.now(park.tz).date()
+    except ValueError:
+        return jsonify({"error": "day must be YYYY-MM-DD"}), 400
+    return jsonify(
+        {
+            "day": day.isoformat(),
+            "totals": park.report_totals(day, day),
+            "hours": park.report("hourly", day, day),
+        }
+    )
+
+
+@app.get("/api/reports/range")
+@login_required
+def range_report():
+    """Report rows per day or hour (?period=daily|hourly) from ?from= to ?to=.
+
+    Both dates are inclusive; to defaults to today and from to
+    REPORT_DAYS days before it. Also returns the totals over the range.
+    """
+    from datetime import date, datetime, timedelta
+
+    park = ensure_carpark()
+    args = request.args
+    period = args.get("period", "daily")
+    if period not in ("daily", "hourly"):
+        return jsonify({"error": "period must be daily or hourly"}), 400
+    try:
+        end = date.fromisoformat(args["to"]) if args.get("to") else datetime.now(park.tz).date()
+        start = date.fromisoformat(args["from"]) if args.get("from") else end - timedelta(days=REPORT_DAYS - 1)
+    except ValueError:
+        return jsonify({"error": "from and to must be YYYY-MM-DD"}), 400
+    if start > end:
+        return jsonify({"error": "from must not be after to"}), 400
+    return jsonify(
+        {
+            "period": period,
+            "from": start.isoformat(),
+            "to": end.isoformat(),
+            "rows": park.report(period, start, end),
+            "totals": park.report_totals(start, end),
         }
     )
 
 
+@app.get("/api/reports/revenue")
+@login_required
+def revenue_report():
+    """Revenue and transaction count from ?start= up to (not including) ?end=.
+
+    Both are ISO dates or timestamps, taken to the minute; end defaults to
+    now and start to the beginning of today. Any window costs the same.
+    """
+    from datetime import datetime
+
+    park = ensure_carpark()
+    now = datetime.now(park.tz)
+    start = request.args.get("start") or now.replace(hour=0, minute=0, second=0, microsecond=0).isoformat()
+    end = request.args.get("end") or now.isoformat()
+    try:
+        totals = park.revenue_between(start, end)
+    except ValueError:
+        return jsonify({"error": "start and end must be ISO dates or timestamps"}), 400
+    return jsonify(dict(totals, start=start, end=end))
+
+
+@app.get("/api/occupancy")
+@admin_required
+def occupancy_at():
+    """The cars inside at ?at= (an ISO timestamp, default now), for disputes."""
+    from datetime import datetime
+
+    park = ensure_carpark()
+    at = request.args.get("at") or datetime.now(park.tz).isoformat()
+    try:
+        cars = park.parked_at(at)
+    except ValueError:
+        return jsonify({"error": "at must be an ISO timestamp"}), 400
+    return jsonify({"at": at, "count": len(cars), "cars": cars})
+
+
+@app.get("/api/occupancy/peak")
+@admin_required
+def occupancy_peak():
+    """Most cars inside at once on ?day=YYYY-MM-DD (default today)."""
+    from datetime import date, datetime
+
+    park = ensure_carpark()
+    try:
+        day = date.fromisoformat(request.args["day"]) if request.args.get("day") else datetime.now(park.tz).date()
+    except ValueError:
+        return jsonify({"error": "day must be YYYY-MM-DD"}), 400
+    return jsonify({"day": day.isoformat(), "peak_occupancy": park.peak_occupancy(day)})
+
+
 @app.post("/api/rate")
 @admin_required
 def set_rate():
@@ -212,25 +716,90 @@ def set_rate():
     except Exception:
         return jsonify({"error": "Rate must be a positive number"}), 400
 
-    park.rate_per_hour = rate
-    return jsonify({"message": "Rate updated", "state": serialize_state(session["username"])})
+    since = request_since(park)
+    park.set_rate(rate)
+    return jsonify({"message": "Rate updated", "delta": serialize_delta(session["username"], since)})
 
 
 @app.post("/api/save")
 @admin_required
 def save_state():
     park = ensure_carpark()
+    # write-through parks are already persisted; this only commits leftovers
     park.save_to_db(DB_PATH)
     return jsonify({"message": "State saved"})
 
 
+MONTH_PATTERN = re.compile(r"\d{4}-\d{2}")
+
+
+@app.post("/api/archive/close")
+@admin_required
+def close_months():
+    """Move finished months out of the live table (the month-end close).
+
+    Every month before ?before= / {"before": "YYYY-MM"} (default: the
+    current one); history queries keep finding them in the archive files.
+    """
+    park = ensure_carpark()
+    before = (request.get_json(silent=True) or {}).get("before") or request.args.get("before")
+    if before is not None and not MONTH_PATTERN.fullmatch(str(before)):
+        return jsonify({"error": "before must be YYYY-MM"}), 400
+    months = park.close_months(before)
+    return jsonify({"message": f"{len(months)} month(s) archived", "months": months})
+
+
+@app.post("/api/archive/drop")
+@admin_required
+def drop_months():
+    """Delete the archived months before {"before": "YYYY-MM"} (required)."""
+    park = ensure_carpark()
+    before = (request.get_json(silent=True) or {}).get("before")
+    if not before or not MONTH_PATTERN.fullmatch(str(before)):
+        return jsonify({"error": "before must be YYYY-MM"}), 400
+    months = park.drop_months(before)
+    return jsonify({"message": f"{len(months)} month(s) deleted", "months": months})
+
+
+@app.get("/api/backups")
+@admin_required
+def list_backups():
+    """The backups kept in BACKUP_DIR, newest first, and the last scheduled runs."""
+    backups = []
+    for folder in reversed(backup.list_backups(DB_PATH, BACKUP_DIR) if BACKUP_DIR else []):
+        path = os.path.join(folder, os.path.basename(DB_PATH))
+        size = os.path.getsize(path) if os.path.exists(path) else None
+        backups.append({"name": os.path.basename(folder), "bytes": size})
+    last = {}
+    for job, (at, result) in scheduler.last.items():
+        failed = isinstance(result, Exception)
+        last[job] = {
+            "at": at.isoformat(timespec="seconds"),
+            "result": None if failed else result,
+            "error": str(result) if failed else None,
+        }
+    return jsonify({"backups": backups, "last": last})
+
+
+@app.post("/api/backups")
+@admin_required
+def start_backup():
+    """Start an online backup now; it runs in the background (see backup.py)."""
+    if not BACKUP_DIR:
+        return jsonify({"error": "Backups are disabled (CARPARK_BACKUP_DIR)"}), 400
+    scheduler.run_in_background("backup")
+    return jsonify({"message": "Backup started"}), 202
+
+
 @app.post("/api/load")
 @admin_required
 def load_state():
     global carpark
-    loaded = CarPark.load_from_db(DB_PATH)
+    loaded = load_carpark()
     if not loaded:
         return jsonify({"error": "No saved state found"}), 404
+    if carpark is not None:
+        carpark.detach_db()
     carpark = loaded
     return jsonify({"message": "State loaded", "state": serialize_state(session["username"])})
 
@@ -0,0 +1,433 @@
+"""Monthly archive: finished months moved out of the live transactions table.
+
+close_months() is the month-end job. For each finished month it
+
+  1. records the month in the archive_months catalog of the live database,
+     which closes it: CarPark refuses edits to its transactions from then on;
+  2. copies the month's transactions, in one read transaction, into a
+     segment file <database>-archive/<YYYY-MM>.db, with the same indexes
+     and full-text index as the live table, written under a temporary name,
+     fsynced and renamed; the file is never written again;
+  3. deletes them from the live table PURGE_BATCH rows per write
+     transaction, so gate traffic only ever waits for one short batch.
+
+Readers see each row once throughout: a month's rows count as archived up
+to purged_upto, the last id deleted from the live table, which is moved in
+the same transaction as the delete. An interrupted close is finished by
+the next run. drop_months() deletes old archived months, one catalog row
+(a tiny transaction) and one file at a time.
+
+select() and iter_rows() run a query over the live table and the archived
+months together: the same SQL is run against each segment file (opened
+read-only, immutable) and the rows are merged in Python, so any number of
+months can be read without ATTACH. The report rollups stay in the live
+database and are not changed by either job.
+"""
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from urllib.parse import quote
+
+import db
+
+# rows deleted from the live table per write transaction while closing a
+# month (with the indexes and full-text index, about 25 ms of write lock)
+PURGE_BATCH = 500
+
+_SEGMENT_SCHEMA = [
+    '''CREATE TABLE segment.transactions (
+        id INTEGER PRIMARY KEY,
+        spot INTEGER,
+        plate TEXT,
+        time_in TEXT,
+        time_out TEXT,
+        amount REAL,
+        paid INTEGER,
+        comments TEXT DEFAULT '',
+        created_at TIMESTAMP
+    )''',
+    'CREATE INDEX segment.idx_transactions_plate ON transactions (plate COLLATE NOCASE)',
+    'CREATE INDEX segment.idx_transactions_spot ON transactions (spot)',
+    'CREATE INDEX segment.idx_transactions_day ON transactions (substr(time_out, 1, 10))',
+    'CREATE INDEX segment.idx_transactions_paid ON transactions (paid)',
+]
+
+_local = threading.local()
+
+
+def create_catalog(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS archive_months (
+        month TEXT PRIMARY KEY,
+        path TEXT NOT NULL,
+        state TEXT NOT NULL DEFAULT 'closing',
+        rows INTEGER NOT NULL DEFAULT 0,
+        min_id INTEGER,
+        max_id INTEGER,
+        purged_upto INTEGER NOT NULL DEFAULT 0,
+        closed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''')
+
+
+def archive_dir(db_path):
+    """Where the segment files of db_path go: carpark.db -> carpark-archive/."""
+    return os.path.splitext(os.path.abspath(db_path))[0] + '-archive'
+
+
+class Segment:
+    """An archived month: its file, the ids it holds and how many of them
+    have left the live table (those up to purged_upto)."""
+
+    def __init__(self, month, path, min_id, max_id, purged_upto):
+        self.month = month
+        self.path = path
+        self.min_id = min_id
+        self.max_id = max_id
+        self.purged_upto = purged_upto
+
+    def execute(self, sql, params=(), by_id=True):
+        """Rows of sql against the month's file.
+
+        With by_id the rows start with the id, and those still in the live
+        table (a close in progress) are left out.
+        """
+        conn = _open(self.path)
+        if conn is None:
+            # dropped since the catalog was read
+            return []
+        rows = conn.execute(sql, params).fetchall()
+        if by_id and self.purged_upto < self.max_id:
+            rows = [row for row in rows if row[0] <= self.purged_upto]
+        return rows
+
+
+def _open(path):
+    """This thread's read-only connection to a segment file, or None once it is gone."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    cache = _local.__dict__.setdefault('segments', {})
+    # a month dropped and closed again is a new file under the same name
+    ident = (stat.st_ino, stat.st_mtime_ns)
+    cached = cache.get(path)
+    if cached is not None:
+        if cached[0] == ident:
+            return cached[1]
+        cached[1].close()
+    conn = sqlite3.connect(f'file:{quote(path)}?mode=ro&immutable=1', uri=True, check_same_thread=False)
+    cache[path] = (ident, conn)
+    return conn
+
+
+def segments(conn):
+    """The archived months of conn's database whose rows have (partly) left
+    the live table, oldest first; [] for a file without a catalog."""
+    try:
+        rows = conn.execute('SELECT month, path, min_id, max_id, purged_upto FROM archive_months '
+                            "WHERE state = 'archived' AND purged_upto > 0 ORDER BY month").fetchall()
+    except sqlite3.OperationalError:
+        return []
+    if not rows:
+        return []
+    base = os.path.dirname(next(file for _, name, file in conn.execute('PRAGMA database_list') if name == 'main'))
+    return [Segment(month, os.path.join(base, path), min_id, max_id, purged_upto)
+            for month, path, min_id, max_id, purged_upto in rows]
+
+
+def select(conn, sql, params=(), *, key=None, reverse=False, limit=None, keep=None, bounds=None):
+    """Rows of sql over the live table on conn and every archived month, as one list.
+
+    sql is a query on `transactions` whose rows start with the id; the same
+    text runs against each month's file. The catalog and the live rows are
+    read in one transaction, so each row is seen once even while a month
+    is being moved out. keep(segment) is False for months that cannot
+    match. With key the rows are merged in key order (descending with
+    reverse) and cut to limit, so sql must order and limit each partition
+    the same way; bounds(segment) -> (lowest, highest) key in the month
+    then leaves unopened the months that cannot reach the first limit rows.
+    """
+    began = not conn.in_transaction
+    if began:
+        conn.execute('BEGIN')
+    try:
+        rows = conn.execute(sql, params).fetchall()
+        months = segments(conn)
+    finally:
+        if began:
+            conn.execute('COMMIT')
+    months = [s for s in months if keep is None or keep(s)]
+    if not months:
+        return rows
+    if key is None:
+        for segment in months:
+            rows += segment.execute(sql, params)
+        return rows
+    if bounds is not None:
+        months.sort(key=lambda s: bounds(s)[1 if reverse else 0], reverse=reverse)
+    rows.sort(key=key, reverse=reverse)
+    for segment in months:
+        if bounds is not None and limit is not None and len(rows) >= limit:
+            last = key(rows[limit - 1])
+            lowest, highest = bounds(segment)
+            if (highest <= last) if reverse else (lowest >= last):
+                break
+        rows += segment.execute(sql, params)
+        rows.sort(key=key, reverse=reverse)
+        if limit is not None:
+            del rows[limit:]
+    return rows
+
+
+def iter_rows(conn, sql, params=(), by_id=True):
+    """Yield the rows of sql from the live table, then from each archived month.
+
+    Streams, for loading whole-history indexes; see select() for sql. With
+    by_id=False (rows not starting with the id) rows still in the live
+    table may come twice, which suits DISTINCT lookups only.
+    """
+    began = not conn.in_transaction
+    if began:
+        conn.execute('BEGIN')
+    try:
+        months = segments(conn)
+        yield from conn.execute(sql, params)
+    finally:
+        if began:
+            conn.execute('COMMIT')
+    for segment in months:
+        yield from segment.execute(sql, params, by_id=by_id)
+
+
+def id_bounds(segment):
+    return segment.min_id, min(segment.max_id, segment.purged_upto)
+
+
+def day_bounds(segment):
+    """Bounds of the (time_out date, id) key, see CarPark.page_transactions."""
+    return (segment.month + '-00', 0), (segment.month + '-32', 0)
+
+
+def matching(day=None, date_from=None, date_to=None, before_id=None, after_id=None):
+    """keep() for select(): the months a query_transactions filter can match."""
+    def keep(segment):
+        if day is not None and day[:7] != segment.month:
+            return False
+        if date_from is not None and segment.month < date_from[:7]:
+            return False
+        if date_to is not None and segment.month > date_to[:7]:
+            return False
+        if before_id is not None and segment.min_id >= before_id:
+            return False
+        if after_id is not None and min(segment.max_id, segment.purged_upto) <= after_id:
+            return False
+        return True
+    return keep
+
+
+def is_closed(conn, time_out):
+    """Whether the month of time_out is archived, making its transactions read-only."""
+    if not time_out:
+        return False
+    try:
+        return conn.execute('SELECT 1 FROM archive_months WHERE month = ?', (time_out[:7],)).fetchone() is not None
+    except sqlite3.OperationalError:
+        return False
+
+
+def writable_ids(conn, id_list):
+    """The ids in id_list (a JSON array) of live transactions outside archived months."""
+    return [tx_id for (tx_id,) in conn.execute(
+        'SELECT id FROM transactions WHERE id IN (SELECT value FROM json_each(?)) '
+        "AND COALESCE(substr(time_out, 1, 7), '') NOT IN (SELECT month FROM archive_months) ORDER BY id",
+        (id_list,))]
+
+
+def _write(conn, sql, params=()):
+    """One statement in its own write transaction; returns the row count."""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        count = conn.execute(sql, params).rowcount
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
+    return count
+
+
+def close_months(db_path, before=None, batch_size=PURGE_BATCH):
+    """Move the transactions of every month before `before` to segment files.
+
+    before is 'YYYY-MM', by default the current month (local time), so
+    every finished month is closed. Open transactions are not touched.
+    Returns the months closed, including one an earlier run left half done.
+    """
+    before = before or datetime.now().astimezone().strftime('%Y-%m')
+    conn = db.connect(db_path)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        create_catalog(conn)
+        conn.execute('COMMIT')
+        months = [month for (month,) in conn.execute(
+            "SELECT month FROM archive_months WHERE state = 'closing' OR purged_upto < max_id ORDER BY month")]
+        months += [month for (month,) in conn.execute(
+            'SELECT DISTINCT substr(time_out, 1, 7) FROM transactions '
+            "WHERE substr(time_out, 1, 10) < ? AND time_out GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-*' "
+            'AND substr(time_out, 1, 7) NOT IN (SELECT month FROM archive_months) ORDER BY 1',
+            (before + '-01',))]
+        for month in months:
+            _close(conn, db_path, month, batch_size)
+        return months
+    finally:
+        conn.close()
+
+
+def _close(conn, db_path, month, batch_size):
+    base = os.path.dirname(os.path.abspath(db_path))
+    relative = os.path.relpath(os.path.join(archive_dir(db_path), month + '.db'), base)
+    # from this commit on the month's transactions are read-only
+    _write(conn, 'INSERT OR IGNORE INTO archive_months (month, path) VALUES (?, ?)', (month, relative))
+    state, relative = conn.execute('SELECT state, path FROM archive_months WHERE month = ?', (month,)).fetchone()
+    path = os.path.join(base, relative)
+    if state == 'closing':
+        rows, min_id, max_id = _write_segment(conn, month, path)
+        _write(conn, "UPDATE archive_months SET state = 'archived', rows = ?, min_id = ?, max_id = ? "
+               'WHERE month = ?', (rows, min_id or 0, max_id or 0, month))
+    _purge(conn, month, path, batch_size)
+
+
+def _write_segment(conn, month, path):
+    """Copy the month's live rows to a new segment file at path; returns (rows, min_id, max_id)."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    conn.execute('ATTACH ? AS segment', (tmp,))
+    try:
+        # a scratch file until renamed: no journal, one fsync at the end
+        conn.execute('PRAGMA segment.journal_mode = OFF')
+        conn.execute('PRAGMA segment.synchronous = OFF')
+        conn.execute('BEGIN')
+        for statement in _SEGMENT_SCHEMA:
+            conn.execute(statement)
+        conn.execute('INSERT INTO segment.transactions '
+                     'SELECT id, spot, plate, time_in, time_out, amount, paid, comments, created_at '
+                     'FROM main.transactions WHERE substr(time_out, 1, 10) BETWEEN ? AND ? ORDER BY id',
+                     (month + '-00', month + '-99'))
+        try:
+            conn.execute("CREATE VIRTUAL TABLE segment.transactions_fts USING fts5("
+                         "plate, comments, content='transactions', content_rowid='id', "
+                         "tokenize='unicode61 remove_diacritics 2')")
+            conn.execute("INSERT INTO segment.transactions_fts (transactions_fts) VALUES ('rebuild')")
+        except sqlite3.OperationalError:
+            # SQLite without FTS5: searches scan instead
+            pass
+        conn.execute('COMMIT')
+        counts = conn.execute('SELECT COUNT(*), MIN(id), MAX(id) FROM segment.transactions').fetchone()
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        conn.execute('DETACH segment')
+        os.remove(tmp)
+        raise
+    conn.execute('DETACH segment')
+    fd = os.open(tmp, os.O_RDWR)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    os.replace(tmp, path)
+    return counts
+
+
+def _purge(conn, month, path, batch_size):
+    """Delete the segment's rows from the live table, batch_size per transaction."""
+    segment = sqlite3.connect(f'file:{quote(path)}?mode=ro', uri=True)
+    try:
+        while True:
+            row = conn.execute('SELECT purged_upto FROM archive_months WHERE month = ?', (month,)).fetchone()
+            if row is None:
+                return
+            ids = [tx_id for (tx_id,) in segment.execute(
+                'SELECT id FROM transactions WHERE id > ? ORDER BY id LIMIT ?', (row[0], batch_size))]
+            if not ids:
+                return
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                moved = conn.execute('UPDATE archive_months SET purged_upto = ? WHERE month = ? AND purged_upto = ?',
+                                     (ids[-1], month, row[0])).rowcount
+                if moved:
+                    conn.execute('DELETE FROM transactions WHERE id IN (SELECT value FROM json_each(?))',
+                                 (json.dumps(ids),))
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+            if not moved:
+                # the catalog was reset, or another run got there first
+                return
+            # copy the deleted pages into the database file here, rather than
+            # in whichever gate commit next takes the WAL past 1000 pages
+            conn.execute('PRAGMA wal_checkpoint(PASSIVE)').fetchone()
+    finally:
+        segment.close()
+
+
+def remove_unlisted(db_path):
+    """Delete the month files of db_path's archive folder that its catalog
+    no longer lists (a park state written over the database drops them);
+    returns their names. Temporary files of a close in progress are kept:
+    a month is in the catalog before its file is written."""
+    folder = archive_dir(db_path)
+    try:
+        names = os.listdir(folder)
+    except FileNotFoundError:
+        return []
+    conn = db.connect(db_path)
+    try:
+        try:
+            listed = {os.path.normpath(path) for (path,) in conn.execute('SELECT path FROM archive_months')}
+        except sqlite3.OperationalError:
+            listed = set()
+    finally:
+        conn.close()
+    base = os.path.dirname(os.path.abspath(db_path))
+    removed = []
+    for name in sorted(names):
+        if not name.endswith('.db') or os.path.relpath(os.path.join(folder, name), base) in listed:
+            continue
+        try:
+            os.remove(os.path.join(folder, name))
+        except FileNotFoundError:
+            pass
+        removed.append(name)
+    return removed
+
+
+def drop_months(db_path, before):
+    """Delete the archived months before `before` ('YYYY-MM'); returns them.
+
+    Each month is one small write transaction (its catalog row), then its
+    file is removed: the live table is not touched. Their transactions are
+    gone from history queries; the report rollups keep their totals.
+    """
+    conn = db.connect(db_path)
+    try:
+        try:
+            months = conn.execute("SELECT month, path FROM archive_months WHERE state = 'archived' "
+                                  'AND purged_upto >= max_id AND month < ? ORDER BY month', (before,)).fetchall()
+        except sqlite3.OperationalError:
+            return []
+        base = os.path.dirname(os.path.abspath(db_path))
+        dropped = []
+        for month, path in months:
+            if _write(conn, 'DELETE FROM archive_months WHERE month = ?', (month,)):
+                try:
+                    os.remove(os.path.join(base, path))
+                except FileNotFoundError:
+                    pass
+                dropped.append(month)
+        return dropped
+    finally:
+        conn.close()
@@ -0,0 +1,279 @@
+"""Online backups and maintenance of the live database, in small steps.
+
+backup() copies a database with SQLite's online backup API while the
+gates keep writing: BACKUP_PAGES pages per step and BACKUP_SLEEP seconds
+between steps, each step holding only a read lock. The copy reads one
+snapshot throughout (a read transaction stays open on the source, which
+in WAL mode blocks nobody), so commits made meanwhile neither restart it
+nor end up half in it. Each backup is a folder of backup_dir named after
+the database and the time, holding the copy, its archived months (see
+archive.py; hard links, they are never written) and nothing else until it
+is complete: it is written as <name>.tmp and renamed. The newest
+BACKUP_KEEP backups are kept.
+
+maintain() is the nightly maintenance window: a sampled ANALYZE and
+PRAGMA optimize for the query planner, then free pages given back to the
+file system VACUUM_PAGES per write transaction (incremental auto-vacuum,
+which new databases use, see db.py). A file created before that is
+VACUUMed once, in the window, when a quarter of it is free, which also
+switches it to incremental auto-vacuum.
+
+Scheduler runs both once a day at set local times from a daemon thread;
+the web app and the GUI each start one (several processes may share a
+database: a run is claimed in the database first, so only one does it).
+"""
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+import archive
+import db
+
+# pages copied per backup step, and the pause between steps
+BACKUP_PAGES = 256
+BACKUP_SLEEP = 0.005
+# backups kept per database; older ones are deleted after a new one is done
+BACKUP_KEEP = 7
+# free pages released per write transaction in maintain()
+VACUUM_PAGES = 256
+# a database without incremental auto-vacuum gets one full VACUUM when this
+# much of it is free pages
+VACUUM_FREE_FRACTION = 0.25
+# rows ANALYZE samples per index (PRAGMA analysis_limit)
+ANALYSIS_LIMIT = 1000
+# how long after its time of day a scheduled job may still start
+WINDOW_MINUTES = 60
+
+
+def backup(db_path, backup_dir, pages=BACKUP_PAGES, sleep=BACKUP_SLEEP, keep=BACKUP_KEEP):
+    """Copy db_path, with its archived months, into a new folder of backup_dir.
+
+    Returns the path of the copied database. Raises sqlite3.DatabaseError
+    if the copy fails its integrity check (nothing is kept then).
+    """
+    db_path = os.path.abspath(db_path)
+    name = os.path.basename(db_path)
+    stem = os.path.splitext(name)[0]
+    target = os.path.join(backup_dir, f"{stem}-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}")
+    tmp = target + '.tmp'
+    if os.path.exists(tmp):
+        shutil.rmtree(tmp)
+    os.makedirs(tmp)
+    try:
+        source = sqlite3.connect(db_path, timeout=db.BUSY_TIMEOUT_SECONDS, isolation_level=None)
+        try:
+            # the snapshot every step reads (and the archive catalog of it)
+            source.execute('BEGIN')
+            source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+            copy = sqlite3.connect(os.path.join(tmp, name))
+            try:
+                # sqlite3's own sleep argument only applies to busy retries
+                source.backup(copy, pages=pages, progress=lambda status, remaining, total: time.sleep(sleep))
+                check = copy.execute('PRAGMA quick_check').fetchone()[0]
+            finally:
+                copy.close()
+            if check != 'ok':
+                raise sqlite3.DatabaseError(f'backup of {db_path} failed its integrity check: {check}')
+            try:
+                months = [path for (path,) in source.execute(
+                    "SELECT path FROM archive_months WHERE state = 'archived'")]
+            except sqlite3.OperationalError:
+                months = []
+            source.execute('COMMIT')
+        finally:
+            source.close()
+        for path in months:
+            _link(os.path.join(os.path.dirname(db_path), path), os.path.join(tmp, path))
+        _fsync(os.path.join(tmp, name))
+        os.rename(tmp, target)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    for old in list_backups(db_path, backup_dir)[:-keep or None]:
+        shutil.rmtree(old, ignore_errors=True)
+    return os.path.join(target, name)
+
+
+def list_backups(db_path, backup_dir):
+    """The complete backup folders of db_path in backup_dir, oldest first."""
+    stem = os.path.splitext(os.path.basename(db_path))[0]
+    try:
+        names = os.listdir(backup_dir)
+    except FileNotFoundError:
+        return []
+    # stem-YYYYmmdd-HHMMSS-ffffff: the names sort by time
+    return [os.path.join(backup_dir, n) for n in sorted(names)
+            if n.startswith(stem + '-') and len(n) == len(stem) + 23 and not n.endswith('.tmp')]
+
+
+def _link(source, target):
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    try:
+        os.link(source, target)
+    except FileNotFoundError:
+        # dropped since the catalog was read
+        pass
+    except OSError:
+        # another file system, or no hard links
+        shutil.copy2(source, target)
+
+
+def _fsync(path):
+    fd = os.open(path, os.O_RDWR)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def maintain(db_path, pages=VACUUM_PAGES, sleep=BACKUP_SLEEP):
+    """Refresh the planner statistics and give free pages back, in short steps.
+
+    Returns the number of pages freed.
+    """
+    conn = db.connect(db_path)
+    try:
+        conn.execute(f'PRAGMA analysis_limit = {ANALYSIS_LIMIT}')
+        conn.execute('ANALYZE')
+        conn.execute('PRAGMA optimize')
+        page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+        free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            if not page_count or free / page_count < VACUUM_FREE_FRACTION:
+                return 0
+            # holds the write lock throughout: once per file, in the window
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            conn.execute('VACUUM')
+            return free
+        freed = 0
+        while freed < free:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.execute(f'PRAGMA incremental_vacuum({int(pages)})').fetchall()
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+            freed += pages
+            time.sleep(sleep)
+        conn.execute('PRAGMA wal_checkpoint(PASSIVE)').fetchone()
+        return free
+    finally:
+        conn.close()
+
+
+def _claim(db_path, job, day):
+    """True for the one caller, of any process, that gets to run job on day."""
+    conn = db.connect(db_path)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('''CREATE TABLE IF NOT EXISTS maintenance_runs (
+                job TEXT NOT NULL,
+                day TEXT NOT NULL,
+                started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (job, day)
+            )''')
+            claimed = conn.execute('INSERT OR IGNORE INTO maintenance_runs (job, day) VALUES (?, ?)',
+                                   (job, day)).rowcount == 1
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        return claimed
+    finally:
+        conn.close()
+
+
+class Scheduler:
+    """Runs the backup and maintenance of a database once a day each.
+
+    backup_at and maintain_at are local times 'HH:MM' (None to skip the
+    job; no backup without a backup_dir), each starting a window of
+    WINDOW_MINUTES. The thread wakes every poll_seconds. last holds
+    job -> (finished at, result or exception).
+    """
+
+    def __init__(self, db_path, backup_dir=None, backup_at='02:30', maintain_at='03:30', poll_seconds=60):
+        self.db_path = os.path.abspath(db_path)
+        self.backup_dir = backup_dir
+        self.times = {'backup': backup_at if backup_dir else None, 'maintain': maintain_at}
+        self.poll_seconds = poll_seconds
+        self.last = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self._running = threading.Lock()
+        self._starting = threading.Lock()
+
+    def start(self):
+        """Start the thread, once (cheap to call again, from any thread)."""
+        if self._thread is None:
+            with self._starting:
+                if self._thread is None and not self._stop.is_set():
+                    thread = threading.Thread(target=self._loop, name='carpark-scheduler', daemon=True)
+                    thread.start()
+                    self._thread = thread
+        return self
+
+    def stop(self):
+        self._stop.set()
+        with self._starting:
+            if self._thread is not None:
+                self._thread.join()
+                self._thread = None
+
+    def _loop(self):
+        while not self._stop.wait(self.poll_seconds):
+            try:
+                self.tick()
+            except Exception as e:
+                # e.g. the database locked past the busy timeout: next poll
+                print(f'scheduler of {self.db_path}: {e}')
+
+    def tick(self, now=None):
+        """Run the jobs inside their window today that nobody has run yet."""
+        now = now or datetime.now()
+        for job, at in self.times.items():
+            if at is None:
+                continue
+            start = datetime.combine(now.date(), datetime.strptime(at, '%H:%M').time())
+            # a window missed (process down) waits for the next day
+            if start <= now < start + timedelta(minutes=WINDOW_MINUTES) \
+                    and _claim(self.db_path, job, now.date().isoformat()):
+                try:
+                    self.run(job)
+                except Exception:
+                    # reported in run(); the next job still runs
+                    pass
+
+    def run(self, job):
+        """Run job ('backup' or 'maintain') now, in this thread; returns its result."""
+        # one job at a time: a backup and a VACUUM would only slow each other
+        with self._running:
+            try:
+                if job == 'backup':
+                    result = backup(self.db_path, self.backup_dir)
+                else:
+                    result = maintain(self.db_path)
+            except Exception as e:
+                self.last[job] = (datetime.now(), e)
+                print(f'{job} of {self.db_path} failed: {e}')
+                raise
+            self.last[job] = (datetime.now(), result)
+            return result
+
+    def run_in_background(self, job, done=None):
+        """Start job in a new thread; done(result or exception) is called there when it ends."""
+        def target():
+            try:
+                result = self.run(job)
+            except Exception as e:
+                result = e
+            if done is not None:
+                done(result)
+        thread = threading.Thread(target=target, name=f'carpark-{job}', daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,155 @@
+"""analytics.py aggregates against Python loops, on ROWS transactions.
+
+The history is synthetic: two years, 300 spots, local times at +01:00.
+Three ways to get the four aggregates are compared, and their results
+are checked to be identical:
+
+  - dict loop: one pass over transaction dicts with ISO timestamps, the
+    way CarPark.transactions is read today. The dicts are built in
+    chunks, and only the loop over them is timed;
+  - fallback: analytics.py over array.array columns (no NumPy);
+  - numpy: analytics.py over NumPy columns.
+
+Loading from SQLite is timed separately, on a smaller file.
+
+    python benchmarks/bench_analytics.py [rows]
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from array import array
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analytics  # noqa: E402
+from analytics import HOURS_PER_WEEK, np  # noqa: E402
+
+ROWS = 5_000_000
+CHUNK = 100_000
+LOAD_ROWS = 500_000
+SPOTS = 300
+AGGREGATES = ('dwell_histogram', 'revenue_per_spot', 'hour_of_week_profile', 'utilization_heatmap')
+
+
+def synthetic(rows):
+    rng = np.random.default_rng(1)
+    wall_in = np.sort(rng.integers(1_700_000_000, 1_700_000_000 + 2 * 365 * 86400, rows))
+    dwell = rng.exponential(2.5 * 3600, rows).astype(np.int64)
+    columns = {
+        'spot': rng.integers(1, SPOTS + 1, rows).astype(np.int32),
+        'plate': rng.integers(0, rows // 10, rows).astype(np.int32),
+        'time_in': wall_in - 3600,
+        'time_out': wall_in + dwell - 3600,
+        'wall_in': wall_in,
+        'wall_out': wall_in + dwell,
+        'cents': (dwell // 1800 * 100).astype(np.int64),
+    }
+    plates = [f'P{i}' for i in range(rows // 10)]
+    vectorized = analytics.Columns(plates, columns)
+    looped = analytics.Columns(plates, {name: array(values.dtype.char if name in ('spot', 'plate') else 'q',
+                                                    values.tobytes())
+                                        for name, values in columns.items()})
+    return vectorized, looped
+
+
+def dict_chunks(cols):
+    offset = timezone(timedelta(hours=1))
+    for lo in range(0, len(cols), CHUNK):
+        hi = lo + CHUNK
+        yield [{'spot': spot, 'plate': cols.plates[plate],
+                'time_in': datetime.fromtimestamp(time_in, offset).isoformat(),
+                'time_out': datetime.fromtimestamp(time_out, offset).isoformat(),
+                'amount': cents / 100, 'paid': False, 'comments': ''}
+               for spot, plate, time_in, time_out, cents in zip(
+                   cols.spot[lo:hi].tolist(), cols.plate[lo:hi].tolist(), cols.time_in[lo:hi].tolist(),
+                   cols.time_out[lo:hi].tolist(), cols.cents[lo:hi].tolist())]
+
+
+def dict_loop(chunks):
+    """The four aggregates in one pass over dicts; returns (seconds spent, results)."""
+    second, hour = timedelta(seconds=1), timedelta(hours=1)
+    dwell = [0] * 97
+    per_spot = {}
+    profile = {key: [0] * HOURS_PER_WEEK for key in ('arrivals', 'departures', 'cents')}
+    occupied = [0] * HOURS_PER_WEEK
+    elapsed = 0.0
+    for chunk in chunks:
+        start = time.perf_counter()
+        for tx in chunk:
+            t_in, t_out = datetime.fromisoformat(tx['time_in']), datetime.fromisoformat(tx['time_out'])
+            cents = int(round(tx['amount'] * 100))
+            dwell[min(max(int((t_out - t_in).total_seconds()), 0) // 900, 96)] += 1
+            per_spot[tx['spot']] = per_spot.get(tx['spot'], 0) + cents
+            w_in, w_out = t_in.replace(tzinfo=None), max(t_out.replace(tzinfo=None), t_in.replace(tzinfo=None))
+            profile['arrivals'][w_in.weekday() * 24 + w_in.hour] += 1
+            profile['departures'][w_out.weekday() * 24 + w_out.hour] += 1
+            profile['cents'][w_out.weekday() * 24 + w_out.hour] += cents
+            # hour by hour through the stay
+            t = w_in
+            while t < w_out:
+                edge = min(t.replace(minute=0, second=0, microsecond=0) + hour, w_out)
+                occupied[t.weekday() * 24 + t.hour] += (edge - t) // second
+                t = edge
+        elapsed += time.perf_counter() - start
+    heatmap = [[0.0] * 24 for _ in range(7)]
+    for how in range(HOURS_PER_WEEK):
+        heatmap[how // 24][how % 24] = round(occupied[how] / 3600, 4)
+    results = {'dwell_histogram': dwell, 'revenue_per_spot': dict(sorted(per_spot.items())),
+               'hour_of_week_profile': profile, 'utilization_heatmap': heatmap}
+    return elapsed, results
+
+
+def timed(fn, cols):
+    start = time.perf_counter()
+    result = fn(cols)
+    return time.perf_counter() - start, result
+
+
+def bench_load():
+    db_path = os.path.join(tempfile.mkdtemp(), 'analytics.db')
+    conn = sqlite3.connect(db_path)
+    conn.execute('CREATE TABLE transactions (id INTEGER PRIMARY KEY, spot INTEGER, plate TEXT, time_in TEXT, '
+                 'time_out TEXT, amount REAL, paid INTEGER, comments TEXT)')
+    conn.execute("WITH RECURSIVE n(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM n WHERE i < ?) "
+                 "INSERT INTO transactions (spot, plate, time_in, time_out, amount, paid, comments) "
+                 "SELECT i % 300 + 1, 'P' || (i % 50000), "
+                 "strftime('%Y-%m-%dT%H:%M:%S+01:00', 1700000000 + i * 60, 'unixepoch'), "
+                 "strftime('%Y-%m-%dT%H:%M:%S+01:00', 1700000000 + i * 60 + 5400, 'unixepoch'), 3.0, 0, '' FROM n",
+                 (LOAD_ROWS - 1,))
+    conn.commit()
+    conn.close()
+    for use_numpy in (True, False):
+        start = time.perf_counter()
+        cols = analytics.load(db_path, use_numpy=use_numpy)
+        label = 'numpy' if use_numpy else 'array'
+        print(f'load {len(cols):,} rows ({label}): {time.perf_counter() - start:6.2f} s')
+
+
+def main():
+    if np is None:
+        sys.exit('NumPy is not installed')
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else ROWS
+    vectorized, looped = synthetic(rows)
+    print(f'{rows:,} transactions')
+    totals = {'numpy': 0.0, 'fallback': 0.0}
+    expected = {}
+    for name in AGGREGATES:
+        fn = getattr(analytics, name)
+        fast, expected[name] = timed(fn, vectorized)
+        slow, result = timed(fn, looped)
+        assert result == expected[name], name
+        totals['numpy'] += fast
+        totals['fallback'] += slow
+        print(f'{name:>22}: numpy {fast * 1000:8.1f} ms   fallback {slow:7.2f} s   {slow / fast:6.0f}x')
+    baseline, results = dict_loop(dict_chunks(vectorized))
+    assert results == expected
+    print(f'{"all four":>22}: numpy {totals["numpy"]:8.2f} s    fallback {totals["fallback"]:7.2f} s   '
+          f'dict loop {baseline:7.2f} s   {baseline / totals["numpy"]:6.0f}x')
+    bench_load()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Month-end close: gate latency while months move out, queries across partitions.
+
+A database of MONTHS finished months (ROWS_PER_MONTH rows each) plus the
+current one is closed with close_months() while a gate thread parks and
+removes cars on the same park; the slowest gate operation shows how long
+the close held the write lock. History queries are timed before and after
+(newest page, a date range in an archived month, a lookup by id) and the
+size of the live database file is shown.
+
+    python benchmarks/bench_archive.py
+"""
+import contextlib
+import io
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from practice import CarPark  # noqa: E402
+
+MONTHS = 12
+ROWS_PER_MONTH = 50_000
+ROUNDS = 20
+
+
+def seed(db_path):
+    CarPark(300).attach_db(db_path)
+    conn = sqlite3.connect(db_path)
+    seconds = 28 * 86400 // ROWS_PER_MONTH
+    for month in range(1, MONTHS + 1):
+        first = int(datetime(2024, month, 1, tzinfo=timezone.utc).timestamp())
+        conn.execute("WITH RECURSIVE n(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM n WHERE i < ?) "
+                     "INSERT INTO transactions (spot, plate, time_in, time_out, amount, paid, comments) "
+                     "SELECT i % 300 + 1, 'P' || (i % 50000), "
+                     "strftime('%Y-%m-%dT%H:%M:%S+07:00', ? + i * ?, 'unixepoch'), "
+                     "strftime('%Y-%m-%dT%H:%M:%S+07:00', ? + i * ? + 5400, 'unixepoch'), 3.0, i % 2, '' FROM n",
+                     (ROWS_PER_MONTH - 1, first, seconds, first, seconds))
+    conn.commit()
+    conn.execute('VACUUM')
+    conn.close()
+
+
+def best(fn):
+    times = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1e3
+
+
+def queries(park):
+    return {
+        'newest page': best(lambda: park.page_transactions(limit=50)),
+        'day range': best(lambda: park.query_transactions(date_from='2024-03-10', date_to='2024-03-11')),
+        'by id': best(lambda: park.get_transaction(ROWS_PER_MONTH * 2 + 17)),
+    }
+
+
+def main():
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    seed(db_path)
+    park = CarPark.load_from_db(db_path, write_through=True, history_limit=1000)
+    size_before = os.path.getsize(db_path)
+    before = queries(park)
+
+    latencies = []
+    stop = threading.Event()
+
+    def gate():
+        with contextlib.redirect_stdout(io.StringIO()):
+            while not stop.is_set():
+                start = time.perf_counter()
+                park.remove_car(park.park_car('GATE'))
+                latencies.append(time.perf_counter() - start)
+
+    thread = threading.Thread(target=gate)
+    thread.start()
+    start = time.perf_counter()
+    months = park.close_months('2025-01')
+    elapsed = time.perf_counter() - start
+    stop.set()
+    thread.join()
+
+    sqlite3.connect(db_path).execute('VACUUM').connection.close()
+    after = queries(park)
+    latencies.sort()
+    print(f'closed {len(months)} months of {ROWS_PER_MONTH} rows in {elapsed:.1f} s')
+    print(f'gate operations meanwhile: {len(latencies)}, median {latencies[len(latencies) // 2] * 1e3:.1f} ms, '
+          f'max {latencies[-1] * 1e3:.1f} ms')
+    print(f'live database: {size_before / 1e6:.1f} MB -> {os.path.getsize(db_path) / 1e6:.1f} MB (vacuumed)')
+    print()
+    print(f"{'query':>12}  {'before ms':>9}  {'after ms':>8}")
+    for name in before:
+        print(f'{name:>12}  {before[name]:>9.2f}  {after[name]:>8.2f}')
+    park.detach_db()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""Gate latency while the database is backed up or maintained.
+
+A gate thread parks and removes cars on a park of ROWS transactions while,
+in turn: nothing runs; backup() copies the database in steps; the same
+copy runs as one backup step; maintain() frees the pages left by deleting
+half the rows (incremental vacuum), and a full VACUUM does the same.
+
+    python benchmarks/bench_backup.py
+"""
+import contextlib
+import io
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import backup  # noqa: E402
+from practice import CarPark  # noqa: E402
+
+ROWS = 500_000
+
+
+def seed(db_path):
+    CarPark(300).attach_db(db_path)
+    conn = sqlite3.connect(db_path)
+    conn.execute("WITH RECURSIVE n(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM n WHERE i < ?) "
+                 "INSERT INTO transactions (spot, plate, time_in, time_out, amount, paid, comments) "
+                 "SELECT i % 300 + 1, 'P' || (i % 50000), "
+                 "strftime('%Y-%m-%dT%H:%M:%S+07:00', 1700000000 + i * 60, 'unixepoch'), "
+                 "strftime('%Y-%m-%dT%H:%M:%S+07:00', 1700000000 + i * 60 + 5400, 'unixepoch'), "
+                 "3.0, i % 2, '' FROM n", (ROWS - 1,))
+    conn.commit()
+    conn.close()
+
+
+def free_half(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute('DELETE FROM transactions WHERE id % 2 = 0')
+    conn.commit()
+    conn.close()
+
+
+def under_gates(park, job):
+    """(job seconds, gate ops, median ms, p99 ms, max ms) with a gate thread running meanwhile."""
+    latencies = []
+    stop = threading.Event()
+
+    def gate():
+        with contextlib.redirect_stdout(io.StringIO()):
+            while not stop.is_set():
+                start = time.perf_counter()
+                park.remove_car(park.park_car('GATE'))
+                latencies.append(time.perf_counter() - start)
+
+    thread = threading.Thread(target=gate)
+    thread.start()
+    start = time.perf_counter()
+    job()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    thread.join()
+    latencies.sort()
+    n = len(latencies)
+    return elapsed, n, latencies[n // 2] * 1e3, latencies[int(n * 0.99)] * 1e3, latencies[-1] * 1e3
+
+
+def one_step(db_path, target):
+    source = sqlite3.connect(db_path)
+    copy = sqlite3.connect(target)
+    source.backup(copy)
+    copy.close()
+    source.close()
+
+
+def main():
+    tmp = tempfile.mkdtemp()
+    db_path = os.path.join(tmp, 'bench.db')
+    seed(db_path)
+    park = CarPark.load_from_db(db_path, write_through=True, history_limit=1000)
+    print(f'{ROWS} rows, {os.path.getsize(db_path) / 1e6:.0f} MB')
+    print(f"{'while':>24}  {'job s':>6}  {'gate ops':>8}  {'median ms':>9}  {'p99 ms':>6}  {'max ms':>6}")
+    jobs = [
+        ('nothing', None, lambda: time.sleep(1)),
+        ('backup() in steps', None, lambda: backup.backup(db_path, os.path.join(tmp, 'backups'))),
+        ('backup in one step', None, lambda: one_step(db_path, os.path.join(tmp, 'one.db'))),
+        ('maintain()', free_half, lambda: backup.maintain(db_path)),
+        ('full VACUUM', free_half, lambda: sqlite3.connect(db_path).execute('VACUUM')),
+    ]
+    for name, setup, job in jobs:
+        if setup is not None:
+            setup(db_path)
+        print('{:>24}  {:>6.2f}  {:>8}  {:>9.2f}  {:>6.1f}  {:>6.1f}'.format(name, *under_gates(park, job)))
+    park.detach_db()
+
+
+if __name__ == '__main__':
+    main()
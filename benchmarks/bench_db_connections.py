@@ -0,0 +1,116 @@
+"""Per-request SQLite cost: fresh rollback-journal connections vs db.connection.
+
+1. One thread: open, query, close per request (the old UserManager way)
+   against reusing the pooled connection.
+2. Readers in several processes page through history while one process
+   keeps committing, once with the rollback journal and once in WAL mode.
+
+    python benchmarks/bench_db_connections.py
+"""
+import contextlib
+import io
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+from practice import CarPark  # noqa: E402
+
+REQUESTS = 5000
+DURATION = 2.0
+READERS = 3
+QUERY = 'SELECT id, plate, amount FROM transactions ORDER BY id DESC LIMIT 50'
+
+
+def make_db(journal_mode):
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    park = CarPark(50)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(2000):
+            park.park_car(f'P{i}')
+            park.remove_car(1)
+    park.save_to_db(db_path)
+    db.close_all()
+    conn = sqlite3.connect(db_path)
+    conn.execute(f'PRAGMA journal_mode={journal_mode}')
+    conn.close()
+    return db_path
+
+
+def per_request(db_path):
+    start = time.perf_counter()
+    for _ in range(REQUESTS):
+        conn = sqlite3.connect(db_path)
+        conn.execute(QUERY).fetchall()
+        conn.close()
+    fresh = (time.perf_counter() - start) / REQUESTS
+    start = time.perf_counter()
+    for _ in range(REQUESTS):
+        db.connection(db_path).execute(QUERY).fetchall()
+    pooled = (time.perf_counter() - start) / REQUESTS
+    return fresh, pooled
+
+
+def reader(db_path, pooled, results):
+    done = 0
+    deadline = time.perf_counter() + DURATION
+    while time.perf_counter() < deadline:
+        if pooled:
+            conn = db.connection(db_path)
+        else:
+            conn = sqlite3.connect(db_path, timeout=5)
+        conn.execute(QUERY).fetchall()
+        if not pooled:
+            conn.close()
+        done += 1
+    results.put(done)
+
+
+def writer(db_path, pooled, results):
+    # the statements of a park_car, committed one request at a time
+    if pooled:
+        conn = db.connect(db_path)
+    else:
+        conn = sqlite3.connect(db_path, timeout=5, isolation_level=None)
+    done = 0
+    deadline = time.perf_counter() + DURATION
+    while time.perf_counter() < deadline:
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute("INSERT OR REPLACE INTO parked_spots (spot, plate, time_in, comments) "
+                     "VALUES (1, 'W', '2024-01-01T08:00:00', '')")
+        conn.execute("INSERT INTO changes (kind, spot) VALUES ('park', 1)")
+        conn.execute('COMMIT')
+        done += 1
+    conn.close()
+    results.put(done)
+
+
+def contention(journal_mode):
+    db_path = make_db(journal_mode)
+    pooled = journal_mode == 'WAL'
+    results = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=reader, args=(db_path, pooled, results)) for _ in range(READERS)]
+    procs.append(multiprocessing.Process(target=writer, args=(db_path, pooled, results)))
+    for p in procs:
+        p.start()
+    counts = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    return sum(counts) / DURATION, counts
+
+
+def main():
+    fresh, pooled = per_request(make_db('DELETE'))
+    print(f'per request  fresh connection {fresh * 1e6:7.1f} us   pooled {pooled * 1e6:7.1f} us')
+    for mode in ('DELETE', 'WAL'):
+        rate, counts = contention(mode)
+        print(f'{mode:>6}: {rate:9.0f} ops/s  (readers {counts[:-1]}, writer {counts[-1]})')
+
+
+if __name__ == '__main__':
+    main()
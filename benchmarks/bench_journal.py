@@ -0,0 +1,96 @@
+"""Durable gate events with group commit, and restart time vs history size.
+
+Throughput: park + remove pairs from THREADS threads sharing one park,
+with commits fsynced (durable=True) or not. With group commit, threads
+that commit while an fsync is running share the next one.
+
+Restart: a park of HISTORY rows whose snapshot checkpoint is TAIL changes
+behind, reopened with load_from_db(snapshot=...); the time follows the
+tail, not the history.
+
+    python benchmarks/bench_journal.py
+"""
+import contextlib
+import io
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import practice  # noqa: E402
+from practice import CarPark  # noqa: E402
+
+EVENTS = 400
+THREADS = (1, 8)
+HISTORY_SIZES = (10_000, 1_000_000)
+TAIL = 500
+
+
+def throughput(durable, threads):
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    park = CarPark(threads * 2)
+    park.attach_db(db_path, durable=durable)
+
+    def worker(n):
+        for i in range(EVENTS // threads):
+            spot = park.park_car(f'T{n}-{i}')
+            park.remove_car(spot)
+
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+        elapsed = time.perf_counter() - start
+    fsyncs = park._journal.fsyncs if durable else 0
+    park.detach_db()
+    return EVENTS * 2 / elapsed, fsyncs
+
+
+def restart(rows):
+    tmp = tempfile.mkdtemp()
+    db_path = os.path.join(tmp, 'bench.db')
+    snap = os.path.join(tmp, 'bench.snapshot')
+    CarPark(300).attach_db(db_path)
+    conn = sqlite3.connect(db_path)
+    conn.execute("WITH RECURSIVE n(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM n WHERE i < ?) "
+                 "INSERT INTO transactions (spot, plate, time_in, time_out, amount, paid, comments) "
+                 "SELECT i % 300 + 1, 'P' || (i % 50000), "
+                 "strftime('%Y-%m-%dT%H:%M:%S+07:00', 1700000000 + i * 60, 'unixepoch'), "
+                 "strftime('%Y-%m-%dT%H:%M:%S+07:00', 1700000000 + i * 60 + 5400, 'unixepoch'), 3.0, 0, '' FROM n",
+                 (rows - 1,))
+    conn.commit()
+    conn.close()
+    practice.SNAPSHOT_REFRESH_CHANGES = 10 * TAIL
+    park = CarPark.load_from_db(db_path, write_through=True, snapshot=snap)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(TAIL // 2):
+            park.remove_car(park.park_car(f'TAIL{i}'))
+    park.detach_db()
+    start = time.perf_counter()
+    park = CarPark.load_from_db(db_path, write_through=True, snapshot=snap)
+    elapsed = time.perf_counter() - start
+    park.detach_db()
+    return elapsed * 1e3
+
+
+def main():
+    print(f"{'threads':>7}  {'durable':>7}  {'events/s':>9}  {'fsyncs':>6}")
+    for threads in THREADS:
+        for durable in (False, True):
+            rate, fsyncs = throughput(durable, threads)
+            print(f"{threads:>7}  {str(durable):>7}  {rate:>9.0f}  {fsyncs:>6}")
+    print()
+    print(f"{'history rows':>12}  {'restart ms (' + str(TAIL) + ' changes to replay)':>34}")
+    for rows in HISTORY_SIZES:
+        print(f"{rows:>12}  {restart(rows):>34.1f}")
+
+
+if __name__ == '__main__':
+    main()
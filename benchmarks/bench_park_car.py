@@ -0,0 +1,45 @@
+"""Entry latency of CarPark.park_car as capacity grows.
+
+Each site is filled to one spot short of capacity, then the last spot is
+parked and released repeatedly, which is the worst case for a linear scan.
+
+    python benchmarks/bench_park_car.py
+"""
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from practice import CarPark  # noqa: E402
+
+CAPACITIES = (10, 1_000, 100_000, 1_000_000)
+ROUNDS = 2_000
+
+
+def bench(capacity):
+    park = CarPark(capacity)
+    # fill directly; only the measured entries go through park_car
+    park.parked_cars = {spot: {'plate': f'P{spot}', 'time_in': '', 'comments': ''}
+                        for spot in range(1, capacity)}
+    park._rebuild_free_spots()
+    sink = io.StringIO()
+    with contextlib.redirect_stdout(sink):
+        start = time.perf_counter()
+        for _ in range(ROUNDS):
+            park.park_car('BENCH')
+            park.remove_car(capacity)
+        elapsed = time.perf_counter() - start
+    return elapsed / ROUNDS * 1e6
+
+
+def main():
+    print(f"{'capacity':>10}  {'park+remove (us)':>18}")
+    for capacity in CAPACITIES:
+        print(f"{capacity:>10}  {bench(capacity):>18.1f}")
+
+
+if __name__ == '__main__':
+    main()
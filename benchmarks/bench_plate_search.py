@@ -0,0 +1,52 @@
+"""Search-as-you-type latency of PlateIndex with a million known plates.
+
+    python benchmarks/bench_plate_search.py
+"""
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from plate_index import PlateIndex  # noqa: E402
+
+PLATES = 1_000_000
+QUERIES = ('A', 'AB', 'AB1', 'AB12', 'B12', '123', '1234', '234X', 'ZZZZ')
+REPEAT = 200
+
+
+def make_plates(n):
+    rng = random.Random(1)
+    plates = set()
+    while len(plates) < n:
+        plates.add(''.join(rng.choices(string.ascii_uppercase, k=2)) + '%04d' % rng.randrange(10000)
+                   + rng.choice(string.ascii_uppercase))
+    return plates
+
+
+def main():
+    plates = make_plates(PLATES)
+    start = time.perf_counter()
+    index = PlateIndex(plates)
+    print(f'{PLATES} plates indexed in {time.perf_counter() - start:.1f} s')
+    start = time.perf_counter()
+    for n in range(10000):
+        index.add('NEW%06d' % n)
+    print(f'  new plate added in {(time.perf_counter() - start) / 10000 * 1e6:.1f} us')
+    for query in QUERIES:
+        start = time.perf_counter()
+        for _ in range(REPEAT):
+            hits = index.search(query)
+        took = (time.perf_counter() - start) / REPEAT
+        # what the old search did: a substring test on every plate
+        start = time.perf_counter()
+        scanned = [p for p in plates if query in p]
+        scan = time.perf_counter() - start
+        print(f'  {query!r:8} {took * 1e6:8.1f} us  ({len(hits)} hits; full scan {scan * 1e3:6.1f} ms, '
+              f'{len(scanned)} hits)')
+
+
+if __name__ == '__main__':
+    main()
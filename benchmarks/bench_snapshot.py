@@ -0,0 +1,82 @@
+"""Cold start: load_from_db against opening a binary snapshot, vs history size.
+
+Three ways to get a park holding the whole history:
+
+  - load_from_db: every row read from SQLite into the log, indexes built;
+  - load_snapshot: the snapshot file mapped and its small state parsed
+    (the log is read in place as it is used);
+  - load_from_db(snapshot=...): the same snapshot, attached to the
+    database and caught up through the change log (nothing to catch up).
+
+Each open is followed by one lookup (get_transaction of the newest row),
+so the time includes touching the columns.
+
+    python benchmarks/bench_snapshot.py
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from practice import CarPark  # noqa: E402
+
+HISTORY_SIZES = (10_000, 100_000, 1_000_000)
+ROUNDS = 5
+
+
+def seed(db_path, rows):
+    park = CarPark(300)
+    park.attach_db(db_path)
+    park.detach_db()
+    conn = sqlite3.connect(db_path)
+    conn.execute("WITH RECURSIVE n(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM n WHERE i < ?) "
+                 "INSERT INTO transactions (spot, plate, time_in, time_out, amount, paid, comments) "
+                 "SELECT i % 300 + 1, 'P' || (i % 50000), "
+                 "strftime('%Y-%m-%dT%H:%M:%S+07:00', 1700000000 + i * 60, 'unixepoch'), "
+                 "strftime('%Y-%m-%dT%H:%M:%S+07:00', 1700000000 + i * 60 + 5400, 'unixepoch'), "
+                 "3.0, i % 2, CASE WHEN i % 50 = 0 THEN 'note' ELSE '' END FROM n",
+                 (rows - 1,))
+    conn.commit()
+    conn.close()
+
+
+def best(open_park):
+    """Fastest of ROUNDS opens (plus one lookup), in ms."""
+    times = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        park = open_park()
+        park.get_transaction(park.transactions[-1]['id'])
+        times.append(time.perf_counter() - start)
+        if park.db_path:
+            park.detach_db()
+    return min(times) * 1e3
+
+
+def bench(rows):
+    tmp = tempfile.mkdtemp()
+    db_path = os.path.join(tmp, 'bench.db')
+    snap = os.path.join(tmp, 'bench.snapshot')
+    seed(db_path, rows)
+    park = CarPark.load_from_db(db_path, write_through=True, snapshot=snap)
+    park.detach_db()
+    size = os.path.getsize(snap)
+    baseline = best(lambda: CarPark.load_from_db(db_path))
+    mapped = best(lambda: CarPark.load_snapshot(snap))
+    attached = best(lambda: CarPark.load_from_db(db_path, write_through=True, snapshot=snap))
+    return size, baseline, mapped, attached
+
+
+def main():
+    print(f"{'history rows':>12}  {'snapshot MB':>11}  {'load_from_db ms':>15}  "
+          f"{'load_snapshot ms':>16}  {'snapshot+attach ms':>18}")
+    for rows in HISTORY_SIZES:
+        size, baseline, mapped, attached = bench(rows)
+        print(f"{rows:>12}  {size / 1e6:>11.1f}  {baseline:>15.1f}  {mapped:>16.2f}  {attached:>18.2f}")
+
+
+if __name__ == '__main__':
+    main()
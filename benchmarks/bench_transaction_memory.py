@@ -0,0 +1,56 @@
+"""Memory held per in-memory transaction: list of dicts vs TransactionLog.
+
+    python benchmarks/bench_transaction_memory.py
+"""
+import os
+import sys
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from records import TransactionLog  # noqa: E402
+
+ROWS = 200_000
+PLATES = 5_000
+
+
+def make_records(n):
+    # built the way remove_car builds them: fresh strings per record
+    start = datetime(2024, 1, 1, 8, 0).astimezone()
+    for i in range(n):
+        t_in = start + timedelta(minutes=7 * i)
+        t_out = t_in + timedelta(minutes=30 + i % 240)
+        yield {
+            'id': i + 1,
+            'spot': i % 500 + 1,
+            'plate': ''.join(['AB', str(1000 + i % PLATES)]),
+            'time_in': t_in.isoformat(),
+            'time_out': t_out.isoformat(),
+            'amount': round((30 + i % 240) / 60 * 2.0, 2),
+            'paid': i % 3 == 0,
+            'comments': 'late' if i % 50 == 0 else '',
+        }
+
+
+def measure(build):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    held = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return held, (after - before) / ROWS
+
+
+def main():
+    dicts, dict_bytes = measure(lambda: list(make_records(ROWS)))
+    log, log_bytes = measure(lambda: TransactionLog(make_records(ROWS)))
+    assert [tx.to_dict() for tx in log] == dicts
+    print(f'{ROWS} transactions')
+    print(f'  list of dicts   {dict_bytes:8.1f} B/tx')
+    print(f'  TransactionLog  {log_bytes:8.1f} B/tx')
+    print(f'  ratio           {dict_bytes / log_bytes:8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""Request throughput with N processes sharing one car park through SQLite.
+
+Each worker mimics a gunicorn worker: refresh() before every request, a
+read (occupancy snapshot) for most requests and a park+remove for every
+tenth one.
+
+    python benchmarks/bench_workers.py
+"""
+import contextlib
+import io
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from practice import CarPark  # noqa: E402
+
+DURATION = 2.0
+WORKER_COUNTS = (1, 2, 4)
+
+
+def worker(db_path, plate, results):
+    park = CarPark.load_from_db(db_path, write_through=True)
+    done = 0
+    deadline = time.perf_counter() + DURATION
+    with contextlib.redirect_stdout(io.StringIO()):
+        while time.perf_counter() < deadline:
+            park.refresh()
+            if done % 10 == 9:
+                with park.batch():
+                    park.park_car(plate)
+                    spot = next(s for s, r in park.parked_cars.items() if r['plate'] == plate)
+                    park.remove_car(spot)
+            else:
+                sorted(park.parked_cars)
+                park.available_spots()
+            done += 1
+    park.detach_db()
+    results.put(done)
+
+
+def bench(workers):
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    CarPark(200).save_to_db(db_path)
+    results = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=worker, args=(db_path, f'W{i}', results)) for i in range(workers)]
+    for p in procs:
+        p.start()
+    total = sum(results.get() for _ in procs)
+    for p in procs:
+        p.join()
+    return total / DURATION
+
+
+def main():
+    print(f"{'workers':>7}  {'requests/s':>12}")
+    for n in WORKER_COUNTS:
+        print(f"{n:>7}  {bench(n):>12.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""Cost of one gate event (park + remove) in write-through mode vs history size.
+
+The old path was save_to_db after each change, which rewrites every row.
+
+    python benchmarks/bench_write_through.py
+"""
+import contextlib
+import io
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from practice import CarPark  # noqa: E402
+
+HISTORY_SIZES = (100, 100_000, 1_000_000)
+ROUNDS = 200
+
+
+def seed(db_path, rows):
+    park = CarPark(100)
+    park.save_to_db(db_path)
+    conn = sqlite3.connect(db_path)
+    conn.executemany(
+        'INSERT INTO transactions (spot, plate, time_in, time_out, amount, paid, comments) VALUES (?, ?, ?, ?, ?, ?, ?)',
+        ((i % 100 + 1, f'P{i}', '2024-01-01T08:00:00+07:00', '2024-01-01T09:00:00+07:00', 2.0, 1, '')
+         for i in range(rows)))
+    conn.commit()
+    conn.close()
+
+
+def bench(rows):
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    seed(db_path, rows)
+    park = CarPark.load_from_db(db_path, write_through=True)
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for _ in range(ROUNDS):
+            park.park_car('BENCH')
+            park.remove_car(1)
+        elapsed = time.perf_counter() - start
+    park.detach_db()
+    return elapsed / ROUNDS * 1e3
+
+
+def main():
+    print(f"{'history rows':>12}  {'gate event (ms)':>16}")
+    for rows in HISTORY_SIZES:
+        print(f"{rows:>12}  {bench(rows):>16.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,33 @@
+import os
 import tkinter as tk
 from tkinter import simpledialog, messagebox, scrolledtext, filedialog, ttk
+
+import backup
 from practice import CarPark
 from user_manager import UserManager
 
+# park files: NDJSON now, the older single JSON document still loads
+PARK_FILETYPES = [('Car park files', '*.ndjson *.json'), ('All files', '*.*')]
+
+
 class CarParkGUI:
+    REFRESH_MS = 2000
+    # transactions kept in memory; the history views page the rest from the DB
+    HISTORY_LIMIT = 5000
+    # rows the transaction table loads at a time (more on demand)
+    TABLE_PAGE = 200
+
     def __init__(self, root, user_manager: UserManager, current_user: str):
         self.root = root
         self.user_manager = user_manager
         self.current_user = current_user
         self.db_path = self.user_manager.db_path
+        self.snapshot_path = self.db_path + '.snapshot'
+        # nightly online backup and maintenance while the GUI is open (the
+        # web app runs the same schedule; whoever is up first does it)
+        self.scheduler = backup.Scheduler(self.db_path,
+                                          os.path.join(os.path.dirname(os.path.abspath(self.db_path)), 'backups'))
+        self.scheduler.start()
         root.title(f'Car Park Manager — Logged in as {self.current_user}')
 
         # Build application menus (account management, admin tools)
@@ -107,6 +126,9 @@ class CarParkGUI:
         # auto-save on exit
         root.protocol('WM_DELETE_WINDOW', self.on_exit)
 
+        # pick up changes made by the web app or another GUI on the same DB
+        self.root.after(self.REFRESH_MS, self._poll_db)
+
     def _build_menus(self):
         menubar = tk.Menu(self.root)
 
@@ -119,6 +141,7 @@ class CarParkGUI:
         if self.user_manager.is_admin(self.current_user):
             admin_menu = tk.Menu(menubar, tearoff=0)
             admin_menu.add_command(label='Manage Users', command=self.manage_users_dialog)
+            admin_menu.add_command(label='Back Up Now', command=self.backup_now)
             menubar.add_cascade(label='Admin', menu=admin_menu)
 
         self.root.config(menu=menubar)
@@ -132,14 +155,22 @@ class CarParkGUI:
             messagebox.showerror('Error', 'Please enter a positive integer capacity')
             return
 
-        self.park = CarPark(cap)
+        self._replace_park(CarPark(cap))
         # apply current rate
         try:
-            self.park.rate_per_hour = float(self.rate_var.get())
+            self.park.set_rate(float(self.rate_var.get()))
         except Exception:
-            self.park.rate_per_hour = getattr(self.park, 'rate_per_hour', 2.0)
+            self.park.set_rate(getattr(self.park, 'rate_per_hour', 2.0))
         self.refresh_list()
 
+    def _replace_park(self, park):
+        """Swap in a new park and make it the write-through state of the DB."""
+        if self.park:
+            self.park.detach_db()
+        self.park = park
+        self.park.history_limit = self.HISTORY_LIMIT
+        self.park.attach_db(self.db_path)
+
     def refresh_list(self):
         # Clear tree and repopulate with current parked cars
         for item in self.tree.get_children():
@@ -160,14 +191,13 @@ class CarParkGUI:
                 time_out_short = ''
                 
                 # also check transactions for time_out if it was removed and re-parked
-                for tx in reversed(self.park.transactions):
-                    if tx.get('spot') == spot:
-                        time_out = str(tx.get('time_out', ''))
-                        time_out_short = time_out[:19] if time_out else ''
-                        # prefer transaction comments if present
-                        if tx.get('comments'):
-                            comments = str(tx.get('comments', ''))
-                        break
+                tx = self.park.latest_transaction(spot)
+                if tx:
+                    time_out = str(tx.get('time_out', ''))
+                    time_out_short = time_out[:19] if time_out else ''
+                    # prefer transaction comments if present
+                    if tx.get('comments'):
+                        comments = str(tx.get('comments', ''))
                 
                 self.tree.insert('', 'end', values=(str(spot), plate, time_in_short, time_out_short, comments))
 
@@ -184,28 +214,18 @@ class CarParkGUI:
         except (ValueError, IndexError):
             return
         
-        # find or create transaction for this spot
-        tx = None
-        for t in reversed(self.park.transactions):
-            if t.get('spot') == spot:
-                tx = t
-                break
-        
-        # if no transaction but car is parked, create a placeholder transaction for editing
+        # a parked car's comments, else those of the spot's last transaction
+        rec = self.park.parked_cars.get(spot)
+        tx = None if rec else self.park.latest_transaction(spot)
         if not tx:
-            rec = self.park.parked_cars.get(spot)
             if rec:
                 tx = {
                     'spot': spot,
                     'plate': rec.get('plate', ''),
                     'time_in': rec.get('time_in', ''),
                     'time_out': '',
-                    'amount': 0,
-                    'paid': False,
                     'comments': rec.get('comments', '')
                 }
-                # Add this transaction to the list so comments get saved
-                self.park.transactions.append(tx)
         
         if tx:
             self.edit_transaction_comments(tx)
@@ -233,16 +253,17 @@ class CarParkGUI:
 
         def save_comments():
             comment_text = comments_text.get('1.0', 'end').strip()
-            tx['comments'] = comment_text
-            
-            # also save to parked car record if it exists
             spot = tx.get('spot')
-            if spot in self.park.parked_cars:
-                self.park.parked_cars[spot]['comments'] = comment_text
-            
-            # persist to database
+
+            # write-through: the park persists only the touched rows
             try:
-                self.park.save_to_db(self.db_path)
+                if spot in self.park.parked_cars:
+                    # parked car (and its open transaction, if any); the
+                    # previous car's closed transaction is left alone
+                    tx['comments'] = comment_text
+                    self.park.update_comments(spot, comment_text)
+                else:
+                    self.park.update_transaction(tx, comments=comment_text)
                 messagebox.showinfo('Success', 'Comments saved successfully')
             except Exception as e:
                 messagebox.showerror('Save Error', f'Failed to save: {e}')
@@ -401,12 +422,11 @@ class CarParkGUI:
             time_out = ''
             amount = ''
             paid_flag = ''
-            for tx in reversed(self.park.transactions):
-                if tx.get('spot') == spot:
-                    time_out = str(tx.get('time_out', ''))
-                    amount = str(tx.get('amount', ''))
-                    paid_flag = '✓' if tx.get('paid') else ''
-                    break
+            tx = self.park.latest_transaction(spot)
+            if tx:
+                time_out = str(tx.get('time_out', ''))
+                amount = str(tx.get('amount', ''))
+                paid_flag = '✓' if tx.get('paid') else ''
 
             tree.insert('', 'end', values=(str(spot), plate, time_in, time_out, amount, paid_flag))
 
@@ -431,16 +451,15 @@ class CarParkGUI:
                 time_out = ''
                 amount = ''
                 paid_flag = ''
-                for tx in reversed(self.park.transactions):
-                    if tx.get('spot') == spot:
-                        time_out = str(tx.get('time_out', ''))
-                        amount = str(tx.get('amount', ''))
-                        paid_flag = '✓' if tx.get('paid') else ''
-                        # if car is not parked, get plate and time_in from transaction
-                        if not rec:
-                            plate = str(tx.get('plate', ''))
-                            time_in = str(tx.get('time_in', ''))
-                        break
+                tx = self.park.latest_transaction(spot)
+                if tx:
+                    time_out = str(tx.get('time_out', ''))
+                    amount = str(tx.get('amount', ''))
+                    paid_flag = '✓' if tx.get('paid') else ''
+                    # if car is not parked, get plate and time_in from transaction
+                    if not rec:
+                        plate = str(tx.get('plate', ''))
+                        time_in = str(tx.get('time_in', ''))
 
                 tree.insert('', 'end', values=(str(spot), plate, time_in, time_out, amount, paid_flag))
 
@@ -455,11 +474,7 @@ class CarParkGUI:
             except Exception:
                 return
             # find latest transaction for spot
-            tx = None
-            for t in reversed(self.park.transactions):
-                if t.get('spot') == spotnum:
-                    tx = t
-                    break
+            tx = self.park.latest_transaction(spotnum)
 
             if tx:
                 self.show_transaction_dialog(tx, refresh_table_fn=refresh_tree_data)
@@ -540,11 +555,16 @@ class CarParkGUI:
 
         def save_and_close():
             try:
-                tx['amount'] = round(float(amt_var.get()), 2)
+                amount = round(float(amt_var.get()), 2)
             except Exception:
                 messagebox.showwarning('Invalid', 'Please enter a valid amount')
                 return
-            tx['paid'] = bool(paid_var.get())
+            try:
+                self.park.update_transaction(tx, amount=amount, paid=bool(paid_var.get()))
+            except ValueError as e:
+                # an archived month
+                messagebox.showerror('Read-only', str(e))
+                return
             dlg.destroy()
             if refresh_table_fn:
                 refresh_table_fn()
@@ -585,9 +605,9 @@ class CarParkGUI:
         tree.pack(fill='both', expand=True, padx=8, pady=8, side='left')
         vsb.pack(side='right', fill='y')
         
-        # Populate with recent transactions
+        # Populate with recent transactions (the in-memory window)
         for i, tx in enumerate(reversed(self.park.transactions), 1):
-            tree.insert('', 'end', values=(
+            tree.insert('', 'end', iid=str(tx['id']), values=(
                 str(i),
                 str(tx.get('spot', '')),
                 str(tx.get('plate', '')),
@@ -602,12 +622,11 @@ class CarParkGUI:
                 messagebox.showwarning('No selection', 'Please select a transaction')
                 return
             
-            vals = tree.item(sel[0], 'values')
             try:
-                idx = int(vals[0]) - 1
-                tx_idx = len(self.park.transactions) - idx - 1
-                if 0 <= tx_idx < len(self.park.transactions):
-                    tx = self.park.transactions[tx_idx]
+                # rows are keyed by transaction id, which stays valid even if
+                # the in-memory window has moved on since the dialog opened
+                tx = self.park.get_transaction(int(sel[0]))
+                if tx:
                     self._generate_invoice(tx)
                     dlg.destroy()
             except Exception as e:
@@ -696,25 +715,19 @@ Thank you for your business!
         tz = datetime.now().astimezone().tzinfo
         today = datetime.now(tz).date()
         
-        # Filter transactions for today
-        today_txs = []
-        for tx in self.park.transactions:
-            try:
-                tx_date = datetime.fromisoformat(tx.get('time_out', '')).date()
-                if tx_date == today:
-                    today_txs.append(tx)
-            except Exception:
-                pass
+        # today's transactions (indexed query on the time_out date)
+        today_txs = self.park.transactions_for_day(today)
         
         # Create invoice window
         inv_win = tk.Toplevel(self.root)
         inv_win.title(f'Daily Invoice - {today.strftime("%Y-%m-%d")}')
         inv_win.geometry('700x500')
         
-        # Calculate totals
-        total_amount = sum(tx.get('amount', 0) for tx in today_txs)
-        paid_amount = sum(tx.get('amount', 0) for tx in today_txs if tx.get('paid'))
-        unpaid_amount = total_amount - paid_amount
+        # totals from the day's rollup row, not by adding up transactions
+        totals = self.park.report_totals(today, today)
+        total_amount = totals['total']
+        paid_amount = totals['paid']
+        unpaid_amount = totals['unpaid']
         
         invoice_header = f"""
 {'='*60}
@@ -732,10 +745,12 @@ Thank you for your business!
             invoice_items += f"{tx.get('spot'):<8}{str(tx.get('plate', '')):<15}{str(tx.get('time_in', ''))[:16]:<20}${tx.get('amount', 0):<11.2f}{status:<10}\n"
         
         invoice_footer = f"""{'-'*60}
-{'TOTAL TRANSACTIONS:':<45}{len(today_txs)}
+{'TOTAL TRANSACTIONS:':<45}{totals['transactions']}
 {'Total Amount:':<45}${total_amount:>10.2f}
 {'Paid Amount:':<45}${paid_amount:>10.2f}
 {'Unpaid Amount:':<45}${unpaid_amount:>10.2f}
+{'Average Stay (minutes):':<45}{totals['average_dwell_minutes'] or 0:>11.1f}
+{'Peak Occupancy:':<45}{totals['peak_occupancy']:>11}
 {'='*60}
 Generated: {datetime.now(tz).strftime('%Y-%m-%d %H:%M:%S')}
 {'='*60}
@@ -811,37 +826,66 @@ Generated: {datetime.now(tz).strftime('%Y-%m-%d %H:%M:%S')}
         win.grid_rowconfigure(0, weight=1)
         win.grid_columnconfigure(0, weight=1)
 
-        # populate all transactions in reverse order (newest first)
-        for i, tx in enumerate(reversed(self.park.transactions), 1):
-            spot = tx.get('spot', '')
-            plate = tx.get('plate', '')
-            time_in = tx.get('time_in', '')
-            time_out = tx.get('time_out', '')
-            amount = tx.get('amount', '')
-            paid_flag = '✓' if tx.get('paid') else ''
-            tree.insert('', 'end', values=(i, spot, plate, time_in, time_out, amount, paid_flag))
+        # newest first, a page at a time (the history may be far larger than
+        # what the park keeps in memory); rows are keyed by transaction id
+        paging = {'cursor': None}
+
+        def load_page(limit):
+            page, paging['cursor'] = self.park.page_transactions(cursor=paging['cursor'], limit=limit)
+            i = len(tree.get_children())
+            for i, tx in enumerate(page, i + 1):
+                spot = tx.get('spot', '')
+                plate = tx.get('plate', '')
+                time_in = tx.get('time_in', '')
+                time_out = tx.get('time_out', '')
+                amount = tx.get('amount', '')
+                paid_flag = '✓' if tx.get('paid') else ''
+                tree.insert('', 'end', iid=str(tx['id']), values=(i, spot, plate, time_in, time_out, amount, paid_flag))
+            more_btn.config(state='normal' if paging['cursor'] else 'disabled')
+
+        def load_more():
+            if paging['cursor']:
+                load_page(self.TABLE_PAGE)
+
+        def populate():
+            # reload as many rows as were shown
+            shown = len(tree.get_children())
+            tree.delete(*tree.get_children())
+            paging['cursor'] = None
+            load_page(max(shown, self.TABLE_PAGE))
 
         # double-click to edit
         def on_double_click(event):
             item = tree.identify_row(event.y)
-            if not item:
-                return
-            vals = tree.item(item, 'values')
-            try:
-                idx = int(vals[0]) - 1
-                # reverse the index since we displayed newest first
-                tx_idx = len(self.park.transactions) - idx - 1
-                if 0 <= tx_idx < len(self.park.transactions):
-                    tx = self.park.transactions[tx_idx]
-                    self.show_transaction_dialog(tx)
-            except Exception:
-                pass
+            tx = self.park.get_transaction(int(item)) if item else None
+            if tx:
+                self.show_transaction_dialog(tx, refresh_table_fn=populate)
 
         tree.bind('<Double-1>', on_double_click)
 
+        # end-of-shift: mark every selected row paid in one go
+        def mark_selected_paid():
+            ids = [int(item) for item in tree.selection()]
+            if not ids:
+                messagebox.showinfo('Mark Paid', 'Select one or more transactions first')
+                return
+            try:
+                count = self.park.mark_paid(ids)
+            except Exception as e:
+                messagebox.showerror('Save Error', f'Failed to save: {e}')
+                return
+            populate()
+            self.refresh_list()
+            messagebox.showinfo('Mark Paid', f'{count} transaction(s) marked paid')
+
         btn_frame = tk.Frame(win)
         btn_frame.grid(row=2, column=0, columnspan=2, sticky='e', pady=(8,8), padx=8)
         tk.Button(btn_frame, text='Close', command=win.destroy).pack(side='right')
+        tk.Button(btn_frame, text='Mark Selected Paid', command=mark_selected_paid).pack(side='right', padx=4)
+        more_btn = tk.Button(btn_frame, text='Load More', command=load_more)
+        more_btn.pack(side='right', padx=4)
+
+        populate()
 
     def perform_search(self):
         if not self.park:
@@ -859,17 +903,16 @@ Generated: {datetime.now(tz).strftime('%Y-%m-%d %H:%M:%S')}
             rec = self.park.parked_cars.get(spot)
             if rec:
                 results.append(f'Parked - Spot {spot}: {rec.get("plate")} (in: {rec.get("time_in")})')
-            for tx in self.park.transactions:
-                if tx.get('spot') == spot:
-                    results.append(f'Transaction - Spot {spot}: {tx.get("plate")} ${tx.get("amount")} paid:{tx.get("paid")}')
+            for tx in self.park.transactions_for_spot(spot):
+                results.append(f'Transaction - Spot {spot}: {tx.get("plate")} ${tx.get("amount")} paid:{tx.get("paid")}')
         except ValueError:
-            # search by plate substring (case-insensitive)
-            qlow = q.lower()
-            for spot, rec in self.park.parked_cars.items():
-                if qlow in rec.get('plate','').lower():
+            # search by plate: exact, prefix, then substring (plate index)
+            for hit in self.park.search_plates(q, limit=50):
+                spot = hit['spot']
+                if spot is not None:
+                    rec = self.park.parked_cars[spot]
                     results.append(f'Parked - Spot {spot}: {rec.get("plate")} (in: {rec.get("time_in")})')
-            for tx in self.park.transactions:
-                if qlow in tx.get('plate','').lower():
+                for tx in self.park.transactions_for_plate(hit['plate']):
                     results.append(f'Transaction - Spot {tx.get("spot")} : {tx.get("plate")} ${tx.get("amount")} paid:{tx.get("paid")}')
 
         # show results
@@ -1092,7 +1135,7 @@ Generated: {datetime.now(tz).strftime('%Y-%m-%d %H:%M:%S')}
         if not self.park:
             messagebox.showwarning('No park', 'Create a car park first')
             return
-        path = filedialog.asksaveasfilename(defaultextension='.json', filetypes=[('JSON files','*.json')], initialfile='carpark.json')
+        path = filedialog.asksaveasfilename(defaultextension='.ndjson', filetypes=PARK_FILETYPES, initialfile='carpark.ndjson')
         if not path:
             return
         try:
@@ -1101,11 +1144,11 @@ Generated: {datetime.now(tz).strftime('%Y-%m-%d %H:%M:%S')}
             messagebox.showerror('Save error', str(e))
 
     def load_park(self):
-        path = filedialog.askopenfilename(filetypes=[('JSON files','*.json')])
+        path = filedialog.askopenfilename(filetypes=PARK_FILETYPES)
         if not path:
             return
         try:
-            self.park = CarPark.load_from_file(path)
+            self._replace_park(CarPark.load_from_file(path))
             self.capacity_var.set(self.park.capacity)
             # apply loaded rate to UI
             try:
@@ -1122,14 +1165,15 @@ Generated: {datetime.now(tz).strftime('%Y-%m-%d %H:%M:%S')}
             if not self.park:
                 messagebox.showwarning('No park', 'Create a car park first')
             else:
-                self.park.rate_per_hour = r
+                self.park.set_rate(r)
         except Exception:
             messagebox.showerror('Error', 'Please enter a valid numeric rate')
 
     def auto_load_on_startup(self):
         """Try to load from database on startup."""
         try:
-            self.park = CarPark.load_from_db(self.db_path)
+            self.park = CarPark.load_from_db(self.db_path, write_through=True, history_limit=self.HISTORY_LIMIT,
+                                             snapshot=self.snapshot_path)
             if self.park:
                 self.capacity_var.set(self.park.capacity)
                 try:
@@ -1138,17 +1182,48 @@ Generated: {datetime.now(tz).strftime('%Y-%m-%d %H:%M:%S')}
                     pass
                 self.refresh_list()
             else:
+                # no park stored yet
                 self.create_park()
         except Exception as e:
-            self.create_park()
+            # e.g. the database locked past the busy timeout: creating a park
+            # here would overwrite the history the web workers share
+            messagebox.showerror('Load error', f'Could not open {self.db_path}: {e}\n\n'
+                                 'Nothing was changed. Restart to try again.')
+
+    def _poll_db(self):
+        try:
+            if self.park and self.park.refresh():
+                self.refresh_list()
+        except Exception as e:
+            print(f'Failed to refresh from database: {e}')
+        self.root.after(self.REFRESH_MS, self._poll_db)
+
+    def backup_now(self):
+        """Copy the database in the background; the park stays usable meanwhile."""
+        done = {}
+        self.scheduler.run_in_background('backup', done=lambda result: done.setdefault('result', result))
+
+        def check():
+            if 'result' not in done:
+                self.root.after(500, check)
+            elif isinstance(done['result'], Exception):
+                messagebox.showerror('Backup Error', f"Backup failed: {done['result']}")
+            else:
+                messagebox.showinfo('Backup', f"Backup saved to {done['result']}")
+        self.root.after(500, check)
 
     def on_exit(self):
         """Auto-save to database before exiting."""
         if self.park:
             try:
+                # cheap in write-through mode; a full save otherwise
                 self.park.save_to_db(self.db_path)
+                # next start opens this instead of reading all of SQLite
+                self.park.save_snapshot(self.snapshot_path)
+                self.park.detach_db()
             except Exception as e:
                 print(f'Failed to save to database: {e}')
+        self.scheduler.stop()
         self.root.destroy()
 
 
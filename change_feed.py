@@ -0,0 +1,97 @@
+import sqlite3
+
+import db
+
+
+class ChangeFeed:
+    """Reads the change log of a car park database as small events.
+
+    Every write-through mutation appends a row to the changes table (see
+    CarPark._log_change). This turns the rows after a given version into
+    dicts a client can apply on its own copy of the state:
+
+        {'version': 12, 'type': 'park', 'spot': 3, 'car': {...}}
+        {'version': 13, 'type': 'remove', 'spot': 3, 'car': None, 'transaction': {...}}
+        {'version': 14, 'type': 'rate', 'rate_per_hour': 2.5}
+        {'version': 15, 'type': 'reset'}
+
+    'car' and 'transaction' hold the rows as they are when read, so
+    applying the events in order always ends on the stored state. A
+    'reset' (or a gap left by pruning the log) means: reload everything.
+
+    The feed uses its own read connection, so it can be polled from a
+    request thread without holding the CarPark lock.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._conn = db.connect(db_path, check_same_thread=False)
+        self._data_version = None
+
+    def close(self):
+        self._conn.close()
+
+    def latest_version(self):
+        try:
+            return self._conn.execute('SELECT MAX(version) FROM changes').fetchone()[0] or 0
+        except sqlite3.OperationalError:
+            # no car park stored in this file yet
+            return 0
+
+    def changed(self):
+        """True if another connection committed since the last call (one PRAGMA)."""
+        data_version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+        if data_version == self._data_version:
+            return False
+        self._data_version = data_version
+        return True
+
+    def events_since(self, version):
+        """Return (latest version, events) for the changes after version."""
+        c = self._conn
+        c.execute('BEGIN')
+        try:
+            try:
+                rows = c.execute('SELECT version, kind, spot, tx_id FROM changes WHERE version > ? ORDER BY version',
+                                 (version,)).fetchall()
+            except sqlite3.OperationalError:
+                rows = []
+            if not rows:
+                return version, []
+            latest = rows[-1][0]
+            if rows[0][0] != version + 1 or any(kind == 'reset' for _, kind, _, _ in rows):
+                return latest, [{'version': latest, 'type': 'reset'}]
+            events = []
+            for row_version, kind, spot, tx_id in rows:
+                event = {'version': row_version, 'type': kind}
+                if spot is not None:
+                    event['spot'] = spot
+                    event['car'] = self._car(spot)
+                if tx_id is not None:
+                    event['transaction'] = self._transaction(tx_id)
+                if kind == 'rate':
+                    event['rate_per_hour'] = c.execute(
+                        'SELECT rate_per_hour FROM carpark_state ORDER BY created_at DESC LIMIT 1').fetchone()[0]
+                events.append(event)
+            return latest, events
+        finally:
+            c.execute('COMMIT')
+
+    def _car(self, spot):
+        row = self._conn.execute('SELECT plate, time_in, comments FROM parked_spots WHERE spot = ?',
+                                 (spot,)).fetchone()
+        if row is None:
+            return None
+        plate, time_in, comments = row
+        return {'spot': spot, 'plate': plate, 'time_in': time_in, 'comments': comments or ''}
+
+    def _transaction(self, tx_id):
+        row = self._conn.execute('SELECT id, spot, plate, time_in, time_out, amount, paid, comments '
+                                 'FROM transactions WHERE id = ?', (tx_id,)).fetchone()
+        if row is None:
+            return None
+        keys = ('id', 'spot', 'plate', 'time_in', 'time_out', 'amount', 'paid', 'comments')
+        tx = dict(zip(keys, row))
+        tx['paid'] = bool(tx['paid'])
+        tx['comments'] = tx['comments'] or ''
+        return tx
@@ -0,0 +1,83 @@
+"""SQLite connections shared by CarPark, UserManager and the web app.
+
+connect() opens a connection with the settings the app relies on;
+connection() keeps one such connection per thread and database file and
+hands it out again on every call, so a request does not pay for opening a
+file, reading its schema and re-preparing statements each time.
+
+All connections run in autocommit mode (isolation_level=None): callers
+that need several statements in one transaction issue BEGIN themselves.
+"""
+import os
+import sqlite3
+import threading
+
+# how long to wait for another connection's write lock before giving up
+# with "database is locked"
+BUSY_TIMEOUT_SECONDS = 5.0
+# prepared statements kept per connection (sqlite3's default is 128)
+CACHED_STATEMENTS = 256
+
+_local = threading.local()
+_pool_lock = threading.Lock()
+_pooled = []
+# bumped by close_all(), which makes every thread open fresh connections
+_generation = 0
+
+
+def connect(db_path, check_same_thread=True):
+    """A new connection to db_path in WAL mode; the caller closes it."""
+    new = not os.path.exists(db_path) or os.path.getsize(db_path) == 0
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_SECONDS, isolation_level=None,
+                           check_same_thread=check_same_thread, cached_statements=CACHED_STATEMENTS)
+    if new:
+        # give free pages back in steps (see backup.maintain); an existing
+        # file only switches when it is VACUUMed
+        conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+    # WAL: readers and the writer no longer block each other, across
+    # processes too (the mode is stored in the file)
+    conn.execute('PRAGMA journal_mode=WAL')
+    # in WAL mode NORMAL is still safe against corruption; a power cut may
+    # only lose the last commits, and commits skip an fsync each
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+
+def connection(db_path):
+    """This thread's pooled connection to db_path (opened on first use).
+
+    Do not close it; leave it outside a transaction when done (release()
+    rolls back whatever a failed request left open).
+    """
+    conns = getattr(_local, 'conns', None)
+    if conns is None or _local.generation != _generation:
+        conns = _local.conns = {}
+        _local.generation = _generation
+    key = os.path.abspath(db_path)
+    conn = conns.get(key)
+    if conn is None:
+        # check_same_thread=False only so close_all() may close it
+        conn = conns[key] = connect(db_path, check_same_thread=False)
+        with _pool_lock:
+            _pooled.append(conn)
+    return conn
+
+
+def release():
+    """Roll back any transaction left open on this thread's pooled connections."""
+    if getattr(_local, 'generation', None) != _generation:
+        return
+    for conn in _local.conns.values():
+        if conn.in_transaction:
+            conn.rollback()
+
+
+def close_all():
+    """Close every pooled connection, of all threads (at shutdown, or before removing a file)."""
+    global _generation
+    with _pool_lock:
+        conns = list(_pooled)
+        _pooled.clear()
+        _generation += 1
+    for conn in conns:
+        conn.close()
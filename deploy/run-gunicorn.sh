@@ -23,8 +23,16 @@ if ! mkdir -p "$LOG_DIR" 2>/dev/null; then
   mkdir -p "$LOG_DIR"
 fi
 
+# Workers share one authoritative state through the SQLite file (CARPARK_DB):
+# every mutation runs in its own transaction and each request first applies
+# what the other workers committed, so the worker count can be raised freely.
+# Threaded workers: every open /api/events stream (one per signed-in device)
+# holds a thread for up to EVENT_STREAM_SECONDS, so size --threads for the
+# number of devices plus ordinary requests.
 exec "$GUNICORN_BIN" \
   --workers 3 \
+  --worker-class gthread \
+  --threads 16 \
   --bind 127.0.0.1:5000 \
   --access-logfile "$LOG_DIR/gunicorn.access.log" \
   --error-logfile "$LOG_DIR/gunicorn.error.log" \
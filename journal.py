@@ -0,0 +1,83 @@
+"""Group commit: make a write-through park's commits durable, many per fsync.
+
+A write-through park already appends every operation to its database
+(the transaction rows plus an entry in the change log) as it happens. The
+connections run in WAL mode with synchronous=NORMAL (see db.py), so a
+commit lands in the -wal file without an fsync: a crash of the process
+loses nothing, but a power cut may lose the last commits.
+
+GroupCommit.sync() returns once everything committed before the call is
+on disk. The first caller fsyncs the WAL; callers that arrive meanwhile
+wait and are covered together by the next fsync, so under load one fsync
+acknowledges a whole group of operations instead of one each.
+
+Whoever leads an fsync round also checkpoints the WAL into the database
+file when CHECKPOINT_SECONDS have passed (SQLite itself does so every
+1000 pages), which keeps the log SQLite replays on reopening after a
+crash short. The park's in-memory state has its own checkpoint, the
+snapshot file (see CarPark.load_from_db), replayed from the change log.
+"""
+import os
+import threading
+import time
+
+import db
+
+# how often the WAL is copied into the database file, at most
+CHECKPOINT_SECONDS = 30.0
+
+
+class GroupCommit:
+    def __init__(self, db_path, checkpoint_seconds=CHECKPOINT_SECONDS):
+        self.db_path = db_path
+        self.checkpoint_seconds = checkpoint_seconds
+        self._wal = db_path + '-wal'
+        self._cond = threading.Condition()
+        # callers numbered in arrival order; those up to _synced are on disk
+        self._requested = 0
+        self._synced = 0
+        self._syncing = False
+        self._checkpointed = time.monotonic()
+        # fsyncs done, for tests and benchmarks
+        self.fsyncs = 0
+
+    def sync(self):
+        """Return once everything committed before this call is on disk."""
+        with self._cond:
+            self._requested += 1
+            ticket = self._requested
+            while self._synced < ticket:
+                if self._syncing:
+                    self._cond.wait()
+                    continue
+                # lead a round: it covers every caller that has arrived so far
+                self._syncing = True
+                covered = self._requested
+                self._cond.release()
+                try:
+                    self._fsync()
+                finally:
+                    self._cond.acquire()
+                    self._syncing = False
+                    self._cond.notify_all()
+                self._synced = covered
+                self.fsyncs += 1
+        if time.monotonic() - self._checkpointed >= self.checkpoint_seconds:
+            self.checkpoint()
+
+    def _fsync(self):
+        try:
+            # opened for writing only because Windows needs it to flush
+            fd = os.open(self._wal, os.O_RDWR)
+        except FileNotFoundError:
+            # no log: every commit is already in the database file
+            return
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def checkpoint(self):
+        """Copy the WAL into the database file (as far as readers allow)."""
+        self._checkpointed = time.monotonic()
+        db.connection(self.db_path).execute('PRAGMA wal_checkpoint(PASSIVE)').fetchone()
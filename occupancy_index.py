@@ -0,0 +1,209 @@
+"""Who was parked when: stays indexed for point-in-time and peak queries.
+
+A stay is one car's [time_in, time_out); a car still parked has no
+time_out yet. OccupancyIndex keeps the arrivals and departures of all
+stays as sweep events sorted by time (departures first at the same
+instant, as in rollups.compute), and alongside them:
+
+  - the occupancy right after each event;
+  - every CHECKPOINT events, the stays inside at that point;
+  - per local day, the highest occupancy reached by an arrival in it.
+
+parked_at(T) bisects to T, starts from the checkpoint before it and
+replays at most CHECKPOINT events, so it is O(log n) plus the size of
+the answer, not a scan of the history. count_at(T) is a bisect alone, and
+peak(day) is the larger of the occupancy carried into the day and the
+day's own arrival peak.
+
+Events mostly come in time order and are appended. One that lands
+earlier (a stay ended with hours_override) is inserted, and what follows
+it is redone from the checkpoint before it.
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime
+
+# events between two snapshots of the stays inside
+CHECKPOINT = 256
+
+
+def timestamp(value):
+    """Seconds since the epoch of a datetime, date or ISO string (naive = local), or None."""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if isinstance(value, date) and not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    if not isinstance(value, datetime):
+        return None
+    return value.timestamp()
+
+
+class OccupancyIndex:
+    def __init__(self, stays=(), parked_cars=None):
+        """stays: finished stays (transactions: id, spot, plate, time_in, time_out);
+        parked_cars: spot -> record of the cars inside now."""
+        # stay id -> {'id': transaction id, 'spot', 'plate', 'time_in', 'time_out'}
+        self._stays = []
+        # spot -> stay id of the car parked there
+        self._open = {}
+        # events: (timestamp, 1 arrival / 0 departure) sorted, with the stay
+        # and local day of each, and the occupancy after it
+        self._keys = []
+        self._event_stays = []
+        self._days = []
+        self._counts = array('i')
+        # stays inside before event k * CHECKPOINT
+        self._checkpoints = []
+        # stays inside after the last event
+        self._active = set()
+        self._peaks = {}
+        events = []
+        for tx in stays:
+            if tx.get('time_out'):
+                events += self._register(tx.get('id'), tx.get('spot'), tx.get('plate'),
+                                         tx.get('time_in'), tx.get('time_out'))
+        for spot, rec in sorted((parked_cars or {}).items()):
+            events += self._register(None, spot, rec.get('plate'), rec.get('time_in'), None)
+            self._open[spot] = len(self._stays) - 1
+        events.sort(key=lambda e: e[0])
+        for key, stay_id, day in events:
+            self._keys.append(key)
+            self._event_stays.append(stay_id)
+            self._days.append(day)
+            self._apply(len(self._keys) - 1)
+
+    def __len__(self):
+        return len(self._stays)
+
+    def _register(self, tx_id, spot, plate, time_in, time_out):
+        """Add a stay; returns its events as (key, stay id, day) triples."""
+        stay_id = len(self._stays)
+        self._stays.append({'id': tx_id, 'spot': spot, 'plate': plate, 'time_in': time_in, 'time_out': time_out})
+        t_in, t_out = timestamp(time_in), timestamp(time_out)
+        if t_in is None or (t_out is not None and t_out <= t_in):
+            # never inside: no events (a departure would sort before its arrival)
+            return []
+        events = [((t_in, 1), stay_id, time_in[:10])]
+        if t_out is not None:
+            events.append(((t_out, 0), stay_id, time_out[:10]))
+        return events
+
+    # ------------------------------------------------------------------ updates
+    def arrive(self, spot, plate, time_in):
+        """A car parked at spot."""
+        for key, stay_id, day in self._register(None, spot, plate, time_in, None):
+            self._insert(key, stay_id, day)
+        self._open[spot] = len(self._stays) - 1
+
+    def depart(self, spot, tx):
+        """The car at spot left, recorded as transaction tx."""
+        stay_id = self._open.pop(spot, None)
+        if stay_id is None:
+            # not seen arriving (e.g. parked before the index was built)
+            events = self._register(tx.get('id'), spot, tx.get('plate'), tx.get('time_in'), tx.get('time_out'))
+        else:
+            stay = self._stays[stay_id]
+            stay.update(id=tx.get('id'), time_out=tx.get('time_out'))
+            t_in, t_out = timestamp(stay['time_in']), timestamp(stay['time_out'])
+            events = []
+            if t_in is not None and t_out is not None:
+                if t_out > t_in:
+                    events.append(((t_out, 0), stay_id, stay['time_out'][:10]))
+                else:
+                    self._delete((t_in, 1), stay_id)
+        for key, event_stay, day in events:
+            self._insert(key, event_stay, day)
+
+    def _insert(self, key, stay_id, day):
+        pos = bisect_right(self._keys, key)
+        self._keys.insert(pos, key)
+        self._event_stays.insert(pos, stay_id)
+        self._days.insert(pos, day)
+        if pos == len(self._keys) - 1:
+            self._apply(pos)
+        else:
+            self._counts.insert(pos, 0)
+            self._redo(pos)
+
+    def _delete(self, key, stay_id):
+        pos = bisect_left(self._keys, key)
+        while self._event_stays[pos] != stay_id:
+            pos += 1
+        day = self._days[pos]
+        for column in (self._keys, self._event_stays, self._days, self._counts):
+            del column[pos]
+        self._redo(pos, day)
+
+    def _step(self, active, i):
+        stay_id = self._event_stays[i]
+        if self._keys[i][1]:
+            active.add(stay_id)
+        else:
+            active.discard(stay_id)
+
+    def _apply(self, i):
+        """Account for event i, the last one."""
+        if i % CHECKPOINT == 0:
+            self._checkpoints.append(array('i', sorted(self._active)))
+        self._step(self._active, i)
+        count = len(self._active)
+        self._counts.append(count)
+        if self._keys[i][1]:
+            day = self._days[i]
+            self._peaks[day] = max(self._peaks.get(day, 0), count)
+
+    def _redo(self, pos, day=None):
+        """Recount everything from event pos on, after an insert there
+        (or the removal of an event of the given day)."""
+        # the peaks of that day and later are recounted from the day's
+        # first event; the snapshots from the checkpoint before it
+        if pos < len(self._keys):
+            day = min(day or self._days[pos], self._days[pos])
+        first = pos
+        while first > 0 and self._days[first - 1] >= day:
+            first -= 1
+        for stale in [d for d in self._peaks if d >= day]:
+            del self._peaks[stale]
+        start = first // CHECKPOINT * CHECKPOINT
+        active = set(self._checkpoints[start // CHECKPOINT])
+        del self._checkpoints[start // CHECKPOINT:]
+        for i in range(start, len(self._keys)):
+            if i % CHECKPOINT == 0:
+                self._checkpoints.append(array('i', sorted(active)))
+            self._step(active, i)
+            self._counts[i] = len(active)
+            if i >= first and self._keys[i][1]:
+                self._peaks[self._days[i]] = max(self._peaks.get(self._days[i], 0), len(active))
+        self._active = active
+
+    # ------------------------------------------------------------------ queries
+    def _position(self, when):
+        """How many events happened at or before `when`."""
+        t = timestamp(when)
+        if t is None:
+            raise ValueError(f'not a timestamp: {when!r}')
+        return bisect_right(self._keys, (t, 1))
+
+    def parked_at(self, when):
+        """The stays inside at `when` (arrived at or before it, not yet left), by spot."""
+        i = self._position(when)
+        if i == 0:
+            return []
+        checkpoint = min(i // CHECKPOINT, len(self._checkpoints) - 1)
+        active = set(self._checkpoints[checkpoint])
+        for j in range(checkpoint * CHECKPOINT, i):
+            self._step(active, j)
+        return sorted((dict(self._stays[s]) for s in active), key=lambda stay: (stay['spot'] or 0, stay['time_in']))
+
+    def count_at(self, when):
+        i = self._position(when)
+        return self._counts[i - 1] if i else 0
+
+    def peak(self, day):
+        """Most cars inside at once during a local day ('YYYY-MM-DD' or a date)."""
+        day = day.isoformat() if isinstance(day, date) else day
+        start = date.fromisoformat(day)
+        return max(self.count_at(start), self._peaks.get(day, 0))
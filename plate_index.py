@@ -0,0 +1,223 @@
+"""Plate lookup for search-as-you-type.
+
+PlateIndex knows which spot each parked plate occupies and every plate
+ever seen (parked now or in a transaction). Plates are compared
+normalized: surrounding whitespace dropped, upper case.
+
+search() answers from two structures:
+  - the known plates sorted, in blocks of up to 2 * BLOCK: prefix matches
+    are a bisect and a short walk, whatever the number of plates, and a
+    new plate is inserted into one block rather than shifting them all;
+  - trigram posting lists (trigram -> ids of the plates containing it):
+    a substring of 3+ characters is matched by checking only the plates of
+    its rarest trigram, instead of every plate.
+"""
+import threading
+from array import array
+from bisect import bisect_left, insort
+from itertools import chain
+
+_EMPTY = array('i')
+# plates per block of the sorted list (a full one is split in two)
+BLOCK = 1000
+
+
+def normalize(plate):
+    return (plate or '').strip().upper()
+
+
+def _trigrams(plate):
+    return {plate[i:i + 3] for i in range(len(plate) - 2)}
+
+
+class PlateIndex:
+    def __init__(self, plates=()):
+        # spot(s) of each parked plate; a list, as nothing stops the same
+        # plate from being entered twice
+        self._parked = {}
+        # known plates by id, the same sorted in blocks (with the last plate
+        # of each block, to bisect), and trigram -> ids
+        self._plates = []
+        self._blocks = []
+        self._maxes = []
+        self._grams = {}
+        self.add_many(plates)
+
+    def __len__(self):
+        return len(self._plates)
+
+    def __contains__(self, plate):
+        return self._known(normalize(plate))
+
+    def known(self):
+        """Every known plate, sorted (an iterator)."""
+        return chain.from_iterable(self._blocks)
+
+    def _locate(self, plate):
+        """(block, position) where plate is or would be inserted; block may be one past the last."""
+        k = bisect_left(self._maxes, plate)
+        if k == len(self._blocks):
+            return k, 0
+        return k, bisect_left(self._blocks[k], plate)
+
+    def _known(self, plate):
+        k, i = self._locate(plate)
+        return k < len(self._blocks) and self._blocks[k][i] == plate
+
+    def _register(self, plate):
+        plate_id = len(self._plates)
+        self._plates.append(plate)
+        for gram in _trigrams(plate):
+            ids = self._grams.get(gram)
+            if ids is None:
+                ids = self._grams[gram] = array('i')
+            ids.append(plate_id)
+
+    # ------------------------------------------------------------------ known plates
+    def add(self, plate):
+        """Remember a plate (e.g. of a new transaction)."""
+        plate = normalize(plate)
+        if not plate or self._known(plate):
+            return
+        if not self._blocks:
+            self._blocks.append([])
+            self._maxes.append(plate)
+        k = min(bisect_left(self._maxes, plate), len(self._blocks) - 1)
+        block = self._blocks[k]
+        insort(block, plate)
+        self._maxes[k] = block[-1]
+        if len(block) >= 2 * BLOCK:
+            self._blocks[k:k + 1] = [block[:BLOCK], block[BLOCK:]]
+            self._maxes[k:k + 1] = [block[BLOCK - 1], block[-1]]
+        self._register(plate)
+
+    def add_many(self, plates):
+        """Remember many plates at once; linear in the number known, not quadratic."""
+        new = {normalize(p) for p in plates}
+        new.discard('')
+        new = sorted(p for p in new if not self._known(p))
+        if not new:
+            return
+        for plate in new:
+            self._register(plate)
+        # two sorted runs: timsort merges them in one pass
+        merged = list(self.known())
+        merged += new
+        merged.sort()
+        self._blocks = [merged[i:i + BLOCK] for i in range(0, len(merged), BLOCK)]
+        self._maxes = [block[-1] for block in self._blocks]
+
+    # ------------------------------------------------------------------ parked plates
+    def park(self, plate, spot):
+        plate = normalize(plate)
+        self._parked.setdefault(plate, []).append(spot)
+        self.add(plate)
+
+    def unpark(self, plate, spot):
+        plate = normalize(plate)
+        spots = self._parked.get(plate)
+        if spots and spot in spots:
+            spots.remove(spot)
+            if not spots:
+                del self._parked[plate]
+
+    def set_parked(self, parked_cars):
+        """Rebuild the parked plates from a whole spot -> record mapping."""
+        self._parked = {}
+        for spot in sorted(parked_cars):
+            self.park(parked_cars[spot].get('plate'), spot)
+
+    def spot(self, plate):
+        """The spot a plate is parked at (the lowest, if several), or None."""
+        spots = self._parked.get(normalize(plate))
+        return min(spots) if spots else None
+
+    # ------------------------------------------------------------------ search
+    def search(self, query, limit=20):
+        """Known plates matching query: exact, then prefix, then substring.
+
+        Prefix and exact matches come in plate order. Plates that only
+        contain the query (3+ characters needed) follow: the first ones
+        found, walking the plates in the order they became known, sorted.
+        """
+        query = normalize(query)
+        if not query or limit <= 0:
+            return []
+        found = []
+        k, i = self._locate(query)
+        for block in self._blocks[k:]:
+            while i < len(block) and len(found) < limit and block[i].startswith(query):
+                found.append(block[i])
+                i += 1
+            if i < len(block) or len(found) == limit:
+                break
+            i = 0
+        if len(found) < limit and len(query) >= 3:
+            wanted = limit - len(found)
+            inside = []
+            rarest = min((self._grams.get(g, _EMPTY) for g in _trigrams(query)), key=len)
+            for plate_id in rarest:
+                plate = self._plates[plate_id]
+                if query in plate and not plate.startswith(query):
+                    inside.append(plate)
+                    if len(inside) == wanted:
+                        break
+            found += sorted(inside)
+        return found
+
+
+class LazyPlateIndex(PlateIndex):
+    """A PlateIndex whose known plates are read (from load()) on first search.
+
+    Plates added before then are queued; parked plates are kept as usual.
+    Used for parks opened from a snapshot or attached to a database, so
+    opening does not build the trigram lists of every plate on record.
+    """
+
+    def __init__(self, load):
+        self._parked = {}
+        self._load = load
+        self._pending = set()
+        self._building = threading.Lock()
+
+    def __getattr__(self, name):
+        # only called for missing attributes: the structures not built yet
+        if name not in ('_plates', '_blocks', '_maxes', '_grams') or '_building' not in self.__dict__:
+            raise AttributeError(name)
+        self.build()
+        return self.__dict__[name]
+
+    def build(self):
+        """Read the known plates now (e.g. while their source is still open)."""
+        with self._building:
+            if '_load' not in self.__dict__:
+                return
+            index = PlateIndex(chain(self._load(), self._pending))
+            # published together, so other threads never see half an index
+            self.__dict__.update(_plates=index._plates, _blocks=index._blocks, _maxes=index._maxes,
+                                 _grams=index._grams)
+            del self._load, self._pending
+
+    def known(self):
+        if '_load' in self.__dict__:
+            # not built yet: sort the plates without indexing them
+            with self._building:
+                if '_load' in self.__dict__:
+                    plates = {normalize(p) for p in chain(self._load(), self._pending)}
+                    plates.discard('')
+                    return iter(sorted(plates))
+        return PlateIndex.known(self)
+
+    def add(self, plate):
+        with self._building:
+            if '_load' in self.__dict__:
+                self._pending.add(plate)
+                return
+        PlateIndex.add(self, plate)
+
+    def add_many(self, plates):
+        with self._building:
+            if '_load' in self.__dict__:
+                self._pending.update(plates)
+                return
+        PlateIndex.add_many(self, plates)
@@ -1,38 +1,180 @@
+import threading
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+import archive
+import db
+import journal
+import rollups
+import snapshot
+from occupancy_index import OccupancyIndex
+from plate_index import LazyPlateIndex, PlateIndex
+from revenue_index import RevenueIndex, minute_of
+from records import TransactionLog
+from spot_allocator import FreeSpotAllocator
+
+# how many entries of the shared change log to keep for lagging readers
+CHANGE_LOG_KEEP = 10000
+# PRAGMA user_version of the database layout written by this module:
+#   0 - occupancy stored as a JSON blob in carpark_state.parked_cars
+#   1 - occupancy stored one row per spot in parked_spots
+#   2 - transactions_fts full-text index over transaction plates/comments
+#   3 - rollup_daily / rollup_hourly report totals
+#   4 - arrivals per rollup bucket (the cars carried into the next ones)
+SCHEMA_VERSION = 4
+# save_to_file layout: a header line, then one JSON object per line
+FILE_FORMAT = 'carpark-ndjson'
+FILE_VERSION = 1
+# load_from_db(snapshot=...): rewrite the snapshot once it is this many
+# change-log entries behind (at load, and as the park commits changes), so
+# a restart replays at most about that many
+SNAPSHOT_REFRESH_CHANGES = 1000
+# longest stay remove_car(hours_override=...) accepts; longer ones are cut
+MAX_OVERRIDE_HOURS = 24 * 366
+
+
+def _atomic(method):
+    """Run a mutating CarPark method as one DB transaction on fresh state."""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.batch():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
 class CarPark:
     def __init__(self, capacity):
         self.capacity = capacity
         self.parked_cars = {}
         # parked_cars maps spot -> { 'plate': str, 'time_in': iso str }
         self.parked_cars = {}
-        # transactions: list of dicts with spot, plate, time_in, time_out, amount, paid
-        self.transactions = []
+        # free spots, kept in step with parked_cars (lowest spot first)
+        self._free_spots = FreeSpotAllocator(capacity)
+        # transactions: columnar log of records with spot, plate, time_in,
+        # time_out, amount, paid (see records.py); rows read like dicts
+        self.transactions = TransactionLog()
+        # spot -> id of its latest transaction, and of its latest open one
+        # (no time_out yet); see latest_transaction / open_transaction
+        self._latest_tx = {}
+        self._open_tx = {}
+        # parked plate -> spot, and every plate seen, for search_plates
+        self.plates = PlateIndex()
+        # per-day/hour report totals of a park without a database (attached
+        # parks keep them in the rollup tables); see report
+        self._rollups = rollups.Rollups()
+        # revenue per minute of all history, for revenue_between; None (built
+        # on next use) when another process edited a transaction this park no
+        # longer holds, or after opening a snapshot
+        self._revenue = RevenueIndex()
+        # stays of all history, for parked_at / peak_occupancy; built on
+        # first use and dropped whenever another process changed the park
+        self._occupancy = None
         # rate per hour for computing amount
         self.rate_per_hour = 2.0
         # timezone for timestamps (uses system local timezone)
         from datetime import datetime
         # Get local timezone by using current time
         self.tz = datetime.now().astimezone().tzinfo
+        # write-through persistence (see attach_db); None means memory only
+        self.db_path = None
+        self._db = None
+        # attach_db(durable=True): commits are fsynced in groups (journal.py)
+        self._journal = None
+        # load_from_db(snapshot=...): the snapshot kept as a checkpoint of
+        # this state, and the version it was last written at
+        self.snapshot_path = None
+        self._snapshot_version = 0
+        self._batch_depth = 0
+        self._lock = threading.RLock()
+        # thread running the outermost batch, if any (see _read)
+        self._writer = None
+        # last entry of the shared change log reflected in memory; memory-only
+        # parks number their changes themselves and keep the recent ones
+        self.version = 0
+        self._changes = deque(maxlen=CHANGE_LOG_KEEP)
+        self._data_version = None
+        # bounded history (attached parks only): keep at most the last
+        # history_limit transactions and/or those of the last history_days
+        # days in self.transactions; older ones stay in SQLite (iter_history)
+        self.history_limit = None
+        self.history_days = None
 
+    @_atomic
     def park_car(self, license_plate):
-        if len(self.parked_cars) < self.capacity:
-            # choose the lowest available spot between 1..capacity
-            for spot in range(1, self.capacity + 1):
-                if spot not in self.parked_cars:
-                    from datetime import datetime
-                    now = datetime.now(self.tz).isoformat()
-                    self.parked_cars[spot] = {'plate': license_plate, 'time_in': now, 'comments': ''}
-                    print(f"✓ Car {license_plate} parked at spot {spot}")
-                    return True
-            # fallback (shouldn't happen): no spot found
-            print("✗ Car park is full!")
-            return False
-        else:
+        spot = self._park(license_plate)
+        if spot is None:
             print("✗ Car park is full!")
             return False
+        print(f"✓ Car {license_plate} parked at spot {spot}")
+        return True
+
+    @_atomic
+    def park_many(self, plates):
+        """Park each plate in turn, all in one transaction.
 
+        Returns the spot of each plate, in order, or None where the park
+        was full. For bursts from gate controllers: one lock, one commit.
+        """
+        return [self._park(plate) for plate in plates]
+
+    def _park(self, license_plate):
+        if len(self.parked_cars) >= self.capacity:
+            return None
+        # choose the lowest available spot between 1..capacity
+        spot = self._next_free_spot()
+        if spot is None:
+            # fallback (shouldn't happen): no spot found
+            return None
+        from datetime import datetime
+        now = datetime.now(self.tz).isoformat()
+        self.parked_cars[spot] = {'plate': license_plate, 'time_in': now, 'comments': ''}
+        self.plates.park(license_plate, spot)
+        if self._db is not None:
+            self._write_spot(spot)
+        if self._occupancy is not None:
+            self._occupancy.arrive(spot, license_plate, now)
+        self._rollup(now, arrivals=1, occupancy=len(self.parked_cars))
+        self._log_change('park', spot=spot)
+        return spot
+
+    @_atomic
     def remove_car(self, spot, *, hours_override=None, amount_override=None):
+        transaction = self._remove(spot, hours_override, amount_override)
+        if transaction is None:
+            print("✗ Invalid spot number")
+            return False
+        print(f"✓ Car {transaction['plate']} removed from spot {spot}")
+        return transaction
+
+    @_atomic
+    def remove_many(self, spots):
+        """Remove the car from each spot in turn, all in one transaction.
+
+        Returns the transaction of each removal, in order, or None where
+        the spot was empty (or None itself).
+        """
+        return [self._remove(spot) for spot in spots]
+
+    def find_plate(self, license_plate):
+        """The spot a plate is parked at (case-insensitive), or None."""
+        return self.plates.spot(license_plate)
+
+    def search_plates(self, query, limit=20):
+        """Plates parked now or seen in any transaction that match query.
+
+        Exact and prefix matches first, then plates containing query (3+
+        characters); see PlateIndex.search. Returns [{'plate', 'spot'}],
+        spot being None for plates not parked now.
+        """
+        return [{'plate': plate, 'spot': self.plates.spot(plate)}
+                for plate in self.plates.search(query, limit)]
+
+    def _remove(self, spot, hours_override=None, amount_override=None):
         if spot in self.parked_cars:
             rec = self.parked_cars.pop(spot)
+            self._free_spots.release(spot)
+            self.plates.unpark(rec.get('plate'), spot)
             plate = rec.get('plate')
             time_in_str = rec.get('time_in')
             from datetime import datetime
@@ -42,7 +184,7 @@ class CarPark:
             hours = None
             if hours_override is not None:
                 try:
-                    hours = max(float(hours_override), 0.0)
+                    hours = min(max(float(hours_override), 0.0), MAX_OVERRIDE_HOURS)
                 except Exception:
                     hours = None
 
@@ -78,24 +220,144 @@ class CarPark:
                 'paid': False,
                 'comments': rec.get('comments', ''),
             }
-            self.transactions.append(transaction)
-            print(f"✓ Car {plate} removed from spot {spot}")
+            if self._db is not None:
+                self._insert_transaction(transaction)
+            else:
+                transaction['id'] = self.transactions.max_id() + 1
+            transaction = self.transactions.append(transaction)
+            self._index_transaction(transaction)
+            self._rollup_transaction(transaction)
+            self._revenue_transaction(transaction)
+            if self._occupancy is not None:
+                self._occupancy.depart(spot, transaction)
+            if self._db is not None:
+                self._write_spot(spot)
+            self._log_change('remove', spot=spot, tx_id=transaction['id'])
+            self._trim_history()
             return transaction
-        else:
-            print("✗ Invalid spot number")
-            return False
+        return None
+
+    def _next_free_spot(self):
+        """Take the lowest free spot from the allocator, or None when full."""
+        spot = self._free_spots.acquire()
+        # parked_cars may have been edited directly; skip anything taken
+        while spot is not None and spot in self.parked_cars:
+            spot = self._free_spots.acquire()
+        if spot is None and len(self.parked_cars) < self.capacity:
+            # allocator lost track of a freed spot; resync and retry once
+            self._rebuild_free_spots()
+            spot = self._free_spots.acquire()
+        return spot
+
+    def _rebuild_free_spots(self):
+        self._free_spots = FreeSpotAllocator(self.capacity, self.parked_cars.keys())
 
+    @_atomic
     def update_comments(self, spot, comments):
         if spot not in self.parked_cars:
             return False
         self.parked_cars[spot]['comments'] = comments or ''
         # also update the latest open transaction if any
-        for tx in reversed(self.transactions):
-            if tx.get('spot') == spot and not tx.get('time_out'):
-                tx['comments'] = comments or ''
-                break
+        open_tx = self.open_transaction(spot)
+        if open_tx is not None:
+            open_tx['comments'] = comments or ''
+        if self._db is not None:
+            self._write_spot(spot)
+            if open_tx is not None:
+                self._update_transaction_row(open_tx)
+        self._log_change('comment', spot=spot, tx_id=open_tx.get('id') if open_tx else None)
         return True
 
+    @_atomic
+    def update_transaction(self, tx, *, amount=None, paid=None, comments=None):
+        """Edit a recorded transaction and write the change through to the DB.
+
+        Raises ValueError for a transaction of an archived month (see
+        archive.py): those are read-only.
+        """
+        before = self._stored_transaction(tx)
+        if self._db is not None and archive.is_closed(self._db, (before or tx).get('time_out')):
+            raise ValueError(f"transaction {tx.get('id')} is archived and cannot be changed")
+        if amount is not None:
+            tx['amount'] = round(float(amount), 2)
+        if paid is not None:
+            tx['paid'] = bool(paid)
+        if comments is not None:
+            tx['comments'] = comments
+        if tx.get('id'):
+            # tx may be a copy returned by query_transactions
+            mem = self._find_transaction(tx['id'])
+            if mem is not None:
+                mem.update(amount=tx.get('amount'), paid=tx.get('paid'), comments=tx.get('comments', ''))
+        if self._db is not None:
+            self._update_transaction_row(tx)
+        if before is not None:
+            self._rollup_transaction(before, -1)
+            self._revenue_transaction(before, -1)
+        self._rollup_transaction(tx)
+        self._revenue_transaction(tx)
+        self._log_change('transaction', spot=tx.get('spot'), tx_id=tx.get('id'))
+        return tx
+
+    def _stored_transaction(self, tx):
+        """A copy of tx as currently stored (the DB row when attached), or None."""
+        if not tx.get('id'):
+            return None
+        if self._db is not None:
+            row = self._db.execute('SELECT id, spot, plate, time_in, time_out, amount, paid, comments '
+                                   'FROM transactions WHERE id = ?', (tx['id'],)).fetchone()
+            return self._row_to_transaction(row) if row else None
+        mem = self._find_transaction(tx['id'])
+        return dict(mem) if mem is not None else None
+
+    @_atomic
+    def mark_paid(self, tx_ids, paid=True):
+        """Set paid on many transactions at once; returns how many exist.
+
+        On an attached park this is a single UPDATE whatever the number of
+        ids (they are passed as one JSON array), plus one insert into the
+        change log. Transactions of archived months are read-only and are
+        neither changed nor counted.
+        """
+        import json
+        ids = sorted({int(i) for i in tx_ids})
+        if ids and self._db is not None:
+            ids = archive.writable_ids(self._db, json.dumps(ids))
+        if not ids:
+            return 0
+        flag = bool(paid)
+        found = []
+        for tx_id in ids:
+            tx = self._find_transaction(tx_id)
+            if tx is not None:
+                if self._db is None and bool(tx['paid']) != flag and tx.get('time_out'):
+                    amount = rollups.cents(tx.get('amount'))
+                    self._rollup(tx['time_out'], paid_cents=amount if flag else -amount)
+                tx['paid'] = flag
+                found.append(tx)
+        if self._db is None:
+            for tx in found:
+                self._log_change('transaction', spot=tx.get('spot'), tx_id=tx['id'])
+            count = len(found)
+        else:
+            id_list = json.dumps(ids)
+            rollups.add_paid_sql(self._db, id_list, flag)
+            count = self._db.execute('UPDATE transactions SET paid = ? WHERE id IN (SELECT value FROM json_each(?))',
+                                     (1 if flag else 0, id_list)).rowcount
+            previous = self.version
+            self._db.execute("INSERT INTO changes (kind, spot, tx_id) SELECT 'transaction', spot, id FROM transactions "
+                             'WHERE id IN (SELECT value FROM json_each(?)) ORDER BY id', (id_list,))
+            self.version = self._db.execute('SELECT MAX(version) FROM changes').fetchone()[0] or 0
+            self._prune_changes(previous)
+        return count
+
+    @_atomic
+    def set_rate(self, rate):
+        self.rate_per_hour = float(rate)
+        if self._db is not None:
+            self._write_settings()
+        self._log_change('rate')
+
     def view_cars(self):
         if not self.parked_cars:
             print("Car park is empty")
@@ -113,41 +375,190 @@ class CarPark:
         return {
             'capacity': self.capacity,
             'parked_cars': {str(k): v for k, v in self.parked_cars.items()},
-            'transactions': self.transactions,
+            'transactions': [dict(tx) for tx in self._all_transactions()],
             'rate_per_hour': self.rate_per_hour,
         }
 
     @classmethod
     def from_dict(cls, data):
-        cap = int(data.get('capacity', 0))
-        obj = cls(cap)
         parked = data.get('parked_cars', {})
         # keys may be strings when loaded from JSON
-        obj.parked_cars = {int(k): v for k, v in parked.items()}
-        obj.transactions = data.get('transactions', [])
-        obj.rate_per_hour = float(data.get('rate_per_hour', obj.rate_per_hour))
+        return cls._from_records(data.get('capacity', 0), data.get('rate_per_hour'),
+                                 {int(k): v for k, v in parked.items()}, data.get('transactions', []))
+
+    @classmethod
+    def _from_records(cls, capacity, rate_per_hour, parked_cars, transactions):
+        """A memory-only park. transactions may be a generator, which may
+        also fill in parked_cars as it goes (see load_from_file)."""
+        obj = cls(int(capacity or 0))
+        obj.transactions = TransactionLog(transactions)
+        obj.parked_cars = parked_cars
+        obj._rebuild_free_spots()
+        obj.plates.set_parked(obj.parked_cars)
+        # files written before ids were kept get them now, and keep them
+        obj._assign_missing_ids()
+        obj._reindex_transactions()
+        obj._rollups = rollups.compute(obj.transactions, obj.parked_cars)
+        obj._revenue = None
+        obj._revenue_index()
+        if rate_per_hour is not None:
+            obj.rate_per_hour = float(rate_per_hour)
         return obj
 
-    def save_to_file(self, path):
+    def file_lines(self):
+        """The park in the save_to_file format, one line (no newline) at a time.
+
+        A header object comes first (format, version, capacity,
+        rate_per_hour), then one object per parked car ("kind": "car", with
+        its spot) and one per transaction ("kind": "transaction"). Only the
+        current line is ever built, so memory does not grow with history.
+        """
         import json
-        with open(path, 'w', encoding='utf-8') as f:
-            json.dump(self.to_dict(), f, indent=2)
+        yield json.dumps({'format': FILE_FORMAT, 'version': FILE_VERSION,
+                          'capacity': self.capacity, 'rate_per_hour': self.rate_per_hour})
+        for spot in sorted(self.parked_cars):
+            yield json.dumps(dict(self.parked_cars[spot], kind='car', spot=spot))
+        for tx in self._all_transactions():
+            yield json.dumps(dict(tx, kind='transaction'))
+
+    def save_to_file(self, path):
+        """Write the park to path (see file_lines), atomically.
+
+        The lines go to a temporary file next to path, which is flushed to
+        disk and then renamed over it: a crash mid-save leaves the previous
+        file as it was, never a truncated one.
+        """
+        import os
+        tmp = f'{path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp, 'x', encoding='utf-8') as f:
+                for line in self.file_lines():
+                    f.write(line)
+                    f.write('\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
 
     @classmethod
     def load_from_file(cls, path):
+        """Read a park written by save_to_file, one line at a time.
+
+        A file in the older single-document layout (carpark.json) is
+        recognised by its first line and read whole, as before.
+        """
         import json
         with open(path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        return cls.from_dict(data)
+            first = f.readline()
+            try:
+                header = json.loads(first)
+            except ValueError:
+                header = None
+            if not isinstance(header, dict) or header.get('format') != FILE_FORMAT:
+                if isinstance(header, dict):
+                    # a legacy document written on one line
+                    return cls.from_dict(header)
+                f.seek(0)
+                return cls.from_dict(json.load(f))
+            if header.get('version', FILE_VERSION) > FILE_VERSION:
+                raise ValueError(f'{path}: file format version {header["version"]} is newer than this program')
+            parked_cars = {}
 
-    def save_to_db(self, db_path='carpark.db'):
-        """Save car park state to SQLite database."""
+            def transactions():
+                for number, line in enumerate(f, start=2):
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    kind = record.pop('kind', None)
+                    if kind == 'transaction':
+                        yield record
+                    elif kind == 'car':
+                        parked_cars[int(record.pop('spot'))] = record
+                    else:
+                        raise ValueError(f'{path}:{number}: unknown record kind {kind!r}')
+
+            return cls._from_records(header.get('capacity'), header.get('rate_per_hour'),
+                                     parked_cars, transactions())
+
+    def save_snapshot(self, path):
+        """Write the park to a binary snapshot file (see snapshot.py), atomically.
+
+        load_snapshot opens it in place; load_from_db(snapshot=...) starts
+        from it and catches up with the database through the change log.
+        """
+        with self._lock:
+            meta = {
+                'capacity': self.capacity,
+                'rate_per_hour': self.rate_per_hour,
+                'version': self.version,
+                'source': self.db_path,
+                'parked_cars': sorted(self.parked_cars.items()),
+                'latest_tx': list(self._latest_tx.items()),
+                'open_tx': list(self._open_tx.items()),
+            }
+            snapshot.write(path, meta, self.transactions, self.plates.known(),
+                           None if self._db is not None else self._rollups.buckets)
+
+    @classmethod
+    def load_snapshot(cls, path):
+        """A memory-only park from a file written by save_snapshot.
+
+        Only the header and the small state are read: transactions are read
+        from the mapped file as they are used (and copied into memory on
+        the first change), and plate search, report totals and the revenue
+        index are built on first use. Raises ValueError for a file that is
+        not a snapshot this version can read.
+        """
+        obj = cls(0)
+        obj._apply_snapshot(snapshot.read(path))
+        return obj
+
+    def _apply_snapshot(self, snap):
+        meta = snap.meta
+        self.capacity = meta['capacity']
+        self.rate_per_hour = meta['rate_per_hour']
+        self.parked_cars = {spot: rec for spot, rec in meta['parked_cars']}
+        self._rebuild_free_spots()
+        self.transactions = snap.log
+        self._latest_tx = dict(meta['latest_tx'])
+        self._open_tx = dict(meta['open_tx'])
+        self.plates = LazyPlateIndex(lambda: snap.known)
+        self.plates.set_parked(self.parked_cars)
+        # a snapshot of an attached park has none: its totals are in the tables
+        self._rollups = rollups.LazyRollups(
+            lambda: snap.rollups() or rollups.compute(self.transactions, self.parked_cars).buckets)
+        self._revenue = None
+        self._occupancy = None
+        self.version = meta['version']
+
+    def _open_snapshot(self, path, db_path):
+        """Take the state from the snapshot at path if it was written by a park
+        attached to db_path and is not ahead of it; False otherwise."""
+        import os
         import sqlite3
-        import json
-        conn = sqlite3.connect(db_path)
-        c = conn.cursor()
-        
-        # create tables if not exist
+        try:
+            snap = snapshot.read(path)
+        except (OSError, ValueError):
+            return False
+        if snap.meta.get('source') != os.path.abspath(db_path):
+            return False
+        try:
+            stored = db.connection(db_path).execute('SELECT MAX(version) FROM changes').fetchone()[0] or 0
+        except sqlite3.OperationalError:
+            return False
+        if stored < snap.meta['version']:
+            # not this database's history (replaced or restored since)
+            return False
+        self._apply_snapshot(snap)
+        self._snapshot_version = self.version
+        return True
+
+    # ------------------------------------------------------------------ SQLite
+    @staticmethod
+    def _create_tables(c):
         c.execute('''CREATE TABLE IF NOT EXISTS carpark_state (
             id INTEGER PRIMARY KEY,
             capacity INTEGER,
@@ -156,6 +567,15 @@ class CarPark:
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )''')
         
+        # current occupancy, one row per occupied spot
+        c.execute('''CREATE TABLE IF NOT EXISTS parked_spots (
+            spot INTEGER PRIMARY KEY,
+            plate TEXT NOT NULL,
+            time_in TEXT,
+            comments TEXT DEFAULT ''
+        )''')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_parked_spots_plate ON parked_spots (plate)')
+
         c.execute('''CREATE TABLE IF NOT EXISTS transactions (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             spot INTEGER,
@@ -167,72 +587,1047 @@ class CarPark:
             comments TEXT DEFAULT '',
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )''')
-        
+        # history lookups (see query_transactions); time_out is local ISO
+        # time, so its first 10 characters are the local date
+        c.execute('CREATE INDEX IF NOT EXISTS idx_transactions_plate ON transactions (plate COLLATE NOCASE)')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_transactions_spot ON transactions (spot)')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_transactions_day ON transactions (substr(time_out, 1, 10))')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_transactions_paid ON transactions (paid)')
+        CarPark._create_fts(c)
+        rollups.create_tables(c)
+        archive.create_catalog(c)
+
+        # one row per committed operation; readers in other processes use
+        # it to apply just what changed (see refresh)
+        c.execute('''CREATE TABLE IF NOT EXISTS changes (
+            version INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            spot INTEGER,
+            tx_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''')
+
+    @staticmethod
+    def _create_fts(c):
+        """Full-text index over transaction plates and comments (search_transactions).
+
+        An external-content FTS5 table: it stores only the index, and the
+        triggers keep it in step with every write to transactions, from
+        any process. Skipped when SQLite was built without FTS5;
+        search_transactions then scans instead.
+        """
+        import sqlite3
+        try:
+            c.execute("CREATE VIRTUAL TABLE IF NOT EXISTS transactions_fts USING fts5("
+                      "plate, comments, content='transactions', content_rowid='id', "
+                      "tokenize='unicode61 remove_diacritics 2')")
+        except sqlite3.OperationalError:
+            return
+        c.execute('''CREATE TRIGGER IF NOT EXISTS transactions_fts_insert AFTER INSERT ON transactions BEGIN
+            INSERT INTO transactions_fts (rowid, plate, comments) VALUES (new.id, new.plate, new.comments);
+        END''')
+        c.execute('''CREATE TRIGGER IF NOT EXISTS transactions_fts_delete AFTER DELETE ON transactions BEGIN
+            INSERT INTO transactions_fts (transactions_fts, rowid, plate, comments)
+            VALUES ('delete', old.id, old.plate, old.comments);
+        END''')
+        # only when the indexed text changes (not for amount/paid updates)
+        c.execute('''CREATE TRIGGER IF NOT EXISTS transactions_fts_update AFTER UPDATE OF plate, comments ON transactions
+        WHEN old.plate IS NOT new.plate OR old.comments IS NOT new.comments BEGIN
+            INSERT INTO transactions_fts (transactions_fts, rowid, plate, comments)
+            VALUES ('delete', old.id, old.plate, old.comments);
+            INSERT INTO transactions_fts (rowid, plate, comments) VALUES (new.id, new.plate, new.comments);
+        END''')
+
+    @staticmethod
+    def _migrate(c):
+        """Bring a database written by an older version up to SCHEMA_VERSION."""
+        import json
+        version = c.execute('PRAGMA user_version').fetchone()[0]
+        if version < 1:
+            # move the occupancy JSON blob into parked_spots
+            row = c.execute('SELECT parked_cars FROM carpark_state ORDER BY created_at DESC LIMIT 1').fetchone()
+            try:
+                parked = json.loads(row[0]) if row and row[0] else {}
+            except Exception:
+                parked = {}
+            c.execute('DELETE FROM parked_spots')
+            c.executemany('INSERT INTO parked_spots (spot, plate, time_in, comments) VALUES (?, ?, ?, ?)',
+                          [(int(k), v.get('plate') or '', v.get('time_in'), v.get('comments', ''))
+                           for k, v in parked.items()])
+            c.execute('UPDATE carpark_state SET parked_cars = NULL')
+        if version < 2 and c.execute("SELECT 1 FROM sqlite_master WHERE name = 'transactions_fts'").fetchone():
+            # index the transactions written before the triggers existed
+            c.execute("INSERT INTO transactions_fts (transactions_fts) VALUES ('rebuild')")
+        if version < 3:
+            txs = [dict(zip(('time_in', 'time_out', 'amount', 'paid'), row))
+                   for row in c.execute('SELECT time_in, time_out, amount, paid FROM transactions')]
+            parked = {spot: {'time_in': time_in}
+                      for spot, time_in in c.execute('SELECT spot, time_in FROM parked_spots')}
+            rollups.write_sql(c, rollups.compute(txs, parked))
+        elif version < 4:
+            rollups.add_arrivals_sql(c)
+        c.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+    def _write_full(self, c, totals):
+        """Replace everything stored in the database with the in-memory state.
+
+        totals is the park's Rollups, stored as they are: peaks cannot be
+        recounted from the transactions exactly.
+        """
         # clear and insert current state
         c.execute('DELETE FROM carpark_state')
-        parked_cars_json = json.dumps({str(k): v for k, v in self.parked_cars.items()})
-        c.execute('INSERT INTO carpark_state (capacity, rate_per_hour, parked_cars) VALUES (?, ?, ?)',
-                  (self.capacity, self.rate_per_hour, parked_cars_json))
-        
-        # clear and insert transactions
+        c.execute('INSERT INTO carpark_state (capacity, rate_per_hour) VALUES (?, ?)',
+                  (self.capacity, self.rate_per_hour))
+        c.execute('DELETE FROM parked_spots')
+        c.executemany('INSERT INTO parked_spots (spot, plate, time_in, comments) VALUES (?, ?, ?, ?)',
+                      [(spot, rec.get('plate') or '', rec.get('time_in'), rec.get('comments', ''))
+                       for spot, rec in self.parked_cars.items()])
+        c.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+        # clear and insert transactions, keeping ids that were already assigned
         c.execute('DELETE FROM transactions')
-        for tx in self.transactions:
-            c.execute('INSERT INTO transactions (spot, plate, time_in, time_out, amount, paid, comments) VALUES (?, ?, ?, ?, ?, ?, ?)',
-                      (tx.get('spot'), tx.get('plate'), tx.get('time_in'), tx.get('time_out'), 
+        self._assign_missing_ids()
+        for tx in self._all_transactions():
+            c.execute('INSERT INTO transactions (id, spot, plate, time_in, time_out, amount, paid, comments) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                      (tx.get('id'), tx.get('spot'), tx.get('plate'), tx.get('time_in'), tx.get('time_out'),
                        tx.get('amount'), 1 if tx.get('paid') else 0, tx.get('comments', '')))
-        
-        conn.commit()
-        conn.close()
 
-    @classmethod
-    def load_from_db(cls, db_path='carpark.db'):
-        """Load car park state from SQLite database."""
+        rollups.write_sql(c, totals)
+        # the archived months belonged to the history this state replaces
+        # (a bounded attached park wrote them out above); the caller removes
+        # their files once this commits, see archive.remove_unlisted
+        c.execute('DELETE FROM archive_months')
+
+        # tell readers of this file to reload everything
+        return c.execute("INSERT INTO changes (kind) VALUES ('reset')").lastrowid
+
+    def save_to_db(self, db_path='carpark.db'):
+        """Save car park state to SQLite database."""
+        import os
+        if self._db is not None and os.path.abspath(db_path) == self.db_path:
+            # write-through mode: every change is already committed
+            return
+        conn = db.connect(db_path)
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            # create tables if not exist
+            self._create_tables(conn)
+            self._migrate(conn)
+            self._write_full(conn, self._rollup_snapshot())
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+        archive.remove_unlisted(db_path)
+
+    def attach_db(self, db_path='carpark.db', sync=True, durable=False):
+        """Switch to write-through persistence against db_path.
+
+        From here on park_car, remove_car, update_comments, update_transaction
+        and set_rate write only the rows they touch, each in one small
+        transaction (or grouped with batch()). With sync=True the database is
+        first overwritten with the current in-memory state, like save_to_db.
+        With durable=True each of them returns only once its commit is on
+        disk, fsynced together with those of other threads (see journal.py).
+        """
+        import os
+        self.detach_db()
+        # the park's own writer connection, used under self._lock from any
+        # thread; transactions are opened explicitly in batch()
+        conn = db.connect(db_path, check_same_thread=False)
+        with self._lock:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._create_tables(conn)
+                self._migrate(conn)
+            except BaseException:
+                conn.execute('ROLLBACK')
+                conn.close()
+                raise
+            conn.execute('COMMIT')
+            if sync:
+                # before self._db is set: the history written out is this
+                # park's own (self.transactions), not the target's rows; and
+                # not batch(), that would first pull the stored state in
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    # self._rollups: this park's totals until it is attached
+                    self.version = self._write_full(conn, self._rollups)
+                except BaseException:
+                    conn.execute('ROLLBACK')
+                    conn.close()
+                    raise
+                conn.execute('COMMIT')
+            self._db = conn
+        if sync:
+            archive.remove_unlisted(db_path)
+        self.db_path = os.path.abspath(db_path)
+        self._journal = journal.GroupCommit(self.db_path) if durable else None
+        if sync:
+            self._data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+        else:
+            # catch up with anything committed since the state was read
+            self._data_version = None
+            self.refresh()
+
+    def detach_db(self):
+        """Stop write-through persistence and close the connection."""
+        with self._lock:
+            if self._db is not None:
+                # carry on from the stored totals (and plates) in memory
+                self._load_rollups(self._db)
+                if isinstance(self.plates, LazyPlateIndex):
+                    self.plates.build()
+                self._db.close()
+            self._db = None
+            self.db_path = None
+            self._journal = None
+            self.snapshot_path = None
+
+    @contextmanager
+    def batch(self):
+        """Group several operations into one database commit.
+
+        Nested batches join the outermost one. If the block raises, the
+        database changes are rolled back; in-memory state is left as is.
+        """
+        committed = False
+        with self._lock:
+            outer = self._batch_depth == 0 and self._db is not None
+            if outer:
+                self._db.execute('BEGIN IMMEDIATE')
+                try:
+                    # holding the write lock now; apply other writers' changes
+                    self.refresh()
+                except BaseException:
+                    self._db.execute('ROLLBACK')
+                    raise
+                self._writer = threading.get_ident()
+            self._batch_depth += 1
+            try:
+                yield self
+            except BaseException:
+                self._batch_depth -= 1
+                if outer:
+                    self._writer = None
+                    self._db.execute('ROLLBACK')
+                raise
+            self._batch_depth -= 1
+            if outer:
+                self._writer = None
+                self._db.execute('COMMIT')
+                committed = True
+        if committed:
+            # outside the lock, so other threads can commit meanwhile and
+            # share the fsync
+            self._committed()
+
+    def _committed(self):
+        """After batch() committed: wait until the commit is on disk (durable
+        parks) and keep the snapshot checkpoint recent."""
+        if self._journal is not None:
+            self._journal.sync()
+        if self.snapshot_path is not None and self.version - self._snapshot_version >= SNAPSHOT_REFRESH_CHANGES:
+            self._save_checkpoint()
+
+    def _save_checkpoint(self):
+        with self._lock:
+            self._snapshot_version = self.version
+            try:
+                self.save_snapshot(self.snapshot_path)
+            except OSError:
+                # only a head start for the next load
+                pass
+
+    def _reader(self):
+        """Connection for read-only queries against the attached database.
+
+        This thread's pooled connection rather than the writer, so history
+        reads neither wait for the park lock nor hold it (with WAL they see
+        the last commit). Inside this thread's own batch it is the writer,
+        so its uncommitted rows are visible.
+        """
+        if self._writer == threading.get_ident():
+            return self._db
+        return db.connection(self.db_path)
+
+    def _read(self, sql, params=()):
+        """Rows of a read-only query against the attached database (see _reader)."""
+        return self._reader().execute(sql, params).fetchall()
+
+    def refresh(self):
+        """Apply changes other processes committed to the attached database.
+
+        The check is a single PRAGMA data_version when nothing changed.
+        Otherwise only the change-log entries newer than self.version are
+        read and the touched rows reloaded; a reset (or a gap left by
+        pruning) reloads everything. Returns True if anything was applied.
+        """
+        if self._db is None:
+            return False
+        with self._lock:
+            data_version = self._db.execute('PRAGMA data_version').fetchone()[0]
+            if data_version == self._data_version:
+                return False
+            self._data_version = data_version
+            rows = self._db.execute('SELECT version, kind, spot, tx_id FROM changes WHERE version > ? ORDER BY version',
+                                    (self.version,)).fetchall()
+            if not rows:
+                return False
+            if rows[0][0] != self.version + 1 or any(kind == 'reset' for _, kind, _, _ in rows):
+                self._load_state(self._db, attached=True)
+                return True
+            self._occupancy = None
+
+            tx_ids = []
+            spots = set()
+            for version, kind, spot, tx_id in rows:
+                if kind == 'rate':
+                    self._load_settings(self._db)
+                elif spot is not None and kind in ('park', 'remove', 'comment'):
+                    spots.add(spot)
+                if tx_id is not None:
+                    tx_ids.append(tx_id)
+            for spot in sorted(spots):
+                self.load_spot(spot)
+            if tx_ids:
+                self._load_transactions(self._db, sorted(set(tx_ids)))
+            self.version = rows[-1][0]
+            return True
+
+    def _log_change(self, kind, spot=None, tx_id=None):
+        if self._db is None:
+            # memory only: the same log, kept in a bounded deque
+            self.version += 1
+            self._changes.append((self.version, kind, spot, tx_id))
+            return
+        previous = self.version
+        cur = self._db.execute('INSERT INTO changes (kind, spot, tx_id) VALUES (?, ?, ?)', (kind, spot, tx_id))
+        self.version = cur.lastrowid
+        self._prune_changes(previous)
+
+    def _rollup(self, when, **deltas):
+        """Add to the report totals of the day and hour of `when` (see rollups.py)."""
+        if self._db is not None:
+            rollups.add_sql(self._db, when, **deltas)
+        else:
+            self._rollups.add(when, **deltas)
+
+    def _rollup_transaction(self, tx, sign=1):
+        added = rollups.contribution(tx)
+        if added is not None:
+            self._rollup(tx['time_out'], **{field: sign * value for field, value in added.items()})
+
+    def _revenue_transaction(self, tx, sign=1):
+        if self._revenue is not None and tx.get('time_out'):
+            self._revenue.add(tx['time_out'], sign * rollups.cents(tx.get('amount')), sign)
+
+    def _history_plates(self, conn=None):
+        """Every plate in the live and archived transactions (some twice)."""
+        return (plate for (plate,) in archive.iter_rows(
+            conn or self._reader(), 'SELECT DISTINCT plate FROM transactions', by_id=False))
+
+    @staticmethod
+    def _load_revenue(conn):
+        return RevenueIndex((time_out, rollups.cents(amount)) for _, time_out, amount in archive.iter_rows(
+            conn, 'SELECT id, time_out, amount FROM transactions WHERE time_out IS NOT NULL'))
+
+    def _rollup_snapshot(self, conn=None):
+        """The report totals as a Rollups object (read from the tables when attached)."""
+        if self._db is None and conn is None:
+            return self._rollups
+        conn = conn or self._reader()
+        return rollups.Rollups.from_rows({period: rollups.rows_sql(conn, period) for period in rollups.PERIODS})
+
+    def _load_rollups(self, conn):
         import sqlite3
-        import json
+        try:
+            self._rollups = self._rollup_snapshot(conn)
+        except sqlite3.OperationalError:
+            # file written before the rollup tables: count what is in memory
+            self._rollups = rollups.compute(self.transactions, self.parked_cars)
+
+    def _prune_changes(self, previous):
+        # once every 1000 versions
+        if self.version // 1000 > previous // 1000:
+            self._db.execute('DELETE FROM changes WHERE version <= ?', (self.version - CHANGE_LOG_KEEP,))
+
+    def changes_since(self, version):
+        """Change-log entries (version, kind, spot, tx_id) after version, oldest first.
+
+        Returns None when they can no longer all be listed (pruned, a
+        reset, or a version this park never had); reload everything then.
+        """
+        if version == self.version:
+            return []
+        if version > self.version:
+            return None
+        if self._db is None:
+            entries = [c for c in self._changes if c[0] > version]
+        else:
+            entries = self._read('SELECT version, kind, spot, tx_id FROM changes '
+                                 'WHERE version > ? AND version <= ? ORDER BY version',
+                                 (version, self.version))
+        if not entries or entries[0][0] != version + 1 or any(c[1] == 'reset' for c in entries):
+            return None
+        return entries
+
+    def _find_transaction(self, tx_id):
+        return self.transactions.find(tx_id)
+
+    def get_transaction(self, tx_id):
+        """The transaction with this id, or None.
+
+        In-memory records are returned as is; on an attached park a record
+        outside the history window is read from SQLite, or from the
+        archived month holding it (as a copy).
+        """
+        tx = self._find_transaction(tx_id)
+        if tx is None and self._db is not None:
+            rows = archive.select(self._reader(), 'SELECT id, spot, plate, time_in, time_out, amount, paid, comments '
+                                  'FROM transactions WHERE id = ?', (tx_id,),
+                                  keep=lambda s: s.min_id <= tx_id <= s.max_id)
+            if rows:
+                tx = self._row_to_transaction(rows[0])
+        return tx
+
+    def latest_transaction(self, spot):
+        """The most recent in-memory transaction for a spot, or None."""
+        tx_id = self._latest_tx.get(spot)
+        return self._find_transaction(tx_id) if tx_id else None
+
+    def open_transaction(self, spot):
+        """The latest in-memory transaction for a spot with no time_out, or None."""
+        tx_id = self._open_tx.get(spot)
+        return self._find_transaction(tx_id) if tx_id else None
+
+    def _index_transaction(self, tx):
+        self.plates.add(tx.get('plate'))
+        tx_id, spot = tx.get('id'), tx.get('spot')
+        if not tx_id:
+            return
+        if tx_id >= self._latest_tx.get(spot, 0):
+            self._latest_tx[spot] = tx_id
+        if not tx.get('time_out'):
+            if tx_id >= self._open_tx.get(spot, 0):
+                self._open_tx[spot] = tx_id
+        elif self._open_tx.get(spot) == tx_id:
+            del self._open_tx[spot]
+
+    def _reindex_transactions(self):
+        self._latest_tx = {}
+        self._open_tx = {}
+        # in one go, so the per-row adds below find them known
+        self.plates.add_many(tx.get('plate') for tx in self.transactions)
+        for tx in self.transactions:
+            self._index_transaction(tx)
+
+    def _assign_missing_ids(self):
+        next_id = first = self.transactions.max_id() + 1
+        for tx in self.transactions:
+            if not tx.get('id'):
+                tx['id'] = next_id
+                next_id += 1
+        if next_id != first:
+            self._reindex_transactions()
+
+    def _write_settings(self):
+        with self.batch():
+            cur = self._db.execute('UPDATE carpark_state SET capacity = ?, rate_per_hour = ?',
+                                   (self.capacity, self.rate_per_hour))
+            if cur.rowcount == 0:
+                self._db.execute('INSERT INTO carpark_state (capacity, rate_per_hour) VALUES (?, ?)',
+                                 (self.capacity, self.rate_per_hour))
+
+    def _write_spot(self, spot):
+        """Store one spot's occupancy row (or delete it if the spot is free)."""
+        rec = self.parked_cars.get(spot)
+        if rec is None:
+            self._db.execute('DELETE FROM parked_spots WHERE spot = ?', (spot,))
+        else:
+            self._db.execute('INSERT OR REPLACE INTO parked_spots (spot, plate, time_in, comments) VALUES (?, ?, ?, ?)',
+                             (spot, rec.get('plate') or '', rec.get('time_in'), rec.get('comments', '')))
+
+    def load_spot(self, spot):
+        """Re-read one spot from the attached database; returns its record or None."""
+        if self._db is None:
+            return self.parked_cars.get(spot)
+        with self._lock:
+            row = self._db.execute('SELECT plate, time_in, comments FROM parked_spots WHERE spot = ?',
+                                   (spot,)).fetchone()
+            rec = self.parked_cars.get(spot)
+            if rec is not None:
+                self.plates.unpark(rec.get('plate'), spot)
+            if row is None:
+                if self.parked_cars.pop(spot, None) is not None:
+                    self._free_spots.release(spot)
+                return None
+            plate, time_in, comments = row
+            if rec is None:
+                rec = self.parked_cars[spot] = {}
+                self._free_spots.claim(spot)
+            rec.update({'plate': plate, 'time_in': time_in, 'comments': comments or ''})
+            self.plates.park(plate, spot)
+            return rec
+
+    def _insert_transaction(self, tx):
+        cur = self._db.execute(
+            'INSERT INTO transactions (spot, plate, time_in, time_out, amount, paid, comments) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (tx.get('spot'), tx.get('plate'), tx.get('time_in'), tx.get('time_out'),
+             tx.get('amount'), 1 if tx.get('paid') else 0, tx.get('comments', '')))
+        tx['id'] = cur.lastrowid
+
+    def _update_transaction_row(self, tx):
+        with self.batch():
+            if not tx.get('id'):
+                # not persisted yet (e.g. added to the list by hand)
+                self._insert_transaction(tx)
+                return
+            self._db.execute('UPDATE transactions SET amount = ?, paid = ?, comments = ? WHERE id = ?',
+                             (tx.get('amount'), 1 if tx.get('paid') else 0, tx.get('comments', ''), tx['id']))
+
+    @classmethod
+    def load_from_db(cls, db_path='carpark.db', write_through=False, history_limit=None, history_days=None,
+                     snapshot=None, durable=False):
+        """Load car park state from SQLite database.
+
+        With write_through=True the returned park stays attached to db_path
+        (see attach_db), and history_limit / history_days bound how many past
+        transactions are held in memory; the rest is read on demand through
+        iter_history.
+
+        snapshot (write_through only) is the path of a snapshot file of
+        db_path (see save_snapshot). If it holds a usable one, the park is
+        opened from it and only the changes committed since are read from
+        SQLite; otherwise everything is read and the snapshot (re)written.
+        The park then rewrites it whenever it falls SNAPSHOT_REFRESH_CHANGES
+        behind, so loading never replays many more changes than that.
+        durable is passed on to attach_db.
+        """
         import os
         
         if not os.path.exists(db_path):
             return None
         
-        conn = sqlite3.connect(db_path)
-        c = conn.cursor()
-        
-        # load state
-        c.execute('SELECT capacity, rate_per_hour, parked_cars FROM carpark_state ORDER BY created_at DESC LIMIT 1')
-        row = c.fetchone()
-        
-        if not row:
-            conn.close()
+        obj = cls(0)
+        if write_through:
+            obj.history_limit = history_limit
+            obj.history_days = history_days
+        opened = write_through and snapshot is not None and obj._open_snapshot(snapshot, db_path)
+        if opened:
+            obj.attach_db(db_path, sync=False, durable=durable)
+            obj._trim_history()
+        elif not obj._load_state(db.connection(db_path), attached=write_through):
             return None
-        
-        capacity, rate_per_hour, parked_cars_json = row
-        obj = cls(capacity)
-        obj.rate_per_hour = rate_per_hour
-        
-        # load parked cars
+        elif write_through:
+            obj.attach_db(db_path, sync=False, durable=durable)
+
+        if write_through and snapshot is not None:
+            obj.snapshot_path = snapshot
+            if not opened or obj.version - obj._snapshot_version >= SNAPSHOT_REFRESH_CHANGES:
+                obj._save_checkpoint()
+        return obj
+
+    def _load_state(self, conn, attached=False):
+        """Replace the in-memory state with the stored one; False if none is stored.
+
+        attached: the park is (or is about to be) attached to conn's
+        database, so the plates of past transactions can be read later.
+        """
+        import sqlite3
+        # read everything from one snapshot
+        began = not conn.in_transaction
+        if began:
+            conn.execute('BEGIN')
         try:
-            parked_dict = json.loads(parked_cars_json)
-            obj.parked_cars = {int(k): v for k, v in parked_dict.items()}
-        except Exception:
-            obj.parked_cars = {}
-        
-        # load transactions
-        c.execute('SELECT spot, plate, time_in, time_out, amount, paid, comments FROM transactions ORDER BY created_at ASC')
-        for row in c.fetchall():
-            spot, plate, time_in, time_out, amount, paid, comments = row
-            tx = {
-                'spot': spot,
-                'plate': plate,
-                'time_in': time_in,
-                'time_out': time_out,
-                'amount': amount,
-                'paid': bool(paid),
-                'comments': comments or ''
+            # load state (the file may only hold the users table so far)
+            try:
+                row = conn.execute('SELECT capacity FROM carpark_state ORDER BY created_at DESC LIMIT 1').fetchone()
+            except sqlite3.OperationalError:
+                row = None
+            if not row:
+                return False
+
+            self._load_settings(conn)
+            # every plate on record, for search (transactions may be a window);
+            # an attached park reads them on its first search, so a worker
+            # that never searches does not hold them all
+            if attached:
+                self.plates = LazyPlateIndex(self._history_plates)
+            else:
+                self.plates = PlateIndex(self._history_plates(conn))
+            self._load_parked_cars(conn)
+
+            # load transactions (only the recent window when history is bounded)
+            sql = 'SELECT id, spot, plate, time_in, time_out, amount, paid, comments FROM transactions'
+            params = []
+            if self.history_days is not None:
+                sql += ' WHERE substr(time_out, 1, 10) >= ?'
+                params.append(self._history_cutoff())
+            sql += ' ORDER BY id DESC LIMIT ?'
+            params.append(self.history_limit if self.history_limit is not None else -1)
+            rows = conn.execute(sql, params).fetchall()
+            rows.reverse()
+            self.transactions = TransactionLog(self._row_to_transaction(row) for row in rows)
+            self._reindex_transactions()
+            self._load_rollups(conn)
+            self._revenue = self._load_revenue(conn)
+            self._occupancy = None
+
+            try:
+                self.version = conn.execute('SELECT MAX(version) FROM changes').fetchone()[0] or 0
+            except sqlite3.OperationalError:
+                self.version = 0
+            return True
+        finally:
+            if began:
+                conn.execute('COMMIT')
+
+    def _load_settings(self, conn):
+        self.capacity, self.rate_per_hour = conn.execute(
+            'SELECT capacity, rate_per_hour FROM carpark_state ORDER BY created_at DESC LIMIT 1').fetchone()
+
+    def _load_parked_cars(self, conn):
+        import json
+        if conn.execute('PRAGMA user_version').fetchone()[0] >= 1:
+            self.parked_cars = {
+                spot: {'plate': plate, 'time_in': time_in, 'comments': comments or ''}
+                for spot, plate, time_in, comments in conn.execute(
+                    'SELECT spot, plate, time_in, comments FROM parked_spots')
             }
-            obj.transactions.append(tx)
-        
-        conn.close()
-        return obj
+        else:
+            # older file: occupancy is a JSON blob next to the settings
+            parked_cars_json = conn.execute(
+                'SELECT parked_cars FROM carpark_state ORDER BY created_at DESC LIMIT 1').fetchone()[0]
+            try:
+                parked_dict = json.loads(parked_cars_json)
+                self.parked_cars = {int(k): v for k, v in parked_dict.items()}
+            except Exception:
+                self.parked_cars = {}
+        self._rebuild_free_spots()
+        self.plates.set_parked(self.parked_cars)
+
+    def _load_transactions(self, conn, tx_ids):
+        """Reload the given transaction rows, merging them into self.transactions."""
+        for i in range(0, len(tx_ids), 500):
+            chunk = tx_ids[i:i + 500]
+            marks = ','.join('?' * len(chunk))
+            rows = conn.execute('SELECT id, spot, plate, time_in, time_out, amount, paid, comments FROM transactions '
+                                f'WHERE id IN ({marks}) ORDER BY id ASC', chunk).fetchall()
+            for row in rows:
+                fresh = self._row_to_transaction(row)
+                tx = self._find_transaction(fresh['id'])
+                if tx is not None:
+                    self._revenue_transaction(tx, -1)
+                    tx.update(fresh)
+                elif self.transactions and fresh['id'] < (self.transactions[-1].get('id') or 0):
+                    # ids only grow, so this row was trimmed from the window;
+                    # what it counted for before is unknown here
+                    self._revenue = None
+                    continue
+                else:
+                    tx = self.transactions.append(fresh)
+                self._revenue_transaction(tx)
+                self._index_transaction(tx)
+        self._trim_history()
+
+    # ------------------------------------------------------------------ bounded history
+    def _history_bounded(self):
+        return self._db is not None and (self.history_limit is not None or self.history_days is not None)
+
+    def _history_cutoff(self):
+        from datetime import datetime, timedelta
+        return (datetime.now(self.tz) - timedelta(days=self.history_days)).date().isoformat()
+
+    def _trim_history(self):
+        """Drop transactions that fell out of the in-memory window."""
+        if not self._history_bounded():
+            return
+        if self.history_limit is not None:
+            # trim in chunks so appends stay amortised O(1)
+            slack = max(self.history_limit // 10, 1)
+            if len(self.transactions) > self.history_limit + slack:
+                del self.transactions[:len(self.transactions) - max(self.history_limit, 1)]
+        if self.history_days is not None:
+            cutoff = self._history_cutoff()
+            drop = 0
+            for tx in self.transactions:
+                if (tx.get('time_out') or '')[:10] >= cutoff:
+                    break
+                drop += 1
+            # the newest row stays, however old: it is the one just added
+            # (a stay ended back in time by hours_override) and the caller
+            # is about to return it
+            drop = min(drop, len(self.transactions) - 1)
+            if drop > 0:
+                del self.transactions[:drop]
+
+    def iter_history(self, batch_size=500, newest_first=True, **filters):
+        """Yield every stored transaction, paging from SQLite batch_size rows at a time.
+
+        Takes the same filters as query_transactions. Memory use is one page,
+        however long the history is.
+        """
+        if self._db is None:
+            yield from self.query_transactions(newest_first=newest_first, **filters)
+            return
+        cursor = None
+        while True:
+            bound = {'before_id': cursor} if newest_first else {'after_id': cursor}
+            page = self.query_transactions(limit=batch_size, newest_first=newest_first, **filters, **bound)
+            yield from page
+            if len(page) < batch_size:
+                return
+            cursor = page[-1]['id']
+
+    def _all_transactions(self):
+        if self._history_bounded() or (self._db is not None and archive.segments(self._reader())):
+            return self.iter_history(newest_first=False)
+        return iter(self.transactions)
+
+    @staticmethod
+    def _row_to_transaction(row):
+        tx_id, spot, plate, time_in, time_out, amount, paid, comments = row
+        return {
+            'id': tx_id,
+            'spot': spot,
+            'plate': plate,
+            'time_in': time_in,
+            'time_out': time_out,
+            'amount': amount,
+            'paid': bool(paid),
+            'comments': comments or ''
+        }
+
+    # ------------------------------------------------------------------ history queries
+    def query_transactions(self, *, plate=None, plate_match='exact', spot=None, day=None,
+                           date_from=None, date_to=None, paid=None, before_id=None, after_id=None,
+                           limit=None, newest_first=False):
+        """Return transactions matching every given filter, in id order.
+
+        plate_match is 'exact', 'prefix' or 'contains' (all case-insensitive);
+        day, date_from and date_to are dates or 'YYYY-MM-DD' and match the
+        time_out date (the range is inclusive); before_id / after_id bound
+        the ids (exclusive) for paging. With an attached database the query
+        runs in SQLite on indexed columns, over the live table and the
+        archived months it can match (see archive.py), and returns fresh
+        dicts; otherwise self.transactions is filtered.
+        """
+        if plate_match not in ('exact', 'prefix', 'contains'):
+            raise ValueError("plate_match must be 'exact', 'prefix' or 'contains'")
+        day, date_from, date_to = (d if d is None or isinstance(d, str) else d.isoformat()
+                                   for d in (day, date_from, date_to))
+        if self._db is None:
+            return self._filter_transactions(plate, plate_match, spot, day, date_from, date_to, paid,
+                                             before_id, after_id, limit, newest_first)
+
+        where, params = self._transaction_where(plate, plate_match, spot, day, date_from, date_to, paid,
+                                                before_id, after_id)
+        sql = 'SELECT id, spot, plate, time_in, time_out, amount, paid, comments FROM transactions'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY id DESC' if newest_first else ' ORDER BY id ASC'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(int(limit))
+        rows = archive.select(self._reader(), sql, params, key=lambda row: row[0], reverse=newest_first,
+                              limit=limit, bounds=archive.id_bounds,
+                              keep=archive.matching(day, date_from, date_to, before_id, after_id))
+        return [self._row_to_transaction(row) for row in rows]
+
+    def page_transactions(self, *, cursor=None, limit=50, newest_first=True, **filters):
+        """One page of query_transactions(**filters) and the cursor of the next.
+
+        cursor is what the previous page returned (None for the first one);
+        the returned cursor is None on the last page. Pages are keyed on
+        the id, or on (time_out date, id) when date_from/date_to is given so
+        that the day index serves the range, so every page is an index seek
+        however deep the cursor is. Raises ValueError for a bad cursor.
+        """
+        filters = {k: (v.isoformat() if k in ('day', 'date_from', 'date_to') and v is not None
+                       and not isinstance(v, str) else v)
+                   for k, v in filters.items()}
+        filters.setdefault('plate_match', 'exact')
+        if filters['plate_match'] not in ('exact', 'prefix', 'contains'):
+            raise ValueError("plate_match must be 'exact', 'prefix' or 'contains'")
+        if filters.get('date_from') is None and filters.get('date_to') is None:
+            bound = {}
+            if cursor:
+                bound['before_id' if newest_first else 'after_id'] = int(cursor)
+            rows = self.query_transactions(limit=limit + 1, newest_first=newest_first, **filters, **bound)
+            page = rows[:limit]
+            return page, (str(page[-1]['id']) if len(rows) > limit else None)
+
+        def key(tx):
+            return (tx.get('time_out') or '')[:10], tx['id']
+
+        after = None
+        if cursor:
+            day, sep, tx_id = cursor.rpartition(',')
+            if not sep:
+                raise ValueError('invalid cursor')
+            after = (day, int(tx_id))
+        if self._db is None:
+            rows = sorted(self.query_transactions(**filters), key=key, reverse=newest_first)
+            if after is not None:
+                rows = [tx for tx in rows if (key(tx) < after if newest_first else key(tx) > after)]
+            rows = rows[:limit + 1]
+        else:
+            rows = []
+            if after is not None:
+                # the rest of the cursor's day, then the days beyond it
+                bound = {'before_id' if newest_first else 'after_id': after[1]}
+                rows = self.query_transactions(limit=limit + 1, newest_first=newest_first,
+                                               **dict(filters, day=after[0]), **bound)
+            if len(rows) <= limit:
+                f = filters
+                where, params = self._transaction_where(f.get('plate'), f['plate_match'], f.get('spot'),
+                                                        f.get('day'), f.get('date_from'), f.get('date_to'),
+                                                        f.get('paid'), None, None, by_day=True)
+                if after is not None:
+                    where.append('substr(time_out, 1, 10) ' + ('< ?' if newest_first else '> ?'))
+                    params.append(after[0])
+                direction = 'DESC' if newest_first else 'ASC'
+                sql = ('SELECT id, spot, plate, time_in, time_out, amount, paid, comments FROM transactions '
+                       f'WHERE {" AND ".join(where)} '
+                       f'ORDER BY substr(time_out, 1, 10) {direction}, id {direction} LIMIT ?')
+                params.append(limit + 1 - len(rows))
+                found = archive.select(self._reader(), sql, params,
+                                       key=lambda row: ((row[4] or '')[:10], row[0]), reverse=newest_first,
+                                       limit=limit + 1 - len(rows), bounds=archive.day_bounds,
+                                       keep=archive.matching(f.get('day'), f.get('date_from'), f.get('date_to')))
+                rows += [self._row_to_transaction(row) for row in found]
+        page = rows[:limit]
+        next_cursor = '%s,%d' % key(page[-1]) if len(rows) > limit else None
+        return page, next_cursor
+
+    @staticmethod
+    def _transaction_where(plate, plate_match, spot, day, date_from, date_to, paid, before_id, after_id,
+                           by_day=False):
+        """WHERE terms and parameters for query_transactions' filters."""
+        where = []
+        params = []
+        if plate is not None:
+            if plate_match == 'exact':
+                where.append('plate = ? COLLATE NOCASE')
+                params.append(plate)
+            else:
+                pattern = plate.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+                where.append("plate LIKE ? ESCAPE '\\'")
+                params.append(pattern + '%' if plate_match == 'prefix' else '%' + pattern + '%')
+        if spot is not None:
+            where.append('spot = ?')
+            params.append(spot)
+        if day is not None:
+            where.append('substr(time_out, 1, 10) = ?')
+            params.append(day)
+        if date_from is not None:
+            where.append('substr(time_out, 1, 10) >= ?')
+            params.append(date_from)
+        if date_to is not None:
+            where.append('substr(time_out, 1, 10) <= ?')
+            params.append(date_to)
+        if paid is not None:
+            # when ordering by day, keep the planner on the day index: the
+            # paid index would hand back half the table to sort
+            where.append('+paid = ?' if by_day else 'paid = ?')
+            params.append(1 if paid else 0)
+        if before_id is not None:
+            where.append('id < ?')
+            params.append(before_id)
+        if after_id is not None:
+            where.append('id > ?')
+            params.append(after_id)
+        return where, params
+
+    def _filter_transactions(self, plate, plate_match, spot, day, date_from, date_to, paid,
+                             before_id, after_id, limit, newest_first):
+        needle = plate.lower() if plate is not None else None
+        found = []
+        # start at the cursor instead of walking past the pages already seen
+        txs = self.transactions.between(after_id, before_id, reverse=newest_first)
+        for tx in txs:
+            if needle is not None:
+                value = (tx.get('plate') or '').lower()
+                if plate_match == 'exact' and value != needle:
+                    continue
+                if plate_match == 'prefix' and not value.startswith(needle):
+                    continue
+                if plate_match == 'contains' and needle not in value:
+                    continue
+            if spot is not None and tx.get('spot') != spot:
+                continue
+            if day is not None or date_from is not None or date_to is not None:
+                out_day = (tx.get('time_out') or '')[:10]
+                if day is not None and out_day != day:
+                    continue
+                if date_from is not None and out_day < date_from:
+                    continue
+                if date_to is not None and out_day > date_to:
+                    continue
+            if paid is not None and bool(tx.get('paid')) != bool(paid):
+                continue
+            found.append(tx)
+            if limit is not None and len(found) >= limit:
+                break
+        return found
+
+    def search_transactions(self, text, limit=20):
+        """Transactions whose plate or comments hold every word of text, best first.
+
+        Words match whole words, the last one also as a prefix (for search
+        as you type): 'rear bump' finds "damage on rear bumper". With an
+        attached database this is one FTS5 query ranked by bm25, plate
+        hits weighing double; otherwise (or without FTS5) the transactions
+        are scanned, newest first.
+        """
+        import re
+        import sqlite3
+        words = re.findall(r'\w+', (text or '').lower())
+        if not words or limit <= 0:
+            return []
+        if self._db is not None:
+            match = ' '.join('"%s"' % word for word in words) + '*'
+            try:
+                # archived months have their own index: ranks are merged as if
+                # they were one (bm25 weighs words by per-month frequencies)
+                rows = archive.select(self._reader(),
+                                      'SELECT t.id, t.spot, t.plate, t.time_in, t.time_out, t.amount, t.paid, '
+                                      't.comments, bm25(transactions_fts, 2.0, 1.0) AS rank '
+                                      'FROM transactions_fts JOIN transactions t ON t.id = transactions_fts.rowid '
+                                      'WHERE transactions_fts MATCH ? ORDER BY rank, t.id DESC LIMIT ?',
+                                      (match, limit), key=lambda row: (row[8], -row[0]), limit=limit)
+                return [self._row_to_transaction(row[:8]) for row in rows]
+            except sqlite3.OperationalError:
+                # no transactions_fts: SQLite without FTS5
+                txs = self.iter_history()
+        else:
+            txs = reversed(self.transactions)
+        found = []
+        for tx in txs:
+            tokens = re.findall(r'\w+', f"{tx.get('plate') or ''} {tx.get('comments') or ''}".lower())
+            if all(word in tokens for word in words[:-1]) and any(t.startswith(words[-1]) for t in tokens):
+                found.append(tx)
+                if len(found) >= limit:
+                    break
+        return found
+
+    # ------------------------------------------------------------------ archive
+    def close_months(self, before=None):
+        """Move the finished months out of the attached database's live table.
+
+        before is 'YYYY-MM', by default the current month in the park's
+        time zone; returns the months moved. History queries keep finding
+        them, read from the archive files (see archive.py).
+        """
+        from datetime import datetime
+        if self._db is None:
+            raise ValueError('close_months needs an attached database')
+        return archive.close_months(self.db_path, before or datetime.now(self.tz).strftime('%Y-%m'))
+
+    def drop_months(self, before):
+        """Delete the archived months before `before` ('YYYY-MM'); returns them."""
+        if self._db is None:
+            raise ValueError('drop_months needs an attached database')
+        return archive.drop_months(self.db_path, before)
+
+    # ------------------------------------------------------------------ reports
+    def report(self, period='daily', start=None, end=None):
+        """Report rows per day or hour ('daily' / 'hourly') from start to end.
+
+        start and end are dates or ISO strings ('YYYY-MM-DD', or with 'THH'
+        for hours), both inclusive and optional. Each row has the bucket,
+        transactions, total, paid, unpaid, average_dwell_minutes and
+        peak_occupancy (counting the cars parked since an earlier bucket);
+        buckets with no activity are left out. Reads the rollups, one row
+        per bucket, not the transactions.
+        """
+        return [rollups.report_row(row) for row in self._rollup_rows(period, start, end)[1]]
+
+    def report_totals(self, start=None, end=None):
+        """One report row (without bucket) over the days from start to end."""
+        carried, rows = self._rollup_rows('daily', start, end)
+        total = rollups.combine(rows)
+        # a range without arrivals or departures: the cars carried in stay
+        total['peak_occupancy'] = max(total['peak_occupancy'], carried)
+        totals = rollups.report_row(total)
+        del totals['bucket']
+        return totals
+
+    def _rollup_rows(self, period, start, end):
+        """(cars inside at start, the rows from start to end with carried-in peaks)."""
+        if period not in rollups.PERIODS:
+            raise ValueError("period must be 'daily' or 'hourly'")
+        start, end = (d if d is None or isinstance(d, str) else d.isoformat() for d in (start, end))
+        if self._db is None:
+            carried, rows = self._rollups.carried(period, start), self._rollups.rows(period, start, end)
+        else:
+            conn = self._reader()
+            carried, rows = rollups.carried_sql(conn, period, start), rollups.rows_sql(conn, period, start, end)
+        return carried, rollups.with_carry_in(rows, carried)
+
+    def revenue_between(self, start, end):
+        """Revenue and number of transactions that ended in [start, end).
+
+        start and end are datetimes or ISO strings (naive ones in local
+        time), taken to the minute. Answered in O(log n) from an in-memory
+        Fenwick tree over all history (see revenue_index.py), however wide
+        the window; raises ValueError for values that are not timestamps.
+        """
+        if minute_of(start) is None or minute_of(end) is None:
+            raise ValueError('start and end must be ISO timestamps')
+        with self._lock:
+            cents, count = self._revenue_index().between(start, end)
+        return {'revenue': cents / 100, 'transactions': count}
+
+    def _revenue_index(self):
+        if self._revenue is None:
+            if self._db is not None:
+                self._revenue = self._load_revenue(self._reader())
+            else:
+                self._revenue = RevenueIndex((tx['time_out'], rollups.cents(tx.get('amount')))
+                                             for tx in self.transactions if tx.get('time_out'))
+        return self._revenue
+
+    def parked_at(self, when):
+        """The cars inside at `when` (a datetime or ISO string), by spot.
+
+        Each is a dict with spot, plate, time_in, time_out (None if still
+        parked) and id (of its transaction, None if still parked). Answered
+        from the sweep index of all stays (see occupancy_index.py) in
+        O(log n) plus the number of cars; raises ValueError for a value
+        that is not a timestamp.
+        """
+        with self._lock:
+            return self._occupancy_index().parked_at(when)
+
+    def peak_occupancy(self, day):
+        """Most cars inside at once during a local day ('YYYY-MM-DD' or a date)."""
+        with self._lock:
+            return self._occupancy_index().peak(day)
+
+    def _occupancy_index(self):
+        if self._occupancy is None:
+            if self._db is not None:
+                stays = [dict(zip(('id', 'spot', 'plate', 'time_in', 'time_out'), row)) for row in archive.iter_rows(
+                    self._reader(), 'SELECT id, spot, plate, time_in, time_out FROM transactions '
+                    'WHERE time_out IS NOT NULL')]
+            else:
+                stays = self._all_transactions()
+            self._occupancy = OccupancyIndex(stays, self.parked_cars)
+        return self._occupancy
+
+    def transactions_for_day(self, day):
+        """Transactions whose car left on the given local date."""
+        return self.query_transactions(day=day)
+
+    def transactions_for_plate(self, plate, match='exact'):
+        return self.query_transactions(plate=plate, plate_match=match)
+
+    def transactions_for_spot(self, spot):
+        return self.query_transactions(spot=spot)
+
+    def unpaid_transactions(self):
+        return self.query_transactions(paid=False)
 
 
 def main():
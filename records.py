@@ -0,0 +1,493 @@
+import sys
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone
+
+# keys of a transaction record, in the order to_dict() emits them
+FIELDS = ('id', 'spot', 'plate', 'time_in', 'time_out', 'amount', 'paid', 'comments')
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_NAIVE_EPOCH = datetime(1970, 1, 1)
+_US = timedelta(microseconds=1)
+_MINUTE = timedelta(minutes=1)
+# utc offset marker for timestamps written without one
+_NAIVE = -32768
+_INT32 = (-2 ** 31, 2 ** 31 - 1)
+_INT64 = (-2 ** 63, 2 ** 63 - 1)
+# the columns of a TransactionLog: storage name, attribute and array typecode
+COLUMNS = (('ids', '_ids', 'q'), ('spots', '_spots', 'i'), ('plates', '_plates', 'i'),
+           ('time_in', '_time_in', 'q'), ('tz_in', '_tz_in', 'h'), ('time_out', '_time_out', 'q'),
+           ('tz_out', '_tz_out', 'h'), ('cents', '_cents', 'q'), ('paid', '_paid', 'b'))
+
+_zones = {}
+
+
+def _zone(minutes):
+    tz = _zones.get(minutes)
+    if tz is None:
+        tz = _zones[minutes] = timezone(timedelta(minutes=minutes))
+    return tz
+
+
+def decode_time(us, minutes):
+    """ISO string for epoch microseconds and a utc offset in minutes."""
+    if minutes == _NAIVE:
+        return (_NAIVE_EPOCH + timedelta(microseconds=us)).isoformat()
+    local = _NAIVE_EPOCH + timedelta(minutes=minutes, microseconds=us)
+    return local.replace(tzinfo=_zone(minutes)).isoformat()
+
+
+def encode_time(value):
+    """(epoch_us, offset_minutes) for an ISO timestamp, or None if the string
+    would not come back byte-for-byte from decode_time."""
+    if type(value) is not str or not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    # decode_time rebuilds the same wall time and offset, so comparing
+    # isoformat() here is enough to know the string round-trips
+    if dt.isoformat() != value:
+        return None
+    offset = dt.utcoffset()
+    if offset is None:
+        return (dt - _NAIVE_EPOCH) // _US, _NAIVE
+    if offset % _MINUTE:
+        return None
+    return (dt - _EPOCH) // _US, offset // _MINUTE
+
+
+def _fits(value, low, high):
+    return type(value) is int and low <= value <= high
+
+
+def _cents(amount):
+    """amount as integer cents, or None unless it is a float that survives the trip."""
+    if type(amount) is not float or not abs(amount) < 2 ** 53 / 100:
+        return None
+    cents = round(amount * 100)
+    return cents if cents / 100 == amount else None
+
+
+class Transaction:
+    """A row of a TransactionLog that reads and writes like the old dict.
+
+    Views are created on access and hold no data themselves; two views of
+    the same row compare equal.
+    """
+
+    __slots__ = ('_log', '_pos')
+
+    def __init__(self, log, pos):
+        self._log = log
+        self._pos = pos
+
+    def __getitem__(self, key):
+        return self._log._get(self._pos, key)
+
+    def __setitem__(self, key, value):
+        self._log._set(self._pos, key, value)
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __eq__(self, other):
+        if isinstance(other, (Transaction, dict)):
+            return self.to_dict() == dict(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return f'Transaction({self.to_dict()!r})'
+
+    def get(self, key, default=None):
+        try:
+            return self._log._get(self._pos, key)
+        except KeyError:
+            return default
+
+    def keys(self):
+        return self.to_dict().keys()
+
+    def items(self):
+        return self.to_dict().items()
+
+    def values(self):
+        return self.to_dict().values()
+
+    def update(self, other=(), **kwargs):
+        items = other.items() if hasattr(other, 'items') else other
+        for key, value in items:
+            self[key] = value
+        for key, value in kwargs.items():
+            self[key] = value
+
+    def to_dict(self):
+        return self._log._record(self._pos)
+
+
+class TransactionLog:
+    """Column store for transaction records.
+
+    Each column is an array: ids, spots, interned plate numbers, epoch
+    microseconds plus utc offset for time_in/time_out, integer cents and a
+    paid byte, about 45 bytes per row. Comments and any value that would not
+    round-trip exactly (odd timestamps, non-float amounts, extra keys) are
+    kept in small side dicts, so to_dict() returns what was stored.
+
+    Behaves like the list of dicts it replaces: len, iteration, indexing
+    and slicing (returning Transaction views), append, and deleting a
+    prefix (del log[:n]) to trim history. Rows are addressed by a position
+    that survives trimming, so views of the remaining rows stay valid.
+
+    Ids normally arrive in increasing order, so find() is a direct index
+    (ids are usually contiguous) or a bisect of the id column, with no
+    per-row index to keep in memory.
+    """
+
+    def __init__(self, records=()):
+        for _, attr, typecode in COLUMNS:
+            setattr(self, attr, array(typecode))
+        self._comments = {}
+        # position -> {field: value} for values stored verbatim
+        self._raw = {}
+        self._plate_table = []
+        self._plate_index = {}
+        # rows dropped from the front; position = base + row
+        self._base = 0
+        # ids set and strictly increasing (None = recheck on next find)
+        self._ordered = True
+        self._max_id = 0
+        # columns are read-only buffers (see from_storage) until the first change
+        self._mapped = False
+        for rec in records:
+            self.append(rec)
+
+    @classmethod
+    def from_storage(cls, storage):
+        """A log over existing storage, as storage() returns it.
+
+        The columns may be any buffers of the right type, such as
+        memoryviews of a mapped snapshot file (see snapshot.py): they are
+        read in place, so only the pages of the rows used are touched.
+        The plate table need only be a sequence and comments need only have
+        get(). All are copied into the usual arrays and dicts on the first
+        change to the log.
+        """
+        log = cls()
+        for name, attr, _ in COLUMNS:
+            setattr(log, attr, storage['columns'][name])
+        log._plate_table = storage['plate_table']
+        log._comments = storage['comments']
+        log._raw = dict(storage['raw'])
+        log._ordered = storage['ordered']
+        log._max_id = storage['max_id']
+        log._mapped = True
+        return log
+
+    def storage(self):
+        """The log's columns (by name, see COLUMNS), plate table, comments and
+        verbatim values (by row) and id bookkeeping, for snapshot.write."""
+        base = self._base
+        return {
+            'columns': {name: getattr(self, attr) for name, attr, _ in COLUMNS},
+            'plate_table': self._plate_table,
+            'comments': {pos - base: text for pos, text in self._comments.items()},
+            'raw': {pos - base: values for pos, values in self._raw.items()},
+            'ordered': self._ordered,
+            'max_id': self._max_id,
+        }
+
+    def _thaw(self):
+        """Copy storage read in place (see from_storage) into arrays, before a change."""
+        if not self._mapped:
+            return
+        for _, attr, typecode in COLUMNS:
+            column = array(typecode)
+            column.frombytes(memoryview(getattr(self, attr)).cast('B'))
+            setattr(self, attr, column)
+        self._plate_table = list(map(sys.intern, self._plate_table))
+        self._plate_index = dict(zip(self._plate_table, range(len(self._plate_table))))
+        self._comments = dict(self._comments.items())
+        self._mapped = False
+
+    # ---------------------------------------------------------------- list API
+    def __len__(self):
+        return len(self._ids)
+
+    def __iter__(self):
+        base = self._base
+        for row in range(len(self._ids)):
+            yield Transaction(self, base + row)
+
+    def __reversed__(self):
+        base = self._base
+        for row in range(len(self._ids) - 1, -1, -1):
+            yield Transaction(self, base + row)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [Transaction(self, self._base + row) for row in range(*index.indices(len(self._ids)))]
+        n = len(self._ids)
+        if index < 0:
+            index += n
+        if not 0 <= index < n:
+            raise IndexError('transaction index out of range')
+        return Transaction(self, self._base + index)
+
+    def __delitem__(self, index):
+        if not isinstance(index, slice) or index.start not in (None, 0) or index.step not in (None, 1):
+            raise TypeError('only a leading slice (del log[:n]) can be deleted')
+        n = len(range(*index.indices(len(self._ids))))
+        if not n:
+            return
+        self._thaw()
+        for col in self._columns():
+            del col[:n]
+        self._base += n
+        for side in (self._comments, self._raw):
+            for pos in [p for p in side if p < self._base]:
+                del side[pos]
+
+    def __repr__(self):
+        return f'TransactionLog({len(self)} rows)'
+
+    def append(self, record):
+        """Add a record (a dict or a Transaction) and return its view."""
+        if isinstance(record, Transaction):
+            record = record.to_dict()
+        self._thaw()
+        get = record.get
+        pos = self._base + len(self._ids)
+        verbatim = [k for k in record if k not in FIELDS]
+
+        tx_id = get('id')
+        if tx_id is not None and not _fits(tx_id, 1, _INT64[1]):
+            verbatim.append('id')
+            tx_id = None
+        self._note_id(len(self._ids), tx_id or 0)
+        self._ids.append(tx_id or 0)
+        spot = get('spot')
+        if not _fits(spot, *_INT32):
+            verbatim.append('spot')
+            spot = 0
+        self._spots.append(spot)
+        plate = get('plate')
+        if type(plate) is str:
+            self._plates.append(self._plate_number(plate))
+        else:
+            verbatim.append('plate')
+            self._plates.append(0)
+        for key, times, zones in (('time_in', self._time_in, self._tz_in),
+                                  ('time_out', self._time_out, self._tz_out)):
+            encoded = encode_time(get(key))
+            if encoded is None:
+                verbatim.append(key)
+                encoded = (0, 0)
+            times.append(encoded[0])
+            zones.append(encoded[1])
+        cents = _cents(get('amount'))
+        if cents is None:
+            verbatim.append('amount')
+        self._cents.append(cents or 0)
+        paid = get('paid')
+        if type(paid) is not bool:
+            verbatim.append('paid')
+        self._paid.append(paid is True)
+        comments = get('comments', '')
+        if type(comments) is not str:
+            verbatim.append('comments')
+        elif comments:
+            self._comments[pos] = comments
+
+        if verbatim:
+            self._raw[pos] = {k: get(k) for k in verbatim}
+        return Transaction(self, pos)
+
+    def extend(self, records):
+        for rec in records:
+            self.append(rec)
+
+    def clear(self):
+        del self[:len(self)]
+
+    def find(self, tx_id):
+        """View of the row with the given id, or None."""
+        ids = self._ids
+        if not ids or not _fits(tx_id, 1, _INT64[1]):
+            return None
+        if self._is_ordered():
+            row = tx_id - ids[0]
+            if not (0 <= row < len(ids) and ids[row] == tx_id):
+                row = bisect_left(ids, tx_id)
+            if row < len(ids) and ids[row] == tx_id:
+                return Transaction(self, self._base + row)
+            return None
+        for row in range(len(ids) - 1, -1, -1):
+            if ids[row] == tx_id:
+                return Transaction(self, self._base + row)
+        return None
+
+    def between(self, after_id=None, before_id=None, reverse=False):
+        """Views of the rows with after_id < id < before_id (either bound optional)."""
+        ids = self._ids
+        if not self._is_ordered():
+            rows = [row for row in range(len(ids))
+                    if (after_id is None or ids[row] > after_id) and (before_id is None or ids[row] < before_id)]
+        else:
+            start = 0 if after_id is None else bisect_left(ids, after_id + 1)
+            stop = len(ids) if before_id is None else bisect_left(ids, before_id)
+            rows = range(start, stop)
+        base = self._base
+        for row in (reversed(rows) if reverse else rows):
+            yield Transaction(self, base + row)
+
+    def max_id(self):
+        """Highest id ever stored in the log (trimmed rows included), or 0."""
+        return self._max_id
+
+    # ---------------------------------------------------------------- storage
+    def _columns(self):
+        return (self._ids, self._spots, self._plates, self._time_in, self._tz_in,
+                self._time_out, self._tz_out, self._cents, self._paid)
+
+    def _row(self, pos):
+        row = pos - self._base
+        if row < 0:
+            raise IndexError('transaction is no longer held in memory')
+        return row
+
+    def _is_ordered(self):
+        if self._ordered is None:
+            ids = self._ids
+            self._ordered = not ids or (ids[0] > 0 and all(a < b for a, b in zip(ids, ids[1:])))
+        return self._ordered
+
+    def _note_id(self, row, tx_id):
+        """Keep the ordering flag right before ids[row] becomes tx_id."""
+        ids = self._ids
+        self._max_id = max(self._max_id, tx_id)
+        if row == len(ids) or row == len(ids) - 1:
+            # appending, or setting the id of the newest row
+            if tx_id <= 0 or (row and ids[row - 1] >= tx_id):
+                self._ordered = False
+            elif self._ordered is False and row == len(ids) - 1:
+                # an id given to the newest row may fix the order
+                self._ordered = None
+        else:
+            self._ordered = None
+
+    def _plate_number(self, plate):
+        idx = self._plate_index.get(plate)
+        if idx is None:
+            idx = self._plate_index[plate] = len(self._plate_table)
+            self._plate_table.append(sys.intern(plate))
+        return idx
+
+    def _record(self, pos):
+        """The whole row as a dict."""
+        row = self._row(pos)
+        rec = {}
+        if self._ids[row]:
+            rec['id'] = self._ids[row]
+        rec['spot'] = self._spots[row]
+        rec['plate'] = self._plate_table[self._plates[row]]
+        rec['time_in'] = decode_time(self._time_in[row], self._tz_in[row])
+        rec['time_out'] = decode_time(self._time_out[row], self._tz_out[row])
+        rec['amount'] = self._cents[row] / 100
+        rec['paid'] = bool(self._paid[row])
+        rec['comments'] = self._comments.get(pos, '')
+        raw = self._raw.get(pos)
+        if raw:
+            rec.update(raw)
+        return rec
+
+    def _get(self, pos, key):
+        row = self._row(pos)
+        raw = self._raw.get(pos)
+        if raw and key in raw:
+            return raw[key]
+        if key == 'id':
+            if not self._ids[row]:
+                raise KeyError(key)
+            return self._ids[row]
+        if key == 'spot':
+            return self._spots[row]
+        if key == 'plate':
+            return self._plate_table[self._plates[row]]
+        if key == 'time_in':
+            return decode_time(self._time_in[row], self._tz_in[row])
+        if key == 'time_out':
+            return decode_time(self._time_out[row], self._tz_out[row])
+        if key == 'amount':
+            return self._cents[row] / 100
+        if key == 'paid':
+            return bool(self._paid[row])
+        if key == 'comments':
+            return self._comments.get(pos, '')
+        raise KeyError(key)
+
+    def _set(self, pos, key, value):
+        row = self._row(pos)
+        self._thaw()
+        if self._store(row, pos, key, value):
+            raw = self._raw.get(pos)
+            if raw and key in raw:
+                del raw[key]
+                if not raw:
+                    del self._raw[pos]
+        else:
+            self._raw.setdefault(pos, {})[key] = value
+
+    def _store(self, row, pos, key, value):
+        """Put value in its column; False if it has to be kept verbatim."""
+        if key == 'id':
+            ok = _fits(value, 1, _INT64[1])
+            self._note_id(row, value if ok else 0)
+            self._ids[row] = value if ok else 0
+            return ok
+        if key == 'spot':
+            if _fits(value, *_INT32):
+                self._spots[row] = value
+                return True
+            return False
+        if key == 'plate':
+            if type(value) is not str:
+                return False
+            self._plates[row] = self._plate_number(value)
+            return True
+        if key in ('time_in', 'time_out'):
+            encoded = encode_time(value)
+            if encoded is None:
+                return False
+            if key == 'time_in':
+                self._time_in[row], self._tz_in[row] = encoded
+            else:
+                self._time_out[row], self._tz_out[row] = encoded
+            return True
+        if key == 'amount':
+            cents = _cents(value)
+            if cents is None:
+                return False
+            self._cents[row] = cents
+            return True
+        if key == 'paid':
+            if type(value) is not bool:
+                return False
+            self._paid[row] = value
+            return True
+        if key == 'comments':
+            if type(value) is not str:
+                return False
+            if value:
+                self._comments[pos] = value
+            else:
+                self._comments.pop(pos, None)
+            return True
+        return False
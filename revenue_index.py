@@ -0,0 +1,168 @@
+"""Revenue and transaction counts over arbitrary time windows.
+
+RevenueIndex buckets transactions by the minute of their time_out. It
+keeps Fenwick (binary indexed) trees of amounts in cents and counts at
+two levels: one over the days that have transactions, and one per such
+day over its minutes that have any. Adding a transaction and summing any
+[start, end) window are both O(log n): the full days before a minute come
+from the day tree, the rest of its day from that day's tree.
+
+Only minutes and days that occur are stored, so memory grows with the
+transactions, not with the time they span. A new key after the last one
+is appended to its tree in O(log n); one before it rebuilds that tree
+through its prefix sums, level by level with slice operations rather than
+a Python loop per key (a day holds at most 1440 minutes).
+"""
+from array import array
+from bisect import bisect_left
+from datetime import date, datetime, time
+from itertools import accumulate
+from operator import add, sub
+
+_DAY_MINUTES = 24 * 60
+
+
+def minute_of(value):
+    """Minutes since the epoch of a datetime, date or ISO string (naive = local), or None."""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if isinstance(value, date) and not isinstance(value, datetime):
+        value = datetime.combine(value, time())
+    if not isinstance(value, datetime):
+        return None
+    return int(value.timestamp() // 60)
+
+
+def _zeros(n):
+    return array('q', bytes(8 * n))
+
+
+def _levels(size):
+    """(first node, step) of each level of a tree of `size` slots, leaves first."""
+    width = 1
+    while width <= size:
+        yield width, 2 * width
+        width *= 2
+
+
+def _from_prefix(prefix):
+    """Fenwick tree of the running totals prefix[0..size] (prefix[0] == 0).
+
+    Node i holds the sum over (i - lowbit(i), i], that is
+    prefix[i] - prefix[i - lowbit(i)]; all nodes of a level share lowbit.
+    """
+    size = len(prefix) - 1
+    tree = _zeros(size + 1)
+    for first, step in _levels(size):
+        tree[first::step] = array('q', map(sub, prefix[first::step], prefix[0::step]))
+    return tree
+
+
+def _to_prefix(tree):
+    """The running totals a Fenwick tree encodes (the inverse of _from_prefix)."""
+    size = len(tree) - 1
+    prefix = _zeros(size + 1)
+    for first, step in reversed(list(_levels(size))):
+        prefix[first::step] = array('q', map(add, tree[first::step], prefix[0::step]))
+    return prefix
+
+
+class _Tree:
+    """Fenwick trees of cents and counts over the keys seen, in key order."""
+
+    def __init__(self, keys=(), cents=(), counts=()):
+        """keys: sorted distinct keys, with the cents and counts of each."""
+        self.keys = array('q', keys)
+        self.cents = _from_prefix(array('q', accumulate(cents, initial=0)))
+        self.counts = _from_prefix(array('q', accumulate(counts, initial=0)))
+
+    def add(self, key, cents, count):
+        keys = self.keys
+        i = bisect_left(keys, key)
+        if i == len(keys):
+            keys.append(key)
+            # node i + 1 covers (i + 1 - lowbit, i + 1]: all but itself are there
+            low = i + 1 - ((i + 1) & -(i + 1))
+            for tree in (self.cents, self.counts):
+                tree.append(_sum(tree, i) - _sum(tree, low))
+        elif keys[i] != key:
+            keys.insert(i, key)
+            for name in ('cents', 'counts'):
+                prefix = _to_prefix(getattr(self, name))
+                # an empty slot at i + 1: the totals from there on move up one
+                setattr(self, name, _from_prefix(prefix[:i + 1] + prefix[i:]))
+        i += 1
+        tree_cents, tree_counts, size = self.cents, self.counts, len(keys)
+        while i <= size:
+            tree_cents[i] += cents
+            tree_counts[i] += count
+            i += i & -i
+
+    def before(self, key):
+        """(cents, count) over the keys less than key."""
+        i = bisect_left(self.keys, key)
+        return _sum(self.cents, i), _sum(self.counts, i)
+
+
+def _sum(tree, i):
+    """The total of the first i slots of a Fenwick tree."""
+    total = 0
+    while i > 0:
+        total += tree[i]
+        i -= i & -i
+    return total
+
+
+class RevenueIndex:
+    def __init__(self, entries=()):
+        """entries: (time_out, cents) pairs of the transactions to start with."""
+        minutes = {}
+        for when, cents in entries:
+            minute = minute_of(when)
+            if minute is not None:
+                totals = minutes.setdefault(minute, [0, 0])
+                totals[0] += cents
+                totals[1] += 1
+        by_day = {}
+        for minute in sorted(minutes):
+            by_day.setdefault(minute // _DAY_MINUTES, []).append(minute)
+        # day -> the _Tree of its minutes
+        self._minutes = {day: _Tree(keys, (minutes[m][0] for m in keys), (minutes[m][1] for m in keys))
+                         for day, keys in by_day.items()}
+        self._days = _Tree(by_day, (sum(minutes[m][0] for m in keys) for keys in by_day.values()),
+                           (sum(minutes[m][1] for m in keys) for keys in by_day.values()))
+
+    def add(self, when, cents, count=1):
+        """Count a transaction of `cents` ending at `when` (negative values take it back)."""
+        minute = minute_of(when)
+        if minute is None:
+            return
+        day = minute // _DAY_MINUTES
+        tree = self._minutes.get(day)
+        if tree is None:
+            tree = self._minutes[day] = _Tree()
+        tree.add(minute, cents, count)
+        self._days.add(day, cents, count)
+
+    def between(self, start, end):
+        """(cents, count) of the transactions ending in [start, end), to the minute."""
+        first, stop = minute_of(start), minute_of(end)
+        if first is None or stop is None or stop <= first:
+            return 0, 0
+        high_cents, high_count = self._before(stop)
+        low_cents, low_count = self._before(first)
+        return high_cents - low_cents, high_count - low_count
+
+    def _before(self, minute):
+        """Sums over the minutes before `minute`."""
+        day = minute // _DAY_MINUTES
+        cents, count = self._days.before(day)
+        tree = self._minutes.get(day)
+        if tree is not None:
+            day_cents, day_count = tree.before(minute)
+            cents += day_cents
+            count += day_count
+        return cents, count
@@ -0,0 +1,293 @@
+"""Per-day and per-hour totals of transactions and occupancy.
+
+A bucket is a local date ('YYYY-MM-DD') or hour ('YYYY-MM-DDTHH'), cut
+from the stored ISO timestamps like the day index on transactions. Each
+holds:
+
+    transactions    removals whose time_out falls in the bucket
+    total_cents     their amounts
+    paid_cents      the part of that marked paid
+    dwell_seconds   their summed parking time
+    arrivals        cars parked in it (time_in in the bucket)
+    peak_occupancy  most spots occupied right after an arrival in it
+
+CarPark adds to them as it writes (see CarPark._rollup), into the
+rollup_daily / rollup_hourly tables of an attached database or a Rollups
+object in memory, so a report reads one row per bucket rather than every
+transaction. compute() rebuilds them from scratch.
+
+The cars carried into a bucket are the arrivals less the removals of all
+buckets before it (carried_sql / Rollups.carried: one sum over the daily
+rows). with_carry_in() raises each peak to that, so a day or hour that
+cars spent parked without new arrivals does not report an empty park.
+"""
+from datetime import datetime
+
+import archive
+
+FIELDS = ('transactions', 'total_cents', 'paid_cents', 'dwell_seconds', 'arrivals', 'peak_occupancy')
+# period -> (table, length of the bucket key)
+PERIODS = {'daily': ('rollup_daily', 10), 'hourly': ('rollup_hourly', 13)}
+
+
+def cents(amount):
+    return int(round((amount or 0) * 100))
+
+
+def _timestamp(value):
+    try:
+        # naive values are taken as local time, like CarPark writes them
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def dwell_seconds(time_in, time_out):
+    start, end = _timestamp(time_in), _timestamp(time_out)
+    if start is None or end is None:
+        return 0.0
+    return max(end - start, 0.0)
+
+
+def contribution(tx):
+    """What one transaction adds to the bucket of its time_out (None if still open)."""
+    if not tx.get('time_out'):
+        return None
+    amount = cents(tx.get('amount'))
+    return {
+        'transactions': 1,
+        'total_cents': amount,
+        'paid_cents': amount if tx.get('paid') else 0,
+        'dwell_seconds': dwell_seconds(tx.get('time_in'), tx.get('time_out')),
+    }
+
+
+def create_tables(c):
+    for table, _ in PERIODS.values():
+        c.execute(f'''CREATE TABLE IF NOT EXISTS {table} (
+            bucket TEXT PRIMARY KEY,
+            transactions INTEGER NOT NULL DEFAULT 0,
+            total_cents INTEGER NOT NULL DEFAULT 0,
+            paid_cents INTEGER NOT NULL DEFAULT 0,
+            dwell_seconds REAL NOT NULL DEFAULT 0,
+            peak_occupancy INTEGER NOT NULL DEFAULT 0,
+            arrivals INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID''')
+
+
+def add_arrivals_sql(c):
+    """Add the arrivals column to rollup tables written before it, counted
+    from the stored history (transactions, archived months, parked cars)."""
+    for table, width in PERIODS.values():
+        if 'arrivals' not in [row[1] for row in c.execute(f'PRAGMA table_info({table})')]:
+            c.execute(f'ALTER TABLE {table} ADD COLUMN arrivals INTEGER NOT NULL DEFAULT 0')
+    counts = {period: {} for period in PERIODS}
+    times = [time_in for _, time_in in archive.iter_rows(c, 'SELECT id, time_in FROM transactions')]
+    times += [time_in for (time_in,) in c.execute('SELECT time_in FROM parked_spots')]
+    for time_in in times:
+        if time_in:
+            for period, (_, width) in PERIODS.items():
+                counts[period][time_in[:width]] = counts[period].get(time_in[:width], 0) + 1
+    for period, (table, _) in PERIODS.items():
+        c.execute(f'UPDATE {table} SET arrivals = 0')
+        c.executemany(f'INSERT INTO {table} (bucket, arrivals) VALUES (?, ?) '
+                      'ON CONFLICT (bucket) DO UPDATE SET arrivals = excluded.arrivals',
+                      counts[period].items())
+
+
+def add_sql(c, when, transactions=0, total_cents=0, paid_cents=0, dwell_seconds=0.0, arrivals=0, occupancy=0):
+    """Add to the daily and hourly rows of the instant `when` (an ISO string)."""
+    for table, width in PERIODS.values():
+        c.execute(f'INSERT INTO {table} (bucket, transactions, total_cents, paid_cents, dwell_seconds, '
+                  'arrivals, peak_occupancy) VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (bucket) DO UPDATE SET '
+                  'transactions = transactions + excluded.transactions, '
+                  'total_cents = total_cents + excluded.total_cents, '
+                  'paid_cents = paid_cents + excluded.paid_cents, '
+                  'dwell_seconds = dwell_seconds + excluded.dwell_seconds, '
+                  'arrivals = arrivals + excluded.arrivals, '
+                  'peak_occupancy = max(peak_occupancy, excluded.peak_occupancy)',
+                  (when[:width], transactions, total_cents, paid_cents, dwell_seconds, arrivals, occupancy))
+
+
+def add_paid_sql(c, id_list, paid):
+    """Move the amounts of the given transactions (a JSON id array) into or out of paid.
+
+    Call before setting the flag: only rows whose flag is about to change count.
+    """
+    sign = 1 if paid else -1
+    for table, width in PERIODS.values():
+        c.execute(f'INSERT INTO {table} (bucket, paid_cents) '
+                  f'SELECT substr(time_out, 1, {width}), ? * SUM(CAST(round(COALESCE(amount, 0) * 100) AS INTEGER)) '
+                  'FROM transactions WHERE id IN (SELECT value FROM json_each(?)) AND paid != ? '
+                  'AND time_out IS NOT NULL GROUP BY 1 '
+                  'ON CONFLICT (bucket) DO UPDATE SET paid_cents = paid_cents + excluded.paid_cents',
+                  (sign, id_list, 1 if paid else 0))
+
+
+def rows_sql(conn, period, start=None, end=None):
+    table, _ = PERIODS[period]
+    where, params = [], []
+    if start is not None:
+        where.append('bucket >= ?')
+        params.append(start)
+    if end is not None:
+        # end is inclusive; a date also takes in all hours of that day
+        where.append('bucket <= ?')
+        params.append(end + '\uffff')
+    sql = f'SELECT bucket, {", ".join(FIELDS)} FROM {table}'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    return [dict(zip(('bucket',) + FIELDS, row)) for row in conn.execute(sql + ' ORDER BY bucket', params)]
+
+
+def carried_sql(conn, period, start):
+    """Cars inside when the bucket `start` begins (0 without a start)."""
+    if start is None:
+        return 0
+    # the days before, then the hours of its day before it
+    carried = conn.execute('SELECT COALESCE(SUM(arrivals - transactions), 0) FROM rollup_daily '
+                           'WHERE bucket < ?', (start[:10],)).fetchone()[0]
+    if period == 'hourly' and len(start) > 10:
+        carried += conn.execute('SELECT COALESCE(SUM(arrivals - transactions), 0) FROM rollup_hourly '
+                                'WHERE bucket >= ? AND bucket < ?', (start[:10], start)).fetchone()[0]
+    return carried
+
+
+def with_carry_in(rows, carried):
+    """rows (in bucket order, from `carried` cars inside) with each peak at
+    least the cars carried into its bucket."""
+    for row in rows:
+        row['peak_occupancy'] = max(row['peak_occupancy'], carried)
+        carried += row['arrivals'] - row['transactions']
+    return rows
+
+
+def report_row(row):
+    """A stored row as reported: amounts in currency, unpaid and average dwell derived."""
+    count = row['transactions']
+    return {
+        'bucket': row.get('bucket'),
+        'transactions': count,
+        'total': row['total_cents'] / 100,
+        'paid': row['paid_cents'] / 100,
+        'unpaid': (row['total_cents'] - row['paid_cents']) / 100,
+        'average_dwell_minutes': round(row['dwell_seconds'] / count / 60, 1) if count else None,
+        'peak_occupancy': row['peak_occupancy'],
+    }
+
+
+def combine(rows):
+    """One row summing many (the highest peak)."""
+    total = dict.fromkeys(FIELDS, 0)
+    for row in rows:
+        for field in FIELDS[:-1]:
+            total[field] += row[field]
+        total['peak_occupancy'] = max(total['peak_occupancy'], row['peak_occupancy'])
+    return total
+
+
+class Rollups:
+    """The rollup tables of a park without a database, as dicts."""
+
+    def __init__(self):
+        self.buckets = {period: {} for period in PERIODS}
+
+    def add(self, when, transactions=0, total_cents=0, paid_cents=0, dwell_seconds=0.0, arrivals=0, occupancy=0):
+        for period, (_, width) in PERIODS.items():
+            row = self.buckets[period].get(when[:width])
+            if row is None:
+                row = self.buckets[period][when[:width]] = dict.fromkeys(FIELDS, 0)
+            row['transactions'] += transactions
+            row['total_cents'] += total_cents
+            row['paid_cents'] += paid_cents
+            row['dwell_seconds'] += dwell_seconds
+            row['arrivals'] += arrivals
+            row['peak_occupancy'] = max(row['peak_occupancy'], occupancy)
+
+    @classmethod
+    def from_rows(cls, rows_by_period):
+        rollups = cls()
+        for period, rows in rows_by_period.items():
+            rollups.buckets[period] = {row['bucket']: {f: row[f] for f in FIELDS} for row in rows}
+        return rollups
+
+    def rows(self, period, start=None, end=None):
+        end = None if end is None else end + '\uffff'
+        return [dict(self.buckets[period][bucket], bucket=bucket)
+                for bucket in sorted(self.buckets[period])
+                if (start is None or bucket >= start) and (end is None or bucket <= end)]
+
+    def carried(self, period, start):
+        """Cars inside when the bucket `start` begins, like carried_sql."""
+        if start is None:
+            return 0
+        carried = sum(row['arrivals'] - row['transactions']
+                      for bucket, row in self.buckets['daily'].items() if bucket < start[:10])
+        if period == 'hourly' and len(start) > 10:
+            carried += sum(row['arrivals'] - row['transactions']
+                           for bucket, row in self.buckets['hourly'].items() if start[:10] <= bucket < start)
+        return carried
+
+
+class LazyRollups(Rollups):
+    """Rollups whose buckets are read (from load()) on first use, e.g. from a snapshot."""
+
+    def __init__(self, load):
+        self._load = load
+
+    def __getattr__(self, name):
+        if name != 'buckets' or '_load' not in self.__dict__:
+            raise AttributeError(name)
+        self.buckets = self.__dict__.pop('_load')()
+        for rows in self.buckets.values():
+            for row in rows.values():
+                # a snapshot written before a field existed
+                for field in FIELDS:
+                    row.setdefault(field, 0)
+        return self.buckets
+
+
+def compute(transactions, parked_cars):
+    """Rollups of a whole history (an upgraded file, a park read from JSON).
+
+    Peaks are replayed: arrivals and departures in time order, counting
+    the occupancy after each arrival (departures at the same instant
+    first).
+    """
+    rollups = Rollups()
+    events = []
+    for tx in transactions:
+        added = contribution(tx)
+        if added is not None:
+            rollups.add(tx['time_out'], **added)
+        if tx.get('time_in'):
+            rollups.add(tx['time_in'], arrivals=1)
+        arrival, departure = _timestamp(tx.get('time_in')), _timestamp(tx.get('time_out'))
+        if arrival is not None:
+            events.append((arrival, 1, tx['time_in']))
+            if departure is not None:
+                events.append((departure, 0, None))
+    for rec in parked_cars.values():
+        if rec.get('time_in'):
+            rollups.add(rec['time_in'], arrivals=1)
+        arrival = _timestamp(rec.get('time_in'))
+        if arrival is not None:
+            events.append((arrival, 1, rec['time_in']))
+    events.sort(key=lambda e: (e[0], e[1]))
+    occupied = 0
+    for _, is_arrival, when in events:
+        if is_arrival:
+            occupied += 1
+            rollups.add(when, occupancy=occupied)
+        else:
+            occupied = max(occupied - 1, 0)
+    return rollups
+
+
+def write_sql(c, rollups):
+    """Replace the stored rollups with these."""
+    for period, (table, _) in PERIODS.items():
+        c.execute(f'DELETE FROM {table}')
+        c.executemany(f'INSERT INTO {table} (bucket, {", ".join(FIELDS)}) VALUES ({", ".join("?" * (len(FIELDS) + 1))})',
+                      [(bucket,) + tuple(row[f] for f in FIELDS)
+                       for bucket, row in rollups.buckets[period].items()])
@@ -0,0 +1,204 @@
+"""Binary snapshots of a car park, opened in place through mmap.
+
+A snapshot holds what CarPark needs to start: the settings, parked cars,
+per-spot transaction ids and change-log version in a small JSON section,
+and the transaction log as its raw columns (records.COLUMNS, native byte
+order) with the plate table, comments and known plates as string tables.
+
+read() maps the file and parses the header and the JSON section only.
+The log it returns reads its rows straight from the mapping, so the OS
+pages in just the parts of the columns that are used; opening a snapshot
+costs the same whatever the length of the history.
+
+Layout (header and directory little-endian, sections 8-byte aligned):
+
+    header       MAGIC, VERSION, number of sections        <8sII
+    directory    per section: name, offset, length         <16sQQ
+    sections     meta (JSON), col.<column> (array data), string tables,
+                 comments.rows (int64 rows that have comments) and, for
+                 a park without a database, rollups (JSON)
+
+A string table NAME is two sections: NAME.offsets, n + 1 int64 byte
+offsets, and NAME.text, the UTF-8 strings end to end.
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+
+from records import COLUMNS, TransactionLog
+
+MAGIC = b'CARPARK\x00'
+VERSION = 1
+_HEADER = '<8sII'
+_ENTRY = '<16sQQ'
+_ALIGN = 8
+
+
+def _align(offset):
+    return -(-offset // _ALIGN) * _ALIGN
+
+
+def _string_table(name, strings):
+    """The two sections of a string table."""
+    offsets = array('q', [0])
+    text = bytearray()
+    for value in strings:
+        text += value.encode('utf-8')
+        offsets.append(len(text))
+    return [(f'{name}.offsets', offsets), (f'{name}.text', text)]
+
+
+def write(path, meta, log, known=(), rollups=None):
+    """Write a snapshot to path, atomically (temporary file, fsync, rename).
+
+    meta: JSON-able dict of the park's small state; log: a TransactionLog;
+    known: the known plates, sorted; rollups: JSON-able report buckets, or
+    None for a park whose totals live in its database.
+    """
+    storage = log.storage()
+    comments = sorted(storage['comments'].items())
+    header = dict(meta, rows=len(log), byteorder=sys.byteorder, ordered=storage['ordered'],
+                  max_id=storage['max_id'], raw=sorted(storage['raw'].items()))
+    sections = [('meta', json.dumps(header).encode('utf-8'))]
+    sections += [(f'col.{name}', storage['columns'][name]) for name, _, _ in COLUMNS]
+    sections += _string_table('plates', storage['plate_table'])
+    sections.append(('comments.rows', array('q', [row for row, _ in comments])))
+    sections += _string_table('comments', [text for _, text in comments])
+    sections += _string_table('known', known)
+    if rollups is not None:
+        sections.append(('rollups', json.dumps(rollups).encode('utf-8')))
+
+    views = [memoryview(data).cast('B') for _, data in sections]
+    offset = _align(struct.calcsize(_HEADER) + len(sections) * struct.calcsize(_ENTRY))
+    directory = []
+    for (name, _), view in zip(sections, views):
+        directory.append(struct.pack(_ENTRY, name.encode('ascii'), offset, view.nbytes))
+        offset = _align(offset + view.nbytes)
+
+    tmp = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp, 'xb') as f:
+            f.write(struct.pack(_HEADER, MAGIC, VERSION, len(sections)))
+            f.write(b''.join(directory))
+            for view in views:
+                f.write(b'\0' * (_align(f.tell()) - f.tell()))
+                f.write(view)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+class _Strings:
+    """Read-only sequence over a mapped string table; strings are decoded as read."""
+
+    def __init__(self, offsets, text):
+        self._offsets = offsets
+        self._text = text
+
+    def __len__(self):
+        return max(len(self._offsets) - 1, 0)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('string table index out of range')
+        return str(self._text[self._offsets[index]:self._offsets[index + 1]], 'utf-8')
+
+    def __iter__(self):
+        # decoded in one go: for ASCII text byte offsets are character offsets
+        text = str(self._text, 'utf-8')
+        if len(text) != len(self._text):
+            return (self[index] for index in range(len(self)))
+        offsets = self._offsets.tolist()
+        return (text[start:end] for start, end in zip(offsets, offsets[1:]))
+
+
+class _Comments:
+    """row -> comments of a mapped snapshot, found by bisecting the rows that have any."""
+
+    def __init__(self, rows, texts):
+        self._rows = rows
+        self._texts = texts
+
+    def get(self, row, default=None):
+        i = bisect_left(self._rows, row)
+        if i < len(self._rows) and self._rows[i] == row:
+            return self._texts[i]
+        return default
+
+    def items(self):
+        return zip(self._rows, self._texts)
+
+
+class Snapshot:
+    """An open snapshot file: meta (dict), log (a TransactionLog reading the
+    mapping in place), known (the known plates, a sequence) and rollups()."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            # raises ValueError for an empty file
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._map)
+        try:
+            magic, version, count = struct.unpack_from(_HEADER, view)
+            entries = [struct.unpack_from(_ENTRY, view, struct.calcsize(_HEADER) + i * struct.calcsize(_ENTRY))
+                       for i in range(count)] if magic == MAGIC else []
+        except struct.error:
+            raise ValueError(f'{path}: not a car park snapshot') from None
+        if magic != MAGIC:
+            raise ValueError(f'{path}: not a car park snapshot')
+        if version != VERSION:
+            raise ValueError(f'{path}: snapshot version {version}, expected {VERSION}')
+        self._sections = {}
+        for name, offset, length in entries:
+            if offset + length > len(view):
+                raise ValueError(f'{path}: truncated snapshot')
+            self._sections[name.rstrip(b'\0').decode('ascii')] = view[offset:offset + length]
+
+        self.meta = json.loads(bytes(self._section('meta')))
+        if self.meta['byteorder'] != sys.byteorder:
+            raise ValueError(f'{path}: snapshot written on a {self.meta["byteorder"]}-endian machine')
+        rows = self.meta['rows']
+        columns = {}
+        for name, _, typecode in COLUMNS:
+            column = self._section(f'col.{name}')
+            if len(column) != rows * array(typecode).itemsize:
+                raise ValueError(f'{path}: column {name} does not match the row count')
+            columns[name] = column.cast(typecode)
+        self.log = TransactionLog.from_storage({
+            'columns': columns,
+            'plate_table': self._strings('plates'),
+            'comments': _Comments(self._section('comments.rows').cast('q'), self._strings('comments')),
+            'raw': {row: values for row, values in self.meta['raw']},
+            'ordered': self.meta['ordered'],
+            'max_id': self.meta['max_id'],
+        })
+        self.known = self._strings('known')
+
+    def _section(self, name):
+        try:
+            return self._sections[name]
+        except KeyError:
+            raise ValueError(f'snapshot has no {name} section') from None
+
+    def _strings(self, name):
+        return _Strings(self._section(f'{name}.offsets').cast('q'), self._section(f'{name}.text'))
+
+    def rollups(self):
+        """The report buckets stored with the snapshot, or None."""
+        data = self._sections.get('rollups')
+        return None if data is None else json.loads(bytes(data))
+
+
+def read(path):
+    """Open the snapshot at path; ValueError if it is not one this version can read."""
+    return Snapshot(path)
@@ -0,0 +1,108 @@
+class FreeSpotAllocator:
+    """Tracks free spots 1..capacity and hands out the lowest one first.
+
+    Free spots are kept in a hierarchical bitset: level 0 has one bit per
+    spot (set = free), and every word on the level above has one bit per
+    word below it (set = that word still has a free spot).  Finding the
+    lowest free spot, taking a spot and releasing a spot all walk one word
+    per level, i.e. O(log64 capacity).
+    """
+
+    WORD_BITS = 64
+
+    def __init__(self, capacity, occupied=()):
+        self.capacity = max(int(capacity), 0)
+        self._free_count = 0
+        self._levels = []
+        self._build(occupied)
+
+    def _build(self, occupied):
+        bits = self.WORD_BITS
+        full = (1 << bits) - 1
+        nwords = max((self.capacity + bits - 1) // bits, 1)
+        words = [full] * nwords
+        # clear the bits past capacity in the last word
+        tail = self.capacity % bits
+        if tail:
+            words[-1] = (1 << tail) - 1
+        elif self.capacity == 0:
+            words[-1] = 0
+        self._free_count = self.capacity
+        for spot in occupied:
+            if 1 <= spot <= self.capacity:
+                i = spot - 1
+                mask = 1 << (i % bits)
+                if words[i // bits] & mask:
+                    words[i // bits] &= ~mask
+                    self._free_count -= 1
+
+        self._levels = [words]
+        while len(words) > 1:
+            upper = [0] * ((len(words) + bits - 1) // bits)
+            for i, w in enumerate(words):
+                if w:
+                    upper[i // bits] |= 1 << (i % bits)
+            self._levels.append(upper)
+            words = upper
+
+    def rebuild(self, occupied):
+        """Reset the free set from an iterable of occupied spot numbers."""
+        self._build(occupied)
+
+    def free_count(self):
+        return self._free_count
+
+    def is_free(self, spot):
+        if not 1 <= spot <= self.capacity:
+            return False
+        i = spot - 1
+        return bool(self._levels[0][i // self.WORD_BITS] & (1 << (i % self.WORD_BITS)))
+
+    def lowest(self):
+        """Return the lowest free spot without taking it, or None when full."""
+        bits = self.WORD_BITS
+        idx = 0
+        for words in reversed(self._levels):
+            w = words[idx]
+            if not w:
+                return None
+            idx = idx * bits + ((w & -w).bit_length() - 1)
+        return idx + 1
+
+    def acquire(self):
+        """Take the lowest free spot and return it, or None when full."""
+        spot = self.lowest()
+        if spot is not None:
+            self.claim(spot)
+        return spot
+
+    def claim(self, spot):
+        """Mark a specific spot as occupied. Returns False if it was not free."""
+        if not self.is_free(spot):
+            return False
+        bits = self.WORD_BITS
+        idx = spot - 1
+        for words in self._levels:
+            wi, bit = divmod(idx, bits)
+            words[wi] &= ~(1 << bit)
+            if words[wi]:
+                break
+            idx = wi
+        self._free_count -= 1
+        return True
+
+    def release(self, spot):
+        """Mark a spot as free again. Returns False if it was already free."""
+        if not 1 <= spot <= self.capacity or self.is_free(spot):
+            return False
+        bits = self.WORD_BITS
+        idx = spot - 1
+        for words in self._levels:
+            wi, bit = divmod(idx, bits)
+            was_empty = not words[wi]
+            words[wi] |= 1 << bit
+            if not was_empty:
+                break
+            idx = wi
+        self._free_count += 1
+        return True
@@ -37,6 +37,7 @@ let amountTouched = false;
 let latestState = null;
 let commentSpot = null;
 let resetPasswordUsername = null;
+let eventSource = null;
 
 async function apiRequest(path, options = {}) {
   const opts = {
@@ -73,6 +74,7 @@ async function apiRequest(path, options = {}) {
 }
 
 function showLogin() {
+  stopEvents();
   dashboard.classList.add("hidden");
   logoutBtn.classList.add("hidden");
   loginCard.classList.remove("hidden");
@@ -98,11 +100,14 @@ function renderState(state) {
     searchResults.textContent = "Enter a plate to search.";
     searchResults.classList.add("muted");
   }
-  if (searchResults) {
-    searchResults.textContent = "Enter a plate to search.";
-    searchResults.classList.add("muted");
-  }
+  document
+    .querySelectorAll(".admin-only input[name='rate']")
+    .forEach((input) => (input.value = state.rate_per_hour));
+  renderDashboard(state);
+  startEvents(state.version);
+}
 
+function renderDashboard(state) {
   document.getElementById("summary-user").textContent = state.current_user;
   document.getElementById("summary-role").textContent = state.is_admin
     ? "Admin"
@@ -116,9 +121,6 @@ function renderState(state) {
   document.getElementById("parked-count").textContent = state.parked_cars.length;
 
   adminCard.classList.toggle("hidden", !state.is_admin);
-  document
-    .querySelectorAll(".admin-only input[name='rate']")
-    .forEach((input) => (input.value = state.rate_per_hour));
 
   const parkedRows = state.parked_cars
     .map(
@@ -160,6 +162,88 @@ function renderState(state) {
     `<tr><td colspan="5" class="muted">No transactions.</td></tr>`;
 }
 
+// Live updates: /api/events pushes what other operators do; apply it to
+// latestState and repaint instead of fetching the whole state again.
+function startEvents(version) {
+  if (eventSource || typeof EventSource === "undefined") {
+    return;
+  }
+  eventSource = new EventSource(`/api/events?since=${version ?? ""}`);
+  eventSource.onmessage = (e) => applyEvent(JSON.parse(e.data));
+}
+
+function stopEvents() {
+  if (eventSource) {
+    eventSource.close();
+    eventSource = null;
+  }
+}
+
+function applyEvent(event) {
+  const state = latestState;
+  if (!state) {
+    return;
+  }
+  if (event.type === "reset") {
+    refreshState();
+    return;
+  }
+  mergeChanges(
+    state,
+    event.spot !== undefined ? [{ spot: event.spot, car: event.car }] : [],
+    event.transaction ? [event.transaction] : []
+  );
+  state.available_spots = state.capacity - state.parked_cars.length;
+  if (event.type === "rate") {
+    state.rate_per_hour = event.rate_per_hour;
+    currentRate = Number(event.rate_per_hour) || 0;
+  }
+  state.version = Math.max(state.version, event.version);
+  renderDashboard(state);
+}
+
+// Mutations answer with what changed since the version we send (?since=),
+// not the whole state; merge that into latestState.
+function sinceParam() {
+  return latestState ? `?since=${latestState.version}` : "";
+}
+
+function applyDelta(delta) {
+  if (!delta.delta || !latestState) {
+    renderState(delta);
+    return;
+  }
+  mergeChanges(latestState, delta.spots, delta.transactions);
+  latestState.capacity = delta.capacity;
+  latestState.rate_per_hour = delta.rate_per_hour;
+  latestState.available_spots = delta.available_spots;
+  latestState.version = Math.max(latestState.version, delta.version);
+  renderState(latestState);
+}
+
+function mergeChanges(state, spots, transactions) {
+  if (spots.length) {
+    const changed = new Set(spots.map((s) => s.spot));
+    const cars = state.parked_cars.filter((car) => !changed.has(car.spot));
+    spots.forEach((s) => s.car && cars.push(s.car));
+    cars.sort((a, b) => a.spot - b.spot);
+    state.parked_cars = cars;
+  }
+  if (transactions.length) {
+    const txs = state.transactions.slice();
+    transactions.forEach((tx) => {
+      const i = txs.findIndex((t) => t.id === tx.id);
+      if (i >= 0) {
+        txs[i] = tx;
+      } else {
+        txs.push(tx);
+      }
+    });
+    txs.sort((a, b) => a.id - b.id);
+    state.transactions = txs.slice(-50);
+  }
+}
+
 async function refreshState() {
   try {
     const state = await apiRequest("/api/state");
@@ -210,13 +294,13 @@ document.getElementById("park-form").addEventListener("submit", async (e) => {
     return;
   }
   try {
-    const res = await apiRequest("/api/park", {
+    const res = await apiRequest(`/api/park${sinceParam()}`, {
       method: "POST",
       body: { plate },
     });
     showToast("Car parked");
     e.target.reset();
-    renderState(res.state);
+    applyDelta(res.delta);
   } catch (err) {
     showToast(err.message || "Failed to park car", "error");
   }
@@ -281,13 +365,13 @@ removeModalForm.addEventListener("submit", async (e) => {
     payload.amount_override = Number(amountVal);
   }
   try {
-    const res = await apiRequest("/api/remove", {
+    const res = await apiRequest(`/api/remove${sinceParam()}`, {
       method: "POST",
       body: payload,
     });
     showToast("Car removed");
     closeRemoveModal();
-    renderState(res.state);
+    applyDelta(res.delta);
   } catch (err) {
     showToast(err.message || "Failed to remove car", "error");
   }
@@ -336,59 +420,80 @@ commentForm?.addEventListener("submit", async (e) => {
     return;
   }
   try {
-    const res = await apiRequest(`/api/spot/${commentSpot}/comments`, {
+    const res = await apiRequest(`/api/spot/${commentSpot}/comments${sinceParam()}`, {
       method: "POST",
       body: { comments: commentTextarea.value },
     });
     showToast("Comments saved");
     closeCommentModal();
-    renderState(res.state);
+    applyDelta(res.delta);
   } catch (err) {
     showToast(err.message || "Failed to save comments", "error");
   }
 });
 
 if (searchForm && searchResults) {
-  searchForm.addEventListener("submit", (e) => {
-    e.preventDefault();
-    if (!latestState) {
-      showToast("State not loaded yet", "error");
-      return;
-    }
-    const query = e.target.query.value.trim().toLowerCase();
-    if (!query) {
-      searchResults.textContent = "Enter a plate to search.";
+  // search-as-you-type: /api/search covers parked cars and every plate in
+  // the history; only the answer to the latest query is shown
+  let searchSeq = 0;
+  let searchTimer = null;
+
+  const renderSearch = (results) => {
+    if (results.length === 0) {
+      searchResults.textContent = "No cars match that registration.";
       searchResults.classList.add("muted");
       return;
     }
-    const matches = latestState.parked_cars.filter((car) =>
-      (car.plate || "").toLowerCase().includes(query)
-    );
-
-    if (matches.length === 0) {
-      searchResults.textContent = "No parked cars match that registration.";
-      searchResults.classList.add("muted");
-      return;
-    }
-
-    const list = matches
-      .map(
-        (car) => `
+    searchResults.innerHTML = results
+      .map(({ plate, spot, car }) =>
+        car
+          ? `
           <div class="search-hit">
             <div>
-              <strong>${car.plate || "Unknown"}</strong> — Spot ${car.spot}<br>
+              <strong>${plate}</strong> — Spot ${spot}<br>
               <span class="muted">${(car.time_in || "").slice(0, 19)}</span>
             </div>
             <div class="table-actions">
-              <button type="button" class="link-btn" data-search-action="comment" data-spot="${car.spot}">Note</button>
-              <button type="button" class="link-btn" data-search-action="remove" data-spot="${car.spot}">Remove</button>
+              <button type="button" class="link-btn" data-search-action="comment" data-spot="${spot}">Note</button>
+              <button type="button" class="link-btn" data-search-action="remove" data-spot="${spot}">Remove</button>
+            </div>
+          </div>`
+          : `
+          <div class="search-hit">
+            <div>
+              <strong>${plate}</strong><br>
+              <span class="muted">Not parked (seen in history)</span>
             </div>
           </div>`
       )
       .join("");
-
-    searchResults.innerHTML = list;
     searchResults.classList.remove("muted");
+  };
+
+  const runSearch = async (query) => {
+    const seq = ++searchSeq;
+    if (!query) {
+      searchResults.textContent = "Enter a plate to search.";
+      searchResults.classList.add("muted");
+      return;
+    }
+    try {
+      const res = await apiRequest(`/api/search?q=${encodeURIComponent(query)}`);
+      if (seq === searchSeq) renderSearch(res.results);
+    } catch (err) {
+      if (seq === searchSeq) showToast(err.message || "Search failed", "error");
+    }
+  };
+
+  searchForm.addEventListener("submit", (e) => {
+    e.preventDefault();
+    clearTimeout(searchTimer);
+    runSearch(e.target.query.value.trim());
+  });
+
+  searchForm.query.addEventListener("input", (e) => {
+    clearTimeout(searchTimer);
+    searchTimer = setTimeout(() => runSearch(e.target.value.trim()), 150);
   });
 
   searchResults.addEventListener("click", (e) => {
@@ -396,7 +501,7 @@ if (searchForm && searchResults) {
     if (!btn) return;
     const spot = btn.dataset.spot;
     const car = latestState?.parked_cars.find((c) => String(c.spot) === String(spot));
-    if (btn.dataset.search-action === "comment") {
+    if (btn.dataset.searchAction === "comment") {
       openCommentModal(car);
     } else {
       openRemoveModal(spot);
@@ -412,12 +517,12 @@ document.getElementById("rate-form").addEventListener("submit", async (e) => {
     return;
   }
   try {
-    const res = await apiRequest("/api/rate", {
+    const res = await apiRequest(`/api/rate${sinceParam()}`, {
       method: "POST",
       body: { rate_per_hour: rate },
     });
     showToast("Rate updated");
-    renderState(res.state);
+    applyDelta(res.delta);
   } catch (err) {
     showToast(err.message || "Failed to update rate", "error");
   }
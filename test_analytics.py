@@ -0,0 +1,75 @@
+import os
+import random
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+import analytics
+from practice import CarPark
+
+AGGREGATES = (analytics.dwell_histogram, analytics.revenue_per_spot,
+              analytics.hour_of_week_profile, analytics.utilization_heatmap)
+
+# a small history by hand: Monday 2024-01-01, local time at +01:00
+tz = timezone(timedelta(hours=1))
+monday = datetime(2024, 1, 1, tzinfo=tz)
+transactions = [
+    {'id': 1, 'spot': 1, 'plate': 'B2', 'time_in': (monday + timedelta(hours=8)).isoformat(),
+     'time_out': (monday + timedelta(hours=9, minutes=30)).isoformat(), 'amount': 3.0, 'paid': True},
+    {'id': 2, 'spot': 2, 'plate': 'A1', 'time_in': (monday + timedelta(hours=8, minutes=45)).isoformat(),
+     'time_out': (monday + timedelta(hours=8, minutes=55)).isoformat(), 'amount': 0.33, 'paid': False},
+    {'id': 3, 'spot': 1, 'plate': 'A1', 'time_in': (monday + timedelta(days=6, hours=23)).isoformat(),
+     'time_out': (monday + timedelta(days=7, hours=1)).isoformat(), 'amount': 4.0, 'paid': False},
+    {'id': 4, 'spot': 3, 'plate': 'C3', 'time_in': 'not a time', 'time_out': None, 'amount': None},
+]
+cols = analytics.from_transactions(transactions, use_numpy=False)
+assert len(cols) == 3 and cols.plates == ['A1', 'B2'] and list(cols.plate) == [1, 0, 0]
+assert cols.time_in[0] == int((monday + timedelta(hours=8)).timestamp())
+assert cols.wall_in[0] - cols.time_in[0] == 3600
+histogram = analytics.dwell_histogram(cols, bucket_minutes=30, max_minutes=120)
+assert histogram == [1, 0, 0, 1, 1]  # 10 min; 90 min; 120 min and over
+assert analytics.revenue_per_spot(cols) == {1: 700, 2: 33}
+profile = analytics.hour_of_week_profile(cols)
+assert profile['arrivals'][8] == 2 and profile['arrivals'][6 * 24 + 23] == 1
+assert profile['departures'][9] == 1 and profile['cents'][1] == 400  # Sunday night into Monday 01:00
+heatmap = analytics.utilization_heatmap(cols)
+assert heatmap[0][8] == round((60 + 10) / 60, 4) and heatmap[0][9] == 0.5
+assert heatmap[6][23] == 1.0 and heatmap[0][0] == 1.0 and sum(map(sum, heatmap)) == round(1.5 + 10 / 60 + 2, 4)
+# Monday 08:00 to the next Monday 01:00: each hour of the week once, or not at all
+by_capacity = analytics.utilization_heatmap(cols, capacity=2)
+assert by_capacity[0][8] == round(70 * 60 / (2 * 3600), 4) and by_capacity[0][0] == 0.5
+assert by_capacity[0][5] == 0.0
+
+# from a database file, the same as from the records in memory
+rnd = random.Random(3)
+park = CarPark(20)
+for i in range(400):
+    time_in = monday + timedelta(minutes=rnd.randrange(30 * 1440))
+    park.transactions.append({'id': i + 1, 'spot': rnd.randrange(1, 21), 'plate': f'P{rnd.randrange(60)}',
+                              'time_in': time_in.isoformat(),
+                              'time_out': (time_in + timedelta(seconds=rnd.randrange(20000))).isoformat(),
+                              'amount': round(rnd.random() * 20, 2), 'paid': False, 'comments': ''})
+db_path = os.path.join(tempfile.mkdtemp(), 'analytics.db')
+park.save_to_db(db_path)
+memory = analytics.from_transactions(park.transactions, use_numpy=False)
+loaded = analytics.load(db_path, use_numpy=False)
+assert loaded.plates == memory.plates
+for name in analytics.COLUMNS:
+    assert list(getattr(loaded, name)) == list(getattr(memory, name)), name
+for aggregate in AGGREGATES:
+    assert aggregate(loaded) == aggregate(memory)
+
+# NumPy, when installed, gives the very same answers
+if analytics.np is not None:
+    vectorized = analytics.load(db_path)
+    assert vectorized.vectorized and not loaded.vectorized
+    for aggregate in AGGREGATES:
+        assert aggregate(vectorized) == aggregate(loaded), aggregate.__name__
+    assert analytics.utilization_heatmap(vectorized, 20) == analytics.utilization_heatmap(loaded, 20)
+    small = analytics.from_transactions(transactions)
+    assert analytics.dwell_histogram(small, 30, 120) == histogram and analytics.utilization_heatmap(small) == heatmap
+
+empty = analytics.from_transactions([])
+assert analytics.dwell_histogram(empty) == [0] * 97 and analytics.revenue_per_spot(empty) == {}
+assert analytics.utilization_heatmap(empty) == [[0.0] * 24 for _ in range(7)]
+
+print('All tests passed')
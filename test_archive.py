@@ -0,0 +1,123 @@
+import contextlib
+import io
+import os
+import sqlite3
+import tempfile
+from datetime import datetime
+
+import analytics
+import archive
+from practice import CarPark
+
+tmp = tempfile.mkdtemp()
+db = os.path.join(tmp, 'park.db')
+CarPark(5).attach_db(db)
+now = datetime.now().astimezone()
+rows = []
+for month, days in (('2024-01', 30), ('2024-02', 25)):
+    for day in range(1, days + 1):
+        rows.append((day % 5 + 1, f'M{month[-1]}D{day}', f'{month}-{day:02d}T09:00:00+07:00',
+                     f'{month}-{day:02d}T11:30:00+07:00', 5.0, day % 2, 'rear bumper' if day == 7 else ''))
+for i in range(5):
+    rows.append((i + 1, f'NOW{i}', now.replace(hour=9).isoformat(), now.replace(hour=10).isoformat(), 2.5, 0, ''))
+conn = sqlite3.connect(db)
+conn.executemany('INSERT INTO transactions (spot, plate, time_in, time_out, amount, paid, comments) '
+                 'VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+conn.commit()
+
+park = CarPark.load_from_db(db, write_through=True, history_limit=10)
+
+
+def history():
+    return {
+        'all': park.query_transactions(),
+        'newest': park.query_transactions(newest_first=True, limit=7),
+        'feb': park.query_transactions(date_from='2024-02-03', date_to='2024-02-09'),
+        'plate': park.query_transactions(plate='m1d1', plate_match='prefix'),
+        'pages': [park.page_transactions(cursor=c, limit=8)[0] for c in (None, '40', '12')],
+        'day pages': park.page_transactions(limit=6, date_from='2024-01-20', date_to='2024-02-02'),
+        'get': park.get_transaction(3),
+        # ranked per month once archived: compare what is found
+        'search': sorted(tx['id'] for tx in park.search_transactions('rear bump')),
+        'revenue': park.revenue_between('2024-01-01', '2024-02-01'),
+        'peak': park.peak_occupancy('2024-01-05'),
+        'report': park.report_totals(),
+        'analytics': len(analytics.load(db)),
+    }
+
+
+before = history()
+assert len(before['all']) == 60 and before['search'] == [7, 37]
+
+# a crash half way through moving January: every row is still seen once
+purge = archive._purge
+
+
+class PowerCut(Exception):
+    pass
+
+
+class CrashAfterOneBatch:
+    def __init__(self, conn):
+        self.conn = conn
+        self.commits = 0
+
+    def execute(self, sql, params=()):
+        if sql == 'COMMIT':
+            self.commits += 1
+            if self.commits > 1:
+                raise PowerCut()
+        return self.conn.execute(sql, params)
+
+
+archive._purge = lambda conn, month, path, batch_size: purge(CrashAfterOneBatch(conn), month, path, 10)
+try:
+    park.close_months('2024-02')
+    raise AssertionError('expected the power cut')
+except PowerCut:
+    pass
+finally:
+    archive._purge = purge
+assert history() == before
+catalog = sqlite3.connect(db)
+assert catalog.execute('SELECT COUNT(*) FROM transactions').fetchone()[0] == 50
+
+# the next close finishes January, then moves February
+assert park.close_months('2024-03') == ['2024-01', '2024-02']
+assert catalog.execute('SELECT COUNT(*) FROM transactions').fetchone()[0] == 5
+assert sorted(os.listdir(archive.archive_dir(db))) == ['2024-01.db', '2024-02.db']
+assert park.close_months('2024-03') == []
+assert history() == before
+reopened = CarPark.load_from_db(db, write_through=True)
+assert reopened.search_plates('M1D') and len(reopened.query_transactions()) == 60
+reopened.detach_db()
+
+# archived transactions are read-only
+tx = park.get_transaction(3)
+try:
+    park.update_transaction(tx, amount=1)
+    raise AssertionError('archived transaction changed')
+except ValueError:
+    pass
+assert park.mark_paid([3, 4, 58], paid=False) == 1
+assert park.get_transaction(3)['amount'] == 5.0
+
+# dropping January removes its rows, not the report totals
+assert park.drop_months('2024-02') == ['2024-01']
+assert sorted(os.listdir(archive.archive_dir(db))) == ['2024-02.db']
+assert len(park.query_transactions()) == 30 and park.get_transaction(3) is None
+assert park.report_totals() == before['report']
+park.detach_db()
+
+# a new park attached over it replaces the archived months too
+fresh = CarPark(5)
+with contextlib.redirect_stdout(io.StringIO()):
+    fresh.park_car('FRESH')
+    fresh.remove_car(1)
+fresh.attach_db(db)
+assert [(t['id'], t['plate']) for t in fresh.query_transactions()] == [(1, 'FRESH')]
+assert catalog.execute('SELECT COUNT(*) FROM archive_months').fetchone()[0] == 0
+assert os.listdir(archive.archive_dir(db)) == []
+fresh.detach_db()
+
+print('All tests passed')
@@ -0,0 +1,95 @@
+import contextlib
+import io
+import os
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+
+import backup
+from practice import CarPark
+
+tmp = tempfile.mkdtemp()
+db = os.path.join(tmp, 'park.db')
+backups = os.path.join(tmp, 'backups')
+CarPark(5).attach_db(db)
+conn = sqlite3.connect(db)
+conn.executemany('INSERT INTO transactions (spot, plate, time_in, time_out, amount, paid, comments) '
+                 'VALUES (1, ?, ?, ?, 2.0, 0, ?)',
+                 [(f'OLD{i}', '2024-01-05T09:00:00+07:00', '2024-01-05T10:00:00+07:00', 'x' * 500)
+                  for i in range(300)])
+conn.commit()
+park = CarPark.load_from_db(db, write_through=True)
+park.close_months('2024-02')
+assert conn.execute('SELECT COUNT(*) FROM transactions').fetchone()[0] == 0
+[spot] = park.park_many(['NOW1'])
+with contextlib.redirect_stdout(io.StringIO()):
+    park.remove_car(spot)
+
+
+# the gates keep committing between backup steps: the copy is the state
+# when it started, and finishes without restarting
+class CommitBetweenSteps:
+    steps = 0
+
+    @staticmethod
+    def sleep(seconds):
+        CommitBetweenSteps.steps += 1
+        with contextlib.redirect_stdout(io.StringIO()):
+            park.park_car(f'DURING{CommitBetweenSteps.steps}')
+
+
+pages = conn.execute('PRAGMA page_count').fetchone()[0]
+backup.time = CommitBetweenSteps
+try:
+    copy_path = backup.backup(db, backups, pages=1)
+finally:
+    backup.time = time
+assert 5 <= CommitBetweenSteps.steps <= pages + 1, (CommitBetweenSteps.steps, pages)
+assert os.listdir(os.path.join(os.path.dirname(copy_path), 'park-archive')) == ['2024-01.db']
+copy = CarPark.load_from_db(copy_path, write_through=True)
+assert copy.parked_cars == {}
+assert len(copy.query_transactions()) == 301 and len(copy.query_transactions(plate='OLD7')) == 1
+copy.detach_db()
+
+# only the newest backups are kept
+for _ in range(3):
+    backup.backup(db, backups, keep=2)
+kept = backup.list_backups(db, backups)
+assert len(kept) == 2 and sorted(os.listdir(backups)) == [os.path.basename(k) for k in kept]
+
+# maintenance gives the pages freed by deletes back in steps
+assert conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+conn.execute("UPDATE parked_spots SET comments = ?", ('y' * 3000,))
+conn.commit()
+conn.execute("UPDATE parked_spots SET comments = ''")
+conn.commit()
+assert conn.execute('PRAGMA freelist_count').fetchone()[0] > 0
+assert backup.maintain(db, pages=1) > 0
+assert conn.execute('PRAGMA freelist_count').fetchone()[0] == 0
+assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone()[0] == 1
+
+# a scheduled job runs once per day, inside its window, whichever process ticks first
+first = backup.Scheduler(db, backups, backup_at='02:30', maintain_at='03:30')
+second = backup.Scheduler(db, backups, backup_at='02:30', maintain_at='03:30')
+first.tick(datetime(2030, 1, 1, 2, 0))
+assert first.last == {}
+first.tick(datetime(2030, 1, 1, 2, 45))
+second.tick(datetime(2030, 1, 1, 2, 50))
+assert list(first.last) == ['backup'] and second.last == {}
+first.tick(datetime(2030, 1, 1, 9, 0))
+assert list(first.last) == ['backup']
+second.tick(datetime(2030, 1, 2, 3, 31))
+assert list(second.last) == ['maintain'] and second.last['maintain'][1] == 0
+park.detach_db()
+
+# the web app keeps its backups next to its database, and starts the
+# scheduler with the first request it serves rather than on import
+os.environ['CARPARK_DB'] = os.path.join(tmp, 'web.db')
+import app as web  # noqa: E402
+
+assert web.BACKUP_DIR == os.path.join(os.path.dirname(os.path.abspath(web.DB_PATH)), 'backups')
+web.app.test_client().get('/api/state')
+assert web.scheduler._thread is not None and web.scheduler.start()._thread is web.scheduler._thread
+
+print('All tests passed')
@@ -0,0 +1,62 @@
+import contextlib
+import io
+import os
+import sqlite3
+import tempfile
+
+os.environ['CARPARK_DB'] = os.path.join(tempfile.mkdtemp(), 'batch.db')
+import app as web  # noqa: E402
+from practice import CarPark  # noqa: E402
+
+# CarPark: one commit for the whole list, per-item results in order
+park = CarPark(3)
+assert park.park_many(['A1', 'B2', 'C3', 'D4']) == [1, 2, 3, None]
+txs = park.remove_many([2, 2, 9, None])
+assert txs[0]['plate'] == 'B2' and txs[1:] == [None, None, None]
+assert park.find_plate(' b2 ') is None and park.find_plate('c3') == 3
+
+web.carpark.detach_db()
+web.carpark = web.new_carpark(3)
+with contextlib.redirect_stdout(io.StringIO()):
+    web.carpark.park_car('OLD1')
+commits = []
+web.carpark._db.set_trace_callback(lambda sql: commits.append(sql) if sql == 'COMMIT' else None)
+
+client = web.app.test_client()
+assert client.post('/api/batch', json={'operations': []}).status_code == 401
+client.post('/api/login', json={'username': 'admin', 'password': 'admin'})
+version = web.carpark.version
+r = client.post('/api/batch', query_string={'since': version}, json={'operations': [
+    {'op': 'park', 'plate': 'GATE1'},
+    {'op': 'park', 'plate': 'GATE2'},
+    {'op': 'park', 'plate': 'GATE3'},
+    {'op': 'remove', 'plate': 'gate1'},
+    {'op': 'remove', 'spot': 1},
+    {'op': 'remove', 'plate': 'NOPE'},
+    {'op': 'park', 'plate': 'GATE4'},
+]})
+assert r.status_code == 200
+body = r.get_json()
+results = body['results']
+assert [res['ok'] for res in results] == [True, True, False, True, True, False, True]
+assert results[0]['spot'] == 2 and results[2]['error'] == 'Car park is full'
+assert results[3]['transaction']['plate'] == 'GATE1' and results[4]['transaction']['plate'] == 'OLD1'
+assert results[5]['error'] == 'Car not found' and results[6]['spot'] == 1
+assert commits == ['COMMIT']
+assert body['delta']['delta'] and body['delta']['version'] == web.carpark.version
+assert {s['spot'] for s in body['delta']['spots']} == {1, 2, 3}
+
+# stored as one commit, as if applied one by one
+conn = sqlite3.connect(web.DB_PATH)
+assert conn.execute('SELECT spot, plate FROM parked_spots ORDER BY spot').fetchall() == [(1, 'GATE4'), (3, 'GATE2')]
+assert conn.execute('SELECT COUNT(*) FROM transactions').fetchone()[0] == 2
+conn.close()
+
+# malformed operations reject the whole batch
+before = web.carpark.version
+for ops in (None, [{'op': 'park'}], [{'op': 'remove', 'spot': 'x'}], [{'op': 'fly'}], ['park'],
+            [{'op': 'park', 'plate': 'X'}] * (web.MAX_BATCH_OPERATIONS + 1)):
+    assert client.post('/api/batch', json={'operations': ops}).status_code == 400
+assert web.carpark.version == before
+
+print('All tests passed')
@@ -0,0 +1,73 @@
+import contextlib
+import io
+import os
+import tempfile
+
+from practice import CarPark
+
+db = os.path.join(tempfile.mkdtemp(), 'history.db')
+p = CarPark(2)
+p.attach_db(db)
+with contextlib.redirect_stdout(io.StringIO()):
+    for i in range(50):
+        p.park_car(f'P{i:03d}')
+        p.remove_car(1)
+
+q = CarPark.load_from_db(db, write_through=True, history_limit=10)
+assert [t['id'] for t in q.transactions] == list(range(41, 51))
+with contextlib.redirect_stdout(io.StringIO()):
+    for i in range(5):
+        q.park_car('NEW')
+        q.remove_car(1)
+# the window is trimmed in chunks, never below the limit
+assert 10 <= len(q.transactions) <= 11 and q.transactions[-1]['id'] == 55
+
+# older history is paged from SQLite on demand
+ids = [t['id'] for t in q.iter_history(batch_size=7)]
+assert ids == list(range(55, 0, -1))
+assert [t['id'] for t in q.iter_history(batch_size=4, newest_first=False, plate='P000')] == [1]
+# exports still contain everything
+assert len(q.to_dict()['transactions']) == 55
+copy = os.path.join(tempfile.mkdtemp(), 'copy.db')
+q.save_to_db(copy)
+assert len(CarPark.load_from_db(copy).transactions) == 55
+
+# an edit from another process outside the window is not pulled in
+p.refresh()
+p.update_transaction(p.transactions[0], paid=True)
+q.refresh()
+assert q.transactions[0]['id'] > 1
+
+# by age: nothing here is older than today
+r = CarPark.load_from_db(db, write_through=True, history_days=1)
+assert len(r.transactions) == 55
+for park in (p, q, r):
+    park.detach_db()
+
+# a stay ended before the window by hours_override is still returned
+old = os.path.join(tempfile.mkdtemp(), 'old.db')
+CarPark(2).attach_db(old)
+o = CarPark.load_from_db(old, write_through=True, history_days=1)
+[spot] = o.park_many(['BACKDATED'])
+o.parked_cars[spot]['time_in'] = '2001-02-03T08:00:00+00:00'
+with contextlib.redirect_stdout(io.StringIO()):
+    tx = o.remove_car(spot, hours_override=1)
+assert tx['plate'] == 'BACKDATED' and tx['time_out'].startswith('2001-02-03T09:00')
+assert spot not in o.parked_cars and o.get_transaction(tx['id'])['plate'] == 'BACKDATED'
+assert CarPark.load_from_db(old).get_transaction(tx['id'])['plate'] == 'BACKDATED'
+o.detach_db()
+
+# a park from a file replaces what the database held, bounded or not
+path = os.path.join(tempfile.mkdtemp(), 'park.json')
+f = CarPark(2)
+with contextlib.redirect_stdout(io.StringIO()):
+    f.park_car('FILE1')
+    f.remove_car(1)
+f.save_to_file(path)
+f = CarPark.load_from_file(path)
+f.history_limit = 10
+f.attach_db(db)
+assert [t['plate'] for t in f.iter_history()] == ['FILE1']
+assert [t['plate'] for t in CarPark.load_from_db(db).transactions] == ['FILE1']
+f.detach_db()
+print('All tests passed')
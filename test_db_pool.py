@@ -0,0 +1,34 @@
+import os
+import tempfile
+import threading
+
+import db
+
+path = os.path.join(tempfile.mkdtemp(), 'pool.db')
+conn = db.connection(path)
+assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+assert conn.execute('PRAGMA synchronous').fetchone()[0] == 1  # NORMAL
+assert conn.execute('PRAGMA busy_timeout').fetchone()[0] == 5000
+
+# one connection per thread and file, reused
+assert db.connection(path) is conn and db.connection(os.path.join(os.path.dirname(path), '.', 'pool.db')) is conn
+other = []
+t = threading.Thread(target=lambda: other.append(db.connection(path)))
+t.start()
+t.join()
+assert other[0] is not conn
+
+# release() rolls back what a failed request left open
+conn.execute('CREATE TABLE t (x)')
+conn.execute('BEGIN')
+conn.execute('INSERT INTO t VALUES (1)')
+db.release()
+assert not conn.in_transaction and conn.execute('SELECT COUNT(*) FROM t').fetchone()[0] == 0
+
+# close_all() closes every thread's connection; the next call opens a new one
+db.close_all()
+fresh = db.connection(path)
+assert fresh is not conn and fresh.execute('SELECT COUNT(*) FROM t').fetchone()[0] == 0
+db.release()
+
+print('All tests passed')
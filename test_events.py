@@ -0,0 +1,61 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+
+os.environ['CARPARK_DB'] = os.path.join(tempfile.mkdtemp(), 'events.db')
+import app as web  # noqa: E402
+from change_feed import ChangeFeed  # noqa: E402
+from practice import CarPark  # noqa: E402
+
+# a fresh park of our own: app may already be imported (and its park
+# used) by another test module in this process
+web.carpark.detach_db()
+park = web.carpark = web.new_carpark(5)
+feed = ChangeFeed(web.DB_PATH)
+start = feed.latest_version()
+assert feed.changed() and not feed.changed()
+
+# another worker's changes come out as small events with the current rows
+other = CarPark.load_from_db(web.DB_PATH, write_through=True)
+with contextlib.redirect_stdout(io.StringIO()):
+    other.park_car('AAA111')
+    other.park_car('BBB222')
+    other.update_comments(2, 'blue van')
+    other.remove_car(1)
+other.set_rate(3.5)
+assert feed.changed()
+version, events = feed.events_since(start)
+assert version == start + 5 and [e['version'] for e in events] == list(range(start + 1, start + 6))
+assert [e['type'] for e in events] == ['park', 'park', 'comment', 'remove', 'rate']
+assert events[0]['car'] is None  # spot 1 is already free again
+assert events[2]['car'] == {'spot': 2, 'plate': 'BBB222', 'time_in': events[2]['car']['time_in'],
+                            'comments': 'blue van'}
+assert events[3]['transaction']['plate'] == 'AAA111' and events[4]['rate_per_hour'] == 3.5
+assert feed.events_since(version) == (version, [])
+# a pruned gap or a full rewrite asks clients to reload
+assert feed.events_since(-5)[1] == [{'version': version, 'type': 'reset'}]
+other.save_to_db(web.DB_PATH + '.copy')
+other.detach_db()
+feed.close()
+
+# the HTTP stream: ids are versions, data is the event
+web.EVENT_STREAM_SECONDS = 0.2
+web.EVENT_POLL_SECONDS = 0.01
+client = web.app.test_client()
+assert client.get('/api/events').status_code == 401
+client.post('/api/login', json={'username': 'admin', 'password': 'admin'})
+state = client.get('/api/state').get_json()
+assert state['version'] == version and state['rate_per_hour'] == 3.5
+assert client.get('/api/events?since=x').status_code == 400
+r = client.get(f'/api/events?since={start}')
+assert r.mimetype == 'text/event-stream' and r.headers['X-Accel-Buffering'] == 'no'
+frames = [f for f in r.get_data(as_text=True).split('\n\n') if f.startswith('id:')]
+assert [int(f.split('\n')[0][4:]) for f in frames] == list(range(start + 1, version + 1))
+assert json.loads(frames[-1].split('data: ')[1])['type'] == 'rate'
+# Last-Event-ID resumes after the last event seen
+r = client.get('/api/events', headers={'Last-Event-ID': str(version - 1)})
+assert r.get_data(as_text=True).count('id: ') == 1
+park.detach_db()
+print('All tests passed')
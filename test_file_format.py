@@ -0,0 +1,72 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import types
+
+from practice import FILE_FORMAT, FILE_VERSION, CarPark
+
+tmp = tempfile.mkdtemp()
+path = os.path.join(tmp, 'park.ndjson')
+
+p = CarPark(3)
+p.rate_per_hour = 2.5
+with contextlib.redirect_stdout(io.StringIO()):
+    for plate in ('A1', 'B2', 'C3'):
+        p.park_car(plate)
+    p.remove_car(2)
+    p.update_comments(1, 'line one\nline two')
+
+# a header, then one line per parked car and per transaction
+assert isinstance(p.file_lines(), types.GeneratorType)
+p.save_to_file(path)
+with open(path, encoding='utf-8') as f:
+    lines = [json.loads(line) for line in f]
+assert lines[0] == {'format': FILE_FORMAT, 'version': FILE_VERSION, 'capacity': 3, 'rate_per_hour': 2.5}
+assert [(rec['kind'], rec.get('spot')) for rec in lines[1:]] == [('car', 1), ('car', 3), ('transaction', 2)]
+assert not [name for name in os.listdir(tmp) if name.endswith('.tmp')]
+
+q = CarPark.load_from_file(path)
+assert q.to_dict() == p.to_dict()
+assert q.parked_cars[1]['comments'] == 'line one\nline two'
+
+# a save that fails part-way leaves the previous file as it was
+before = open(path, encoding='utf-8').read()
+good_lines = list(p.file_lines())
+
+
+def failing_lines():
+    yield from good_lines[:2]
+    raise OSError('disk full')
+
+
+p.file_lines = failing_lines
+try:
+    p.save_to_file(path)
+    raise AssertionError('save should fail')
+except OSError:
+    pass
+del p.file_lines
+assert open(path, encoding='utf-8').read() == before
+assert os.listdir(tmp) == ['park.ndjson']
+
+# the older single-document layout still loads, indented or not
+for indent in (2, None):
+    legacy = os.path.join(tmp, f'legacy-{indent}.json')
+    with open(legacy, 'w', encoding='utf-8') as f:
+        json.dump(p.to_dict(), f, indent=indent)
+    assert CarPark.load_from_file(legacy).to_dict() == p.to_dict()
+
+# unknown records and newer versions are refused
+for bad in ([{'format': FILE_FORMAT, 'version': FILE_VERSION, 'capacity': 1}, {'kind': 'bicycle'}],
+            [{'format': FILE_FORMAT, 'version': FILE_VERSION + 1, 'capacity': 1}]):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.writelines(json.dumps(rec) + '\n' for rec in bad)
+    try:
+        CarPark.load_from_file(path)
+        raise AssertionError('load should fail')
+    except ValueError:
+        pass
+
+print('All tests passed')
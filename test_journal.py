@@ -0,0 +1,73 @@
+import contextlib
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import journal
+import snapshot
+from practice import CarPark
+
+tmp = tempfile.mkdtemp()
+db = os.path.join(tmp, 'park.db')
+snap = db + '.snapshot'
+
+
+# concurrent callers share fsyncs
+class SlowDisk(journal.GroupCommit):
+    def _fsync(self):
+        time.sleep(0.02)
+
+
+group = SlowDisk(db)
+start = threading.Barrier(8)
+
+
+def caller():
+    start.wait()
+    for _ in range(5):
+        group.sync()
+
+
+threads = [threading.Thread(target=caller) for _ in range(8)]
+for t in threads:
+    t.start()
+for t in threads:
+    t.join()
+assert group._synced == group._requested == 40
+assert group.fsyncs < 20, group.fsyncs
+
+# a durable park syncs after each commit
+park = CarPark(4)
+park.attach_db(db, durable=True)
+with contextlib.redirect_stdout(io.StringIO()):
+    park.park_car('AAA111')
+assert park._journal.fsyncs == 1
+park.detach_db()
+
+# a worker that dies without closing anything: its acknowledged changes are
+# all read back, from the checkpoint snapshot plus the changes made after it
+child = f'''
+import os, sys
+sys.path.insert(0, {os.getcwd()!r})
+import practice
+practice.SNAPSHOT_REFRESH_CHANGES = 5
+park = practice.CarPark.load_from_db({db!r}, write_through=True, snapshot={snap!r}, durable=True)
+for i in range(12):
+    park.park_car(f'P{{i}}')
+    park.remove_car(park.find_plate(f'P{{i}}'))
+park.park_car('LAST')
+os._exit(0)
+'''
+subprocess.run([sys.executable, '-c', child], check=True, stdout=subprocess.DEVNULL)
+checkpoint = snapshot.read(snap).meta['version']
+recovered = CarPark.load_from_db(db, write_through=True, snapshot=snap)
+assert recovered.version - checkpoint < 5 + 1
+assert [tx['plate'] for tx in recovered.transactions if tx['time_out']] == [f'P{i}' for i in range(12)]
+assert sorted(rec['plate'] for rec in recovered.parked_cars.values()) == ['AAA111', 'LAST']
+recovered.detach_db()
+
+print('All tests passed')
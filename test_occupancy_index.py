@@ -0,0 +1,97 @@
+import contextlib
+import io
+import os
+import random
+import tempfile
+from datetime import datetime, timedelta
+
+os.environ['CARPARK_DB'] = os.path.join(tempfile.mkdtemp(), 'occupancy.db')
+import app as web  # noqa: E402
+import occupancy_index  # noqa: E402
+from occupancy_index import OccupancyIndex  # noqa: E402
+from practice import CarPark  # noqa: E402
+
+# the index against a scan; small checkpoints so inserts redo across several
+occupancy_index.CHECKPOINT = 8
+rnd = random.Random(5)
+base = datetime(2024, 3, 1)
+stays = []
+for i in range(300):
+    time_in = base + timedelta(minutes=rnd.randrange(10 * 1440))
+    time_out = time_in + timedelta(minutes=rnd.randrange(3000))
+    stays.append({'id': i + 1, 'spot': i % 40 + 1, 'plate': f'P{i}',
+                  'time_in': time_in.isoformat(), 'time_out': time_out.isoformat()})
+parked = {100 + k: {'plate': f'Q{k}', 'time_in': (base + timedelta(minutes=rnd.randrange(10 * 1440))).isoformat()}
+          for k in range(10)}
+
+
+def inside(when):
+    found = {s['plate'] for s in stays if s['time_in'] <= when.isoformat() < s['time_out']}
+    return found | {r['plate'] for r in parked.values() if r['time_in'] <= when.isoformat()}
+
+
+index = OccupancyIndex(stays[:200], parked)
+for stay in stays[200:]:
+    # arrivals and departures out of time order
+    index.arrive(1000 + stay['id'], stay['plate'], stay['time_in'])
+    index.depart(1000 + stay['id'], stay)
+for _ in range(200):
+    when = base + timedelta(minutes=rnd.randrange(-100, 13 * 1440))
+    assert {s['plate'] for s in index.parked_at(when)} == inside(when)
+    assert index.count_at(when) == len(inside(when))
+for d in range(12):
+    day = base + timedelta(days=d)
+    moments = [day] + [datetime.fromisoformat(s['time_in']) for s in stays + list(parked.values())]
+    expected = max(len(inside(m)) for m in moments if day <= m < day + timedelta(days=1))
+    assert index.peak(day.date()) == expected
+occupancy_index.CHECKPOINT = 256
+
+# a park: kept in step as cars come and go
+memory = CarPark(5)
+with contextlib.redirect_stdout(io.StringIO()):
+    memory.park_many(['A1', 'B2'])
+    before = datetime.now().astimezone()
+    assert [c['plate'] for c in memory.parked_at(before)] == ['A1', 'B2']
+    memory.park_car('C3')
+    left = memory.remove_car(1, hours_override=0)
+    # arrived and left at the same instant: never inside
+    assert 'A1' not in [c['plate'] for c in memory.parked_at(left['time_in'])]
+    memory.remove_car(2)
+cars = memory.parked_at(datetime.now().astimezone())
+assert [(c['plate'], c['time_out']) for c in cars] == [('C3', None)]
+# three cars were in, but A1's recorded stay (hours_override=0) is empty
+assert memory.peak_occupancy(before.date()) == 2
+assert memory.peak_occupancy('1999-01-01') == 0
+assert memory.parked_at('1999-01-01T00:00:00') == []
+try:
+    memory.parked_at('noon')
+    raise AssertionError('expected ValueError')
+except ValueError:
+    pass
+
+# attached: rebuilt after another worker's changes
+web.carpark.detach_db()
+park = web.carpark = web.new_carpark(5)
+with contextlib.redirect_stdout(io.StringIO()):
+    park.park_many(['X1', 'Y2'])
+    assert park.peak_occupancy(before.date()) == 2
+    other = CarPark.load_from_db(web.DB_PATH, write_through=True)
+    other.park_car('Z3')
+    other.remove_car(1)
+    other.detach_db()
+park.refresh()
+assert [c['plate'] for c in park.parked_at(datetime.now().astimezone())] == ['Y2', 'Z3']
+assert park.peak_occupancy(before.date()) == 3
+
+client = web.app.test_client()
+assert client.get('/api/occupancy').status_code == 403
+client.post('/api/login', json={'username': 'admin', 'password': 'admin'})
+body = client.get('/api/occupancy').get_json()
+assert body['count'] == 2 and [c['spot'] for c in body['cars']] == [2, 3]
+assert client.get('/api/occupancy', query_string={'at': '1999-01-01T00:00'}).get_json()['cars'] == []
+assert client.get('/api/occupancy?at=noon').status_code == 400
+body = client.get('/api/occupancy/peak').get_json()
+assert body['peak_occupancy'] == 3 and body['day'] == datetime.now(park.tz).date().isoformat()
+assert client.get('/api/occupancy/peak?day=today').status_code == 400
+
+print('All tests passed')
@@ -0,0 +1,47 @@
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+
+from practice import CarPark
+
+tmp = tempfile.mkdtemp()
+
+# a file in the old layout: occupancy as a JSON blob in carpark_state
+legacy = os.path.join(tmp, 'legacy.db')
+conn = sqlite3.connect(legacy)
+conn.execute('CREATE TABLE carpark_state (id INTEGER PRIMARY KEY, capacity INTEGER, rate_per_hour REAL, '
+             'parked_cars TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)')
+conn.execute('CREATE TABLE transactions (id INTEGER PRIMARY KEY AUTOINCREMENT, spot INTEGER, plate TEXT, '
+             "time_in TEXT, time_out TEXT, amount REAL, paid INTEGER, comments TEXT DEFAULT '', "
+             'created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)')
+blob = {'1': {'plate': 'OLD001', 'time_in': '2024-05-01T08:00:00+07:00', 'comments': 'keys at desk'},
+        '3': {'plate': 'OLD003', 'time_in': '2024-05-01T09:00:00+07:00', 'comments': ''}}
+conn.execute('INSERT INTO carpark_state (capacity, rate_per_hour, parked_cars) VALUES (?, ?, ?)',
+             (5, 2.5, json.dumps(blob)))
+conn.commit()
+conn.close()
+copy = os.path.join(tmp, 'copy.db')
+shutil.copy(legacy, copy)
+
+# read-only load understands the blob layout
+p = CarPark.load_from_db(legacy)
+assert p.parked_cars[1]['comments'] == 'keys at desk' and p.rate_per_hour == 2.5
+
+# attaching migrates it to one row per spot
+p = CarPark.load_from_db(copy, write_through=True)
+assert p.park_car('NEW002')
+p.update_comments(3, 'VIP')
+rows = sqlite3.connect(copy).execute('SELECT spot, plate, comments FROM parked_spots ORDER BY spot').fetchall()
+assert rows == [(1, 'OLD001', 'keys at desk'), (2, 'NEW002', ''), (3, 'OLD003', 'VIP')], rows
+
+# single spots can be re-read from the table
+other = CarPark.load_from_db(copy, write_through=True)
+p.remove_car(1)
+assert other.load_spot(1) is None and 1 not in other.parked_cars
+assert other.load_spot(3)['comments'] == 'VIP'
+assert other.park_car('NEW001') and other.parked_cars[1]['plate'] == 'NEW001'
+p.detach_db()
+other.detach_db()
+print('All tests passed')
@@ -0,0 +1,71 @@
+import contextlib
+import io
+import os
+import tempfile
+
+os.environ['CARPARK_DB'] = os.path.join(tempfile.mkdtemp(), 'plates.db')
+import app as web  # noqa: E402
+import plate_index  # noqa: E402
+from plate_index import LazyPlateIndex, PlateIndex  # noqa: E402
+from practice import CarPark  # noqa: E402
+
+index = PlateIndex(['ab123', 'XAB12', 'ZZ999', ' ab1 '])
+index.add('QAB123')
+assert len(index) == 5 and 'Ab123' in index and 'AB' not in index
+assert index.search('ab1') == ['AB1', 'AB123', 'QAB123', 'XAB12']  # exact, prefix, substring
+assert index.search('ab') == ['AB1', 'AB123']  # substrings need 3 characters
+assert index.search('AB1', limit=2) == ['AB1', 'AB123'] and index.search(' ') == []
+# the sorted blocks split as they fill, one add at a time or many
+plate_index.BLOCK = 4
+blocks = PlateIndex(f'P{n:03d}' for n in range(0, 40, 2))
+for n in range(39, 0, -2):
+    blocks.add(f'P{n:03d}')
+blocks.add('P003')
+assert list(blocks.known()) == [f'P{n:03d}' for n in range(40)] and max(map(len, blocks._blocks)) < 8
+assert blocks.search('P00') == [f'P{n:03d}' for n in range(10)] and blocks.search('P02', limit=3) == ['P020', 'P021', 'P022']
+assert 'P017' in blocks and 'P040' not in blocks
+plate_index.BLOCK = 1000
+index.park('zz999', 4)
+index.park('ZZ999', 2)
+assert index.spot(' zz999') == 2
+index.unpark('ZZ999', 2)
+assert index.spot('ZZ999') == 4 and index.spot('AB1') is None
+
+# CarPark keeps it in step with parking, removal and other workers
+out = io.StringIO()
+web.carpark.detach_db()
+park = web.carpark = web.new_carpark(5)
+other = CarPark.load_from_db(web.DB_PATH, write_through=True)
+with contextlib.redirect_stdout(out):
+    park.park_many(['KA1234', 'KB5678', 'MA1234'])
+    park.remove_car(1)
+    other.refresh()
+    other.park_car('NEW777')
+assert park.search_plates('a12') == [{'plate': 'KA1234', 'spot': None}, {'plate': 'MA1234', 'spot': 3}]
+assert park.find_plate('new777') is None
+park.refresh()
+assert park.find_plate('new777') == 1 and park.search_plates('NEW') == [{'plate': 'NEW777', 'spot': 1}]
+with contextlib.redirect_stdout(out):
+    other.remove_car(3)
+park.refresh()
+assert park.find_plate('MA1234') is None and 'MA1234' in park.plates
+
+# history beyond the in-memory window is still searchable
+bounded = CarPark.load_from_db(web.DB_PATH, write_through=True, history_limit=1)
+assert isinstance(bounded.plates, LazyPlateIndex) and '_grams' not in vars(bounded.plates)
+assert len(bounded.transactions) == 1 and {'KA1234', 'MA1234', 'KB5678', 'NEW777'} <= set(bounded.plates._plates)
+bounded.detach_db()  # read before the database goes
+assert bounded.search_plates('KB5') == [{'plate': 'KB5678', 'spot': 2}]
+assert CarPark.from_dict(park.to_dict()).search_plates('1234') == park.search_plates('1234')
+
+client = web.app.test_client()
+assert client.get('/api/search?q=K').status_code == 401
+client.post('/api/login', json={'username': 'admin', 'password': 'admin'})
+body = client.get('/api/search?q=k').get_json()
+assert [r['plate'] for r in body['results']] == ['KA1234', 'KB5678']
+assert body['results'][1]['spot'] == 2 and body['results'][1]['car']['plate'] == 'KB5678'
+assert body['results'][0]['car'] is None
+assert client.get('/api/search?q=k&limit=x').status_code == 400
+assert client.get('/api/search?q=').get_json()['results'] == []
+
+print('All tests passed')
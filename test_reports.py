@@ -0,0 +1,114 @@
+import contextlib
+import io
+import os
+import sqlite3
+import tempfile
+from datetime import datetime
+
+os.environ['CARPARK_DB'] = os.path.join(tempfile.mkdtemp(), 'reports.db')
+import app as web  # noqa: E402
+import rollups  # noqa: E402
+from practice import CarPark  # noqa: E402
+
+
+def stored(park):
+    return rollups.Rollups.from_rows({p: rollups.rows_sql(park._db, p) for p in rollups.PERIODS}).buckets
+
+
+def without_peaks(buckets):
+    # live peaks count real departures; a recount only knows the recorded
+    # time_out, which hours_override moves
+    return {p: {b: dict(r, peak_occupancy=0) for b, r in rows.items()} for p, rows in buckets.items()}
+
+
+def exercise(park):
+    with contextlib.redirect_stdout(io.StringIO()):
+        park.park_many(['A1', 'B2', 'C3'])
+        first = park.remove_car(1, hours_override=2, amount_override=5)
+        park.remove_car(2, hours_override=0.5)
+        park.park_car('D4')
+        park.mark_paid([first['id']])
+        park.mark_paid([first['id']])  # already paid: no change
+        park.update_transaction(park.get_transaction(first['id']), amount=7.25)
+        park.remove_car(1)
+    return first
+
+
+today = datetime.now().astimezone().date()
+
+# memory only: kept in step incrementally, same as a full recount
+memory = CarPark(5)
+exercise(memory)
+assert without_peaks(memory._rollups.buckets) == \
+    without_peaks(rollups.compute(memory.transactions, memory.parked_cars).buckets)
+totals = memory.report_totals(today, today)
+assert totals['transactions'] == 3 and totals['paid'] == 7.25 and totals['peak_occupancy'] == 3
+assert totals['total'] == 8.25  # 7.25 edited + 1.00 for half an hour + 0.00
+assert totals['unpaid'] == round(totals['total'] - 7.25, 2)
+assert totals['average_dwell_minutes'] >= 50  # (120 + 30 + ~0) / 3
+assert sum(r['transactions'] for r in memory.report('hourly', today, today)) == 3
+assert memory.report('daily', '1999-01-01', '1999-12-31') == []
+assert memory.report_totals('1999-01-01', '1999-01-01')['average_dwell_minutes'] is None
+
+# attached: the tables, also across workers and after a full rewrite
+web.carpark.detach_db()
+park = web.carpark = web.new_carpark(5)
+exercise(park)
+other = CarPark.load_from_db(web.DB_PATH, write_through=True)
+with contextlib.redirect_stdout(io.StringIO()):
+    other.remove_car(3)
+other.mark_paid([tx['id'] for tx in other.query_transactions()], paid=True)
+other.mark_paid([other.query_transactions()[0]['id']], paid=False)
+other.detach_db()
+assert without_peaks(stored(park)) == without_peaks(rollups.compute(park.query_transactions(), {}).buckets)
+assert park.report_totals(today, today)['transactions'] == 4
+park.refresh()  # the car another worker removed
+copy = os.path.join(tempfile.mkdtemp(), 'copy.db')
+park.save_to_db(copy)
+assert CarPark.load_from_db(copy).report('daily') == park.report('daily')
+
+# a version 2 file gets its rollups built on upgrade
+conn = sqlite3.connect(copy)
+conn.executescript('DROP TABLE rollup_daily; DROP TABLE rollup_hourly; PRAGMA user_version = 2;')
+conn.close()
+upgraded = CarPark.load_from_db(copy, write_through=True)
+assert without_peaks(stored(upgraded)) == without_peaks(stored(park))
+before = upgraded.report('hourly')
+upgraded.detach_db()
+assert upgraded.report('hourly') == before  # kept in memory after detaching
+
+# a day the cars spent parked, without arrivals or departures: the cars
+# carried into a bucket count towards its peak
+stays = [{'spot': i, 'plate': f'S{i}', 'time_in': '2024-03-01T10:00:00+00:00',
+          'time_out': '2024-03-03T10:00:00+00:00', 'amount': 1.0, 'paid': False} for i in (1, 2, 3)]
+parked = {4: {'plate': 'LATE', 'time_in': '2024-03-01T12:00:00+00:00', 'comments': ''}}
+carried = CarPark.from_dict({'capacity': 5, 'transactions': stays, 'parked_cars': parked})
+carried_db = os.path.join(tempfile.mkdtemp(), 'carried.db')
+carried.save_to_db(carried_db)
+for p in (carried, CarPark.load_from_db(carried_db)):
+    assert p.report_totals('2024-03-02', '2024-03-02')['peak_occupancy'] == 4
+    assert [r['peak_occupancy'] for r in p.report('daily', '2024-03-01', '2024-03-05')] == [4, 4]
+    assert [r['peak_occupancy'] for r in p.report('hourly', '2024-03-03T10', '2024-03-03T10')] == [4]
+    assert p.report_totals('2024-03-05', '2024-03-05')['peak_occupancy'] == 1
+    assert p.report_totals('2024-02-01', '2024-02-29')['peak_occupancy'] == 0
+
+# a version 3 file gets its arrivals counted on upgrade
+conn = sqlite3.connect(carried_db)
+conn.executescript('ALTER TABLE rollup_daily DROP COLUMN arrivals; ALTER TABLE rollup_hourly DROP COLUMN arrivals; '
+                   'PRAGMA user_version = 3;')
+conn.close()
+assert CarPark.load_from_db(carried_db).report('daily') == carried.report('daily')
+
+client = web.app.test_client()
+assert client.get('/api/reports/daily').status_code == 401
+client.post('/api/login', json={'username': 'admin', 'password': 'admin'})
+body = client.get('/api/reports/daily').get_json()
+assert body['day'] == today.isoformat() and body['totals'] == park.report_totals(today, today)
+assert body['hours'] == park.report('hourly', today, today)
+body = client.get('/api/reports/range', query_string={'from': today.isoformat(), 'period': 'hourly'}).get_json()
+assert body['rows'] == park.report('hourly', today, today) and body['totals'] == park.report_totals(today, today)
+assert client.get('/api/reports/range?period=weekly').status_code == 400
+assert client.get('/api/reports/range?from=2024-02-01&to=2024-01-01').status_code == 400
+assert client.get('/api/reports/daily?day=yesterday').status_code == 400
+
+print('All tests passed')
@@ -0,0 +1,103 @@
+import contextlib
+import io
+import os
+import random
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+os.environ['CARPARK_DB'] = os.path.join(tempfile.mkdtemp(), 'revenue.db')
+import app as web  # noqa: E402
+from practice import CarPark  # noqa: E402
+from revenue_index import RevenueIndex  # noqa: E402
+
+# the index against a plain scan, entries in random order (grows and rebases)
+rnd = random.Random(7)
+base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+entries = [(base + timedelta(minutes=rnd.randrange(-3000, 90 * 1440), seconds=rnd.randrange(60)),
+            rnd.randrange(5000)) for _ in range(1500)]
+built = RevenueIndex(entries)
+grown = RevenueIndex()
+for when, cents in entries:
+    grown.add(when, cents)
+for _ in range(200):
+    start = base + timedelta(minutes=rnd.randrange(-4000, 91 * 1440))
+    end = start + timedelta(minutes=rnd.randrange(20000))
+    lo, hi = start.replace(second=0), end.replace(second=0)
+    hits = [cents for when, cents in entries if lo <= when < hi]
+    assert built.between(start, end) == grown.between(start, end) == (sum(hits), len(hits))
+grown.add(entries[0][0], -entries[0][1], -1)
+assert grown.between(base - timedelta(days=9), base + timedelta(days=99)) == \
+    (sum(c for _, c in entries[1:]), len(entries) - 1)
+assert RevenueIndex().between(base, base + timedelta(days=1)) == (0, 0)
+assert built.between(base + timedelta(days=2), base + timedelta(days=1)) == (0, 0)
+# only the minutes that occur are stored, however far apart
+sparse = RevenueIndex([(base, 100), (base + timedelta(hours=10 ** 6), 5)])
+assert len(sparse._days.keys) == 2 and sum(len(t.keys) for t in sparse._minutes.values()) == 2
+assert sparse.between(base, base + timedelta(hours=2 * 10 ** 6)) == (105, 2)
+
+
+def exercise(park):
+    with contextlib.redirect_stdout(io.StringIO()):
+        park.park_many(['A1', 'B2', 'C3'])
+        first = park.remove_car(1, hours_override=2, amount_override=5)
+        park.remove_car(2, amount_override=1.5)
+        park.update_transaction(park.get_transaction(first['id']), amount=7.25)
+    return first
+
+
+now = datetime.now().astimezone()
+day_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+tomorrow = (day_start + timedelta(days=1)).date()
+
+memory = CarPark(5)
+first = exercise(memory)
+assert memory.revenue_between(day_start.date(), tomorrow) == {'revenue': 8.75, 'transactions': 2}
+assert memory.revenue_between(first['time_out'], tomorrow)['transactions'] >= 1
+assert memory.revenue_between('1999-01-01', '2000-01-01') == {'revenue': 0.0, 'transactions': 0}
+assert CarPark.from_dict(memory.to_dict()).revenue_between(day_start, tomorrow) == \
+    memory.revenue_between(day_start, tomorrow)
+try:
+    memory.revenue_between('yesterday', tomorrow)
+    raise AssertionError('expected ValueError')
+except ValueError:
+    pass
+
+# attached: loaded from the file, and kept in step with other workers
+web.carpark.detach_db()
+park = web.carpark = web.new_carpark(5)
+first = exercise(park)
+other = CarPark.load_from_db(web.DB_PATH, write_through=True)
+assert other.revenue_between(day_start, tomorrow) == {'revenue': 8.75, 'transactions': 2}
+with contextlib.redirect_stdout(io.StringIO()):
+    other.remove_car(3, amount_override=2)
+other.update_transaction(other.get_transaction(first['id']), amount=1)
+park.refresh()
+assert park.revenue_between(day_start, tomorrow) == {'revenue': 4.5, 'transactions': 3}
+
+# an edit to a transaction outside a bounded window: rebuilt on demand
+windowed = CarPark.load_from_db(web.DB_PATH, write_through=True, history_limit=1)
+other.update_transaction(other.get_transaction(first['id']), amount=3)
+windowed.refresh()
+assert windowed.revenue_between(day_start, tomorrow) == {'revenue': 6.5, 'transactions': 3}
+other.detach_db()
+windowed.detach_db()
+
+client = web.app.test_client()
+assert client.get('/api/reports/revenue').status_code == 401
+client.post('/api/login', json={'username': 'admin', 'password': 'admin'})
+body = client.get('/api/reports/revenue', query_string={'start': day_start.date().isoformat(),
+                                                       'end': tomorrow.isoformat()}).get_json()
+assert body['revenue'] == 6.5 and body['transactions'] == 3 and body['start'] == day_start.date().isoformat()
+body = client.get('/api/reports/revenue').get_json()
+assert body['start'] < body['end']
+assert client.get('/api/reports/revenue?start=soon').status_code == 400
+
+# stays are capped, in the API and in remove_car
+[spot] = web.carpark.park_many(['LONG'])
+assert client.post('/api/remove', json={'spot': spot, 'hours_override': 10 ** 6}).status_code == 400
+with contextlib.redirect_stdout(io.StringIO()):
+    tx = web.carpark.remove_car(spot, hours_override=10 ** 6)
+assert datetime.fromisoformat(tx['time_out']) - datetime.fromisoformat(tx['time_in']) == \
+    timedelta(hours=web.MAX_OVERRIDE_HOURS)
+
+print('All tests passed')
@@ -0,0 +1,41 @@
+import os
+import tempfile
+
+from practice import CarPark
+
+db = os.path.join(tempfile.mkdtemp(), 'shared.db')
+
+# two "workers" attached to the same file
+a = CarPark(4)
+a.attach_db(db)
+b = CarPark.load_from_db(db, write_through=True)
+
+assert a.park_car('AAA111')
+assert b.park_car('BBB222')
+# b saw a's car before choosing a spot
+assert b.parked_cars[2]['plate'] == 'BBB222'
+assert not a.refresh() or a.parked_cars[2]['plate'] == 'BBB222'
+assert not a.refresh()
+
+tx = a.remove_car(2)
+assert b.refresh()
+assert 2 not in b.parked_cars
+assert b.transactions[-1]['id'] == tx['id']
+b.update_transaction(b.transactions[-1], paid=True)
+a.refresh()
+assert a.transactions[-1]['paid']
+
+b.set_rate(5.0)
+a.update_comments(1, 'rear bumper')
+b.refresh()
+assert b.parked_cars[1]['comments'] == 'rear bumper'
+a.refresh()
+assert a.rate_per_hour == 5.0
+
+# a reset (new park written over the file) reloads everything
+c = CarPark(8)
+c.attach_db(db)
+assert a.refresh() and a.capacity == 8 and not a.parked_cars and not a.transactions
+for park in (a, b, c):
+    park.detach_db()
+print('All tests passed')
@@ -0,0 +1,100 @@
+import contextlib
+import io
+import os
+import tempfile
+
+import snapshot
+from practice import CarPark
+
+tmp = tempfile.mkdtemp()
+
+# memory-only round trip, read in place until the first change
+p = CarPark(5)
+with contextlib.redirect_stdout(io.StringIO()):
+    for plate in ('AB1', 'CD2', 'EF3', 'GH4'):
+        p.park_car(plate)
+    p.remove_car(2)
+    p.remove_car(3, hours_override=1.5)
+p.update_comments(1, 'rear bumper, dented')
+p.transactions[0]['comments'] = 'paid at the gate'
+path = os.path.join(tmp, 'park.snapshot')
+p.save_snapshot(path)
+
+q = CarPark.load_snapshot(path)
+assert q.transactions._mapped
+assert q.to_dict() == p.to_dict()
+assert q.latest_transaction(3)['plate'] == 'EF3' and q.open_transaction(1) is None
+assert q.search_plates('CD') == [{'plate': 'CD2', 'spot': None}] and q.find_plate('AB1') == 1
+assert q.report_totals() == p.report_totals()
+window = ('2000-01-01', '2100-01-01')
+assert q.revenue_between(*window) == p.revenue_between(*window)
+assert q.transactions._mapped
+
+with contextlib.redirect_stdout(io.StringIO()):
+    q.park_car('ZZ9')
+    q.remove_car(1)
+assert not q.transactions._mapped
+assert [tx['id'] for tx in q.transactions] == [1, 2, 3]
+assert q.get_transaction(1)['comments'] == 'paid at the gate'
+assert q.revenue_between(*window)['transactions'] == 3
+
+# anything else is refused
+junk = os.path.join(tmp, 'junk')
+for content in (b'', b'CARPARK', b'not a snapshot at all, just text'):
+    with open(junk, 'wb') as f:
+        f.write(content)
+    try:
+        snapshot.read(junk)
+        raise AssertionError('read should fail')
+    except ValueError:
+        pass
+
+# attached: the first load writes the snapshot, later ones start from it and
+# read only what was committed since
+db = os.path.join(tmp, 'park.db')
+snap = os.path.join(tmp, 'park.db.snapshot')
+writer = CarPark(6)
+writer.attach_db(db)
+with contextlib.redirect_stdout(io.StringIO()):
+    for plate in ('AAA111', 'BBB222', 'CCC333'):
+        writer.park_car(plate)
+    writer.remove_car(1)
+
+a = CarPark.load_from_db(db, write_through=True, snapshot=snap)
+assert os.path.exists(snap) and not a.transactions._mapped
+a.detach_db()
+
+with contextlib.redirect_stdout(io.StringIO()):
+    writer.remove_car(2)
+writer.set_rate(4.0)
+written = os.stat(snap).st_ino
+b = CarPark.load_from_db(db, write_through=True, snapshot=snap)
+# taken from the snapshot, which is left as it was for so few changes
+assert os.stat(snap).st_ino == written
+assert b.version == writer.version and b.rate_per_hour == 4.0
+assert sorted(b.parked_cars) == [3] and [tx['plate'] for tx in b.transactions] == ['AAA111', 'BBB222']
+assert b.search_plates('BBB') == [{'plate': 'BBB222', 'spot': None}]
+assert b.revenue_between(*window)['transactions'] == 2
+with contextlib.redirect_stdout(io.StringIO()):
+    assert b.park_car('DDD444') == 1
+writer.refresh()
+assert writer.parked_cars[1]['plate'] == 'DDD444'
+b.detach_db()
+d = CarPark.load_from_db(db, write_through=True, snapshot=snap)
+assert d.to_dict() == writer.to_dict()
+d.save_snapshot(snap)
+d.detach_db()
+# nothing new since: the log is still read in place
+e = CarPark.load_from_db(db, write_through=True, snapshot=snap)
+assert e.transactions._mapped and e.to_dict() == writer.to_dict()
+e.detach_db()
+
+# a snapshot of another database is not used
+other = os.path.join(tmp, 'other.db')
+CarPark(2).attach_db(other)
+c = CarPark.load_from_db(other, write_through=True, snapshot=snap)
+assert c.capacity == 2 and not c.transactions
+c.detach_db()
+writer.detach_db()
+
+print('All tests passed')
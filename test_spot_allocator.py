@@ -0,0 +1,35 @@
+from practice import CarPark
+from spot_allocator import FreeSpotAllocator
+
+a = FreeSpotAllocator(130, occupied=[1, 2, 65])
+assert a.free_count() == 127
+assert a.acquire() == 3
+assert a.claim(64)
+assert not a.claim(64)
+a.release(2)
+assert a.lowest() == 2
+# fill every remaining spot and check we run out at the right time
+taken = []
+while True:
+    spot = a.acquire()
+    if spot is None:
+        break
+    taken.append(spot)
+assert a.free_count() == 0
+assert sorted(taken) == [s for s in range(1, 131) if s not in (1, 3, 64, 65)]
+a.release(130)
+assert a.acquire() == 130
+
+# lowest free spot is reused after removal, also after from_dict
+p = CarPark(5)
+for plate in ('A', 'B', 'C'):
+    assert p.park_car(plate)
+assert p.remove_car(2)
+assert p.park_car('D')
+assert p.parked_cars[2]['plate'] == 'D'
+q = CarPark.from_dict(p.to_dict())
+q.remove_car(1)
+assert q.park_car('E')
+assert q.parked_cars[1]['plate'] == 'E'
+assert q.park_car('F') and 4 in q.parked_cars
+print('All tests passed')
@@ -0,0 +1,60 @@
+import contextlib
+import io
+import os
+import tempfile
+
+os.environ['CARPARK_DB'] = os.path.join(tempfile.mkdtemp(), 'versions.db')
+import app as web  # noqa: E402
+from practice import CarPark  # noqa: E402
+
+# memory-only parks number their changes too
+p = CarPark(3)
+with contextlib.redirect_stdout(io.StringIO()):
+    p.park_car('A')
+    p.park_car('B')
+    p.remove_car(1)
+p.set_rate(3.0)
+assert p.version == 4
+assert [(k, s) for _, k, s, _ in p.changes_since(1)] == [('park', 2), ('remove', 1), ('rate', None)]
+assert p.changes_since(4) == [] and p.changes_since(5) is None
+
+# /api/state: ETag revalidation and ?since deltas
+park = web.ensure_carpark()
+client = web.app.test_client()
+client.post('/api/login', json={'username': 'admin', 'password': 'admin'})
+r = client.get('/api/state')
+etag, v0 = r.headers['ETag'], r.get_json()['version']
+assert client.get('/api/state', headers={'If-None-Match': etag}).status_code == 304
+
+r = client.post(f'/api/park?since={v0}', json={'plate': 'XYZ'})
+delta = r.get_json()['delta']
+assert 'state' not in r.get_json() and delta['delta'] and delta['since'] == v0
+assert delta['spots'] == [{'spot': 1, 'car': dict(park.parked_cars[1], spot=1)}] and delta['transactions'] == []
+assert client.get('/api/state', headers={'If-None-Match': etag}).status_code == 200
+
+r = client.post(f"/api/remove?since={delta['version']}", json={'spot': 1})
+delta = r.get_json()['delta']
+assert delta['spots'] == [{'spot': 1, 'car': None}] and delta['transactions'][0]['plate'] == 'XYZ'
+assert delta['available_spots'] == park.capacity
+
+# a delta over several changes lists each touched spot and transaction once
+with contextlib.redirect_stdout(io.StringIO()):
+    other = CarPark.load_from_db(web.DB_PATH, write_through=True)
+    other.park_car('P1')
+    other.park_car('P2')
+    other.update_comments(2, 'x')
+    other.remove_car(1)
+    other.detach_db()
+r = client.get(f"/api/state?since={delta['version']}").get_json()
+assert [s['spot'] for s in r['spots']] == [1, 2] and r['spots'][1]['car']['comments'] == 'x'
+assert [t['plate'] for t in r['transactions']] == ['P1']
+# mutations without ?since report their own change only
+r = client.post('/api/rate', json={'rate_per_hour': 5}).get_json()['delta']
+assert r['spots'] == [] and r['rate_per_hour'] == 5.0
+
+# too old (or unknown) versions fall back to the full state
+r = client.get('/api/state?since=999999').get_json()
+assert r['delta'] is False and 'parked_cars' in r
+assert client.get('/api/state?since=x').status_code == 400
+park.detach_db()
+print('All tests passed')
@@ -0,0 +1,69 @@
+import contextlib
+import io
+import os
+import sqlite3
+import tempfile
+
+from practice import CarPark
+
+# memory-only parks number transactions too, and the ids survive JSON
+p = CarPark(3)
+with contextlib.redirect_stdout(io.StringIO()):
+    for plate in ('A1', 'B2', 'C3'):
+        p.park_car(plate)
+    for spot in (2, 1, 3):
+        p.remove_car(spot)
+assert [t['id'] for t in p.transactions] == [1, 2, 3]
+assert p.get_transaction(2)['plate'] == 'A1' and p.get_transaction(9) is None
+assert p.latest_transaction(3)['plate'] == 'C3' and p.latest_transaction(4) is None
+
+tmp = tempfile.mkdtemp()
+path = os.path.join(tmp, 'park.json')
+p.save_to_file(path)
+q = CarPark.load_from_file(path)
+assert [t['id'] for t in q.transactions] == [1, 2, 3]
+
+# older files without ids get them on load; an open record is indexed per spot
+legacy = {'capacity': 2, 'rate_per_hour': 2.0, 'parked_cars': {'1': {'plate': 'OLD', 'time_in': '2024-01-01T08:00:00'}},
+          'transactions': [{'spot': 2, 'plate': 'X', 'time_in': '2024-01-01T07:00:00', 'time_out': '2024-01-01T08:00:00',
+                            'amount': 2.0, 'paid': False, 'comments': ''},
+                           {'spot': 1, 'plate': 'OLD', 'time_in': '2024-01-01T08:00:00', 'time_out': '',
+                            'amount': 0.0, 'paid': False, 'comments': ''}]}
+r = CarPark.from_dict(legacy)
+assert [t['id'] for t in r.transactions] == [1, 2]
+assert r.open_transaction(1)['id'] == 2 and r.open_transaction(2) is None
+r.update_comments(1, 'note')
+assert r.get_transaction(2)['comments'] == 'note'
+
+# ids are kept through SQLite, and bulk mark-paid is one statement
+db = os.path.join(tmp, 'park.db')
+p.attach_db(db)
+with contextlib.redirect_stdout(io.StringIO()):
+    for i in range(600):
+        p.park_car(f'N{i}')
+        p.remove_car(1)
+statements = []
+p._db.set_trace_callback(statements.append)
+unpaid = [t['id'] for t in p.unpaid_transactions()]
+statements.clear()
+assert p.mark_paid(unpaid) == 603
+assert sum(s.startswith('UPDATE transactions') for s in statements) == 1
+assert not p.unpaid_transactions() and all(t['paid'] for t in p.transactions)
+p._db.set_trace_callback(None)
+
+# other workers pick the bulk change up
+other = CarPark.load_from_db(db, write_through=True)
+assert [t['id'] for t in other.transactions][:3] == [1, 2, 3]
+p.mark_paid([1, 2], paid=False)
+assert other.refresh()
+assert [t['paid'] for t in other.transactions[:3]] == [False, False, True]
+conn = sqlite3.connect(db)
+assert conn.execute('SELECT COUNT(*) FROM transactions WHERE paid = 0').fetchone()[0] == 2
+conn.close()
+
+# records outside the in-memory window are read from SQLite
+w = CarPark.load_from_db(db, write_through=True, history_limit=10)
+assert w._find_transaction(1) is None and w.get_transaction(1)['plate'] == 'B2'
+for park in (p, other, w):
+    park.detach_db()
+print('All tests passed')
@@ -0,0 +1,58 @@
+import contextlib
+import io
+import os
+import tempfile
+
+from practice import CarPark
+
+db = os.path.join(tempfile.mkdtemp(), 'queries.db')
+p = CarPark(4)
+p.attach_db(db)
+with contextlib.redirect_stdout(io.StringIO()):
+    for plate in ('AB-100', 'ab-200', 'XY_300', 'AB-100'):
+        p.park_car(plate)
+        p.remove_car(1, amount_override=5)
+p.update_transaction(p.transactions[0], paid=True)
+day = p.transactions[0]['time_out'][:10]
+
+memory = CarPark.from_dict(p.to_dict())
+for park in (p, memory):
+    assert [t['id'] for t in park.transactions_for_plate('ab-100')] == [1, 4]
+    assert [t['id'] for t in park.transactions_for_plate('AB', match='prefix')] == [1, 2, 4]
+    assert [t['id'] for t in park.transactions_for_plate('_', match='contains')] == [3]
+    assert [t['id'] for t in park.unpaid_transactions()] == [2, 3, 4]
+    assert len(park.transactions_for_day(day)) == 4
+    assert park.transactions_for_day('1999-01-01') == []
+    assert len(park.transactions_for_spot(1)) == 4
+    assert [t['id'] for t in park.query_transactions(newest_first=True, limit=2)] == [4, 3]
+
+# paging by date range walks (time_out date, id), the same in both modes
+times = ['2024-03-02T10:00:00', '2024-03-01T10:00:00', '2024-03-02T11:00:00', '2024-02-28T09:00:00',
+         '2024-03-01T12:00:00', '2024-03-03T08:00:00']
+dated = CarPark.from_dict({'capacity': 1, 'transactions': [
+    {'id': i + 1, 'spot': 1, 'plate': 'D', 'time_in': t, 'time_out': t, 'amount': 1.0, 'paid': False}
+    for i, t in enumerate(times)]})
+dated_db = os.path.join(tempfile.mkdtemp(), 'dated.db')
+dated.save_to_db(dated_db)
+attached = CarPark.load_from_db(dated_db, write_through=True)
+for park in (dated, attached):
+    for newest_first, expected in ((True, [3, 1, 5, 2]), (False, [2, 5, 1, 3])):
+        seen, cursor = [], None
+        while True:
+            page, cursor = park.page_transactions(cursor=cursor, limit=1 if newest_first else 3,
+                                                  newest_first=newest_first,
+                                                  date_from='2024-03-01', date_to='2024-03-02')
+            seen += [t['id'] for t in page]
+            if cursor is None:
+                break
+        assert seen == expected, (park.db_path, newest_first, seen)
+    page, cursor = park.page_transactions(limit=4)
+    assert [t['id'] for t in page] == [6, 5, 4, 3] and cursor == '3'
+attached.detach_db()
+
+# editing a row returned by a query also updates the in-memory record
+row = p.transactions_for_plate('XY_300')[0]
+p.update_transaction(row, paid=True)
+assert p.transactions[2]['paid']
+p.detach_db()
+print('All tests passed')
@@ -0,0 +1,82 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+
+from practice import CarPark
+from records import TransactionLog
+
+regular = {'id': 7, 'spot': 3, 'plate': 'AB123', 'time_in': '2024-03-01T08:15:00.250000+07:00',
+           'time_out': '2024-03-01T10:00:00+07:00', 'amount': 3.5, 'paid': False, 'comments': 'late'}
+legacy = {'spot': 1, 'plate': 'XY9', 'time_in': '2024-03-01T08:00:00', 'time_out': '',
+          'amount': 0.0, 'paid': False, 'comments': ''}
+odd = {'spot': 2, 'plate': None, 'time_in': '2024-03-01 08:00', 'time_out': None,
+       'amount': 2, 'paid': 0, 'comments': None, 'note': 'extra'}
+
+log = TransactionLog([regular, legacy, odd])
+# every record comes back exactly as stored, types included
+assert [t.to_dict() for t in log] == [regular, legacy, odd]
+assert type(log[2]['amount']) is int and log[2]['paid'] == 0
+assert 'id' not in log[1] and log[1].get('id') is None
+assert dict(log[0]) == regular and log[0] == log[0]
+
+# views write to the columns and fall back to verbatim storage
+tx = log[0]
+tx['paid'] = True
+tx.update(amount=1.25, comments='')
+assert log[0]['paid'] is True and log[0]['amount'] == 1.25 and log[0]['comments'] == ''
+tx['amount'] = '4.00'
+assert log[0]['amount'] == '4.00'
+tx['amount'] = 4.0
+assert log[0]['amount'] == 4.0 and 0 not in log._raw
+assert log.find(7) == tx and log.find(99) is None
+
+# trimming the front keeps views of later rows valid
+last = log[-1]
+del log[:2]
+assert len(log) == 1 and last['note'] == 'extra' and log[0] == odd
+try:
+    tx['plate']
+except IndexError:
+    pass
+else:
+    raise AssertionError('view of a trimmed row should fail')
+
+# plates are interned once however many transactions share them
+many = TransactionLog({'spot': 1, 'plate': 'SAME', 'time_in': '', 'time_out': '',
+                       'amount': 0.0, 'paid': False} for _ in range(100))
+assert len(many._plate_table) == 1
+
+# lookup by id: direct when ids increase, a scan when they do not
+ordered = TransactionLog({'id': i, 'spot': 1} for i in (1, 2, 3, 5, 8))
+assert ordered.find(5)['id'] == 5 and ordered.find(4) is None and ordered._ordered
+shuffled = TransactionLog({'id': i, 'spot': 1} for i in (3, 1, 2))
+assert shuffled.find(1)['id'] == 1 and shuffled._ordered is False
+late = TransactionLog([{'id': 1, 'spot': 1}, {'spot': 2}])
+late[1]['id'] = 2
+assert late.find(2)['spot'] == 2 and late._ordered and late.max_id() == 2
+
+# CarPark files hold every record exactly as stored
+tmp = tempfile.mkdtemp()
+data = {'capacity': 3, 'parked_cars': {}, 'rate_per_hour': 2.0, 'transactions': [regular, legacy]}
+p = CarPark.from_dict(data)
+path = os.path.join(tmp, 'park.json')
+p.save_to_file(path)
+with open(path, encoding='utf-8') as f:
+    lines = [json.loads(line) for line in f]
+# apart from the id given to the record that had none
+assert lines[1:] == [dict(regular, kind='transaction'), dict(legacy, id=8, kind='transaction')]
+assert CarPark.load_from_file(path).to_dict() == dict(data, transactions=[regular, dict(legacy, id=8)])
+with contextlib.redirect_stdout(io.StringIO()):
+    p.park_car('NEW1')
+    tx = p.remove_car(1)
+assert p.transactions[-1] == tx and tx['plate'] == 'NEW1'
+assert json.loads(json.dumps(p.to_dict()))['transactions'][-1] == tx.to_dict()
+
+# and survives a round trip through SQLite
+db = os.path.join(tmp, 'park.db')
+p.save_to_db(db)
+q = CarPark.load_from_db(db)
+assert [t.to_dict() for t in q.transactions] == [dict(t) for t in p.transactions]
+print('All tests passed')
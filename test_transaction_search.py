@@ -0,0 +1,70 @@
+import contextlib
+import io
+import os
+import sqlite3
+import tempfile
+
+os.environ['CARPARK_DB'] = os.path.join(tempfile.mkdtemp(), 'search.db')
+import app as web  # noqa: E402
+from practice import CarPark  # noqa: E402
+
+
+def checkout(park, plate, comments=''):
+    with contextlib.redirect_stdout(io.StringIO()):
+        park.park_car(plate)
+        spot = park.find_plate(plate)
+        if comments:
+            park.update_comments(spot, comments)
+        return park.remove_car(spot)
+
+
+web.carpark.detach_db()
+park = web.carpark = web.new_carpark(5)
+bumper = checkout(park, 'AB1111', 'Damage on rear bumper')
+vip = checkout(park, 'VIP001', 'regular')
+checkout(park, 'CD2222', 'VIP guest of the manager')
+checkout(park, 'EF3333')
+
+assert [tx['id'] for tx in park.search_transactions('rear bump')] == [bumper['id']]
+assert park.search_transactions('REAR   BUMPER!')[0]['plate'] == 'AB1111'
+assert park.search_transactions('bumper rear')  # word order does not matter
+assert park.search_transactions('front bumper') == [] and park.search_transactions('  ') == []
+# a plate hit ranks above a comment hit
+assert [tx['plate'] for tx in park.search_transactions('vip')] == ['VIP001', 'CD2222']
+assert len(park.search_transactions('vip', limit=1)) == 1
+
+# edits and other workers' writes are indexed as they are committed
+park.update_transaction(vip, comments='scratched door')
+assert [tx['plate'] for tx in park.search_transactions('vip')] == ['VIP001', 'CD2222']
+assert [tx['plate'] for tx in park.search_transactions('scratch')] == ['VIP001']
+other = CarPark.load_from_db(web.DB_PATH, write_through=True)
+checkout(other, 'GH4444', 'left keys at desk')
+assert [tx['plate'] for tx in park.search_transactions('keys')] == ['GH4444']
+other.detach_db()
+
+# memory-only parks scan with the same rules
+memory = CarPark.from_dict(park.to_dict())
+for query in ('rear bump', 'scratch', 'keys', 'front'):
+    assert [tx['id'] for tx in memory.search_transactions(query)] == \
+        [tx['id'] for tx in park.search_transactions(query)]
+
+# a version 1 file gets its existing rows indexed on upgrade
+old = os.path.join(tempfile.mkdtemp(), 'old.db')
+park.save_to_db(old)
+conn = sqlite3.connect(old)
+conn.executescript('DROP TABLE transactions_fts; DROP TRIGGER transactions_fts_insert; '
+                   'DROP TRIGGER transactions_fts_delete; DROP TRIGGER transactions_fts_update; '
+                   'PRAGMA user_version = 1;')
+conn.close()
+upgraded = CarPark.load_from_db(old, write_through=True)
+assert [tx['plate'] for tx in upgraded.search_transactions('bumper')] == ['AB1111']
+upgraded.detach_db()
+
+client = web.app.test_client()
+assert client.get('/api/transactions/search?q=vip').status_code == 401
+client.post('/api/login', json={'username': 'admin', 'password': 'admin'})
+body = client.get('/api/transactions/search?q=desk').get_json()
+assert [tx['plate'] for tx in body['transactions']] == ['GH4444']
+assert client.get('/api/transactions/search?q=desk&limit=0').status_code == 400
+
+print('All tests passed')
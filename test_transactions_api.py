@@ -0,0 +1,63 @@
+import contextlib
+import io
+import os
+import tempfile
+
+os.environ['CARPARK_DB'] = os.path.join(tempfile.mkdtemp(), 'api.db')
+import app as web  # noqa: E402
+
+# a fresh park of our own: app may already be imported (and its park
+# used) by another test module in this process
+web.carpark.detach_db()
+park = web.carpark = web.new_carpark(5)
+with contextlib.redirect_stdout(io.StringIO()):
+    for i in range(120):
+        park.park_car(f'AB{i:03d}' if i % 2 else f'ZZ{i:03d}')
+        park.remove_car(1)
+# ids carry on from whatever the database held before
+first = park.transactions[0]['id']
+park.mark_paid(range(first, first + 40))
+
+client = web.app.test_client()
+assert client.get('/api/transactions').status_code == 401
+assert client.post('/api/login', json={'username': 'admin', 'password': 'admin'}).status_code == 200
+
+# walk every page newest first
+ids, cursor = [], None
+while True:
+    r = client.get('/api/transactions', query_string={'limit': 50, 'cursor': cursor or ''})
+    assert r.status_code == 200
+    body = r.get_json()
+    ids += [tx['id'] for tx in body['transactions']]
+    cursor = body['next_cursor']
+    if cursor is None:
+        break
+assert ids == list(range(first + 119, first - 1, -1))
+
+# filters combine, and fields project
+r = client.get('/api/transactions', query_string={'plate': 'ab', 'match': 'prefix', 'paid': 'false',
+                                                  'order': 'asc', 'limit': 5, 'fields': 'id,plate'})
+body = r.get_json()
+assert [tx['id'] for tx in body['transactions']] == [first + 41, first + 43, first + 45, first + 47, first + 49]
+assert set(body['transactions'][0]) == {'id', 'plate'} and body['next_cursor'] == str(first + 49)
+r = client.get('/api/transactions', query_string={'spot': 1, 'from': '2000-01-01', 'to': '2999-12-31', 'limit': 500})
+assert len(r.get_json()['transactions']) == 120
+r = client.get('/api/transactions', query_string={'to': '2000-01-01'})
+assert r.get_json() == {'transactions': [], 'next_cursor': None}
+
+for bad in ({'limit': 0}, {'cursor': 'x'}, {'from': '01/02/2024'}, {'fields': 'id,secret'},
+            {'paid': 'maybe'}, {'order': 'up'}):
+    assert client.get('/api/transactions', query_string=bad).status_code == 400, bad
+
+# marking paid changes money: admins only
+r = client.post('/api/transactions/paid', json={'ids': [first + 40, first + 41]})
+assert r.status_code == 200 and r.get_json()['updated'] == 2
+if not web.user_manager.get_user('clerk'):
+    web.user_manager.create_user('clerk', 'clerk-pass')
+clerk = web.app.test_client()
+clerk.post('/api/login', json={'username': 'clerk', 'password': 'clerk-pass'})
+assert clerk.get('/api/transactions').status_code == 200
+assert clerk.post('/api/transactions/paid', json={'ids': [first + 42]}).status_code == 403
+assert not park.get_transaction(first + 42)['paid']
+park.detach_db()
+print('All tests passed')
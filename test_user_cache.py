@@ -0,0 +1,51 @@
+import os
+import sqlite3
+import tempfile
+
+from db import connection
+from user_manager import UserManager
+
+db = os.path.join(tempfile.mkdtemp(), 'users.db')
+users = UserManager(db)
+other = UserManager(db)  # another worker on the same file
+assert users.is_admin('admin')
+
+# warm lookups open no connection and read no table, only data_version
+opened = []
+statements = []
+real_connect = sqlite3.connect
+sqlite3.connect = lambda *a, **k: opened.append(a) or real_connect(*a, **k)
+connection(db).set_trace_callback(statements.append)
+try:
+    for _ in range(1000):
+        assert users.is_admin('admin')
+        assert users.authenticate('admin', 'admin')
+    assert opened == []
+    assert set(statements) == {'PRAGMA data_version'}
+finally:
+    sqlite3.connect = real_connect
+    connection(db).set_trace_callback(None)
+
+# callers get copies, not the cached dicts
+users.get_user('admin')['role'] = 'user'
+assert users.is_admin('admin')
+
+# own changes show up at once
+users.create_user('alice', 'secret1', 'admin')
+assert users.is_admin('alice')
+users.change_password('alice', 'secret2')
+assert users.authenticate('alice', 'secret2') and not users.authenticate('alice', 'secret1')
+
+# another worker's changes show up at the next lookup
+assert other.is_admin('alice')
+other.delete_user('alice')
+assert not users.is_admin('alice') and users.get_user('alice') is None
+
+# writes that bypass UserManager bump the stamp too (triggers)
+conn = sqlite3.connect(db)
+conn.execute("UPDATE users SET role = 'user' WHERE username = 'admin'")
+conn.commit()
+conn.close()
+assert not users.is_admin('admin')
+
+print('All tests passed')
@@ -0,0 +1,47 @@
+import os
+import sqlite3
+import tempfile
+
+from practice import CarPark
+
+tmp = tempfile.mkdtemp()
+db = os.path.join(tmp, 'wt.db')
+
+p = CarPark(3)
+p.attach_db(db)
+assert p.park_car('AAA111')
+assert p.park_car('BBB222')
+p.update_comments(2, 'VIP')
+tx = p.remove_car(1, hours_override=2)
+assert tx['id']
+p.update_transaction(tx, paid=True)
+p.set_rate(3.5)
+
+# a second reader sees every change without save_to_db being called
+q = CarPark.load_from_db(db)
+assert q.rate_per_hour == 3.5
+assert q.parked_cars[2]['comments'] == 'VIP'
+assert 1 not in q.parked_cars
+assert len(q.transactions) == 1
+assert q.transactions[0]['id'] == tx['id'] and q.transactions[0]['paid']
+
+# batch() groups operations into one commit and rolls back on error
+with p.batch():
+    p.park_car('CCC333')
+    p.remove_car(2)
+assert len(CarPark.load_from_db(db).transactions) == 2
+try:
+    with p.batch():
+        p.park_car('DDD444')
+        raise RuntimeError('gate offline')
+except RuntimeError:
+    pass
+assert 'DDD444' not in [r['plate'] for r in CarPark.load_from_db(db).parked_cars.values()]
+
+# ids survive a full save to another file
+other = os.path.join(tmp, 'copy.db')
+p.save_to_db(other)
+ids = [r[0] for r in sqlite3.connect(other).execute('SELECT id FROM transactions ORDER BY id')]
+assert ids == [t['id'] for t in p.transactions]
+p.detach_db()
+print('All tests passed')
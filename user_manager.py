@@ -1,8 +1,10 @@
 import hashlib
 import secrets
-import sqlite3
+import threading
 from typing import Optional, Dict, List
 
+import db
+
 # ============================================================================
 # DEFAULT ADMIN CREDENTIALS - USED ONLY ON FIRST RUN TO SEED USER TABLE
 # CHANGE THESE BEFORE FIRST RUN TO SET YOUR OWN DEFAULT ADMIN ACCOUNT.
@@ -31,18 +33,36 @@ def verify_password(password: str, stored_hash: str) -> bool:
 
 
 class UserManager:
-    """Simple user manager that stores accounts inside the same SQLite DB."""
+    """Simple user manager that stores accounts inside the same SQLite DB.
+
+    Looked-up users are cached in process. Every write to the users table
+    bumps users_version.version (by trigger, so writes from other
+    processes count too). A lookup reads that stamp only if the database
+    changed since this thread last did (PRAGMA data_version, which reads
+    no table, and the connection's own total_changes) and drops the cache
+    when it moved, so a deleted user, a demoted admin or an old password
+    stops working at once in every worker.
+    """
 
     def __init__(self, db_path: str):
         self.db_path = db_path
+        self._cache: Dict[str, Dict[str, str]] = {}
+        self._cache_version = None
+        # per thread: (connection, (data_version, total_changes), stamp)
+        # when the stamp was last read
+        self._seen = threading.local()
+        self._lock = threading.Lock()
         self._ensure_user_table()
         self._ensure_default_admin()
 
     def _connect(self):
-        return sqlite3.connect(self.db_path)
+        # this thread's pooled connection, in autocommit mode
+        return db.connection(self.db_path)
 
     def _ensure_user_table(self):
         conn = self._connect()
+        # one transaction, so workers starting together see all or nothing
+        conn.execute("BEGIN IMMEDIATE")
         try:
             conn.execute(
                 """
@@ -54,40 +74,93 @@ class UserManager:
                 )
                 """
             )
-            conn.commit()
-        finally:
-            conn.close()
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS users_version (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    version INTEGER NOT NULL
+                )
+                """
+            )
+            conn.execute("INSERT OR IGNORE INTO users_version (id, version) VALUES (1, 0)")
+            for event in ("INSERT", "UPDATE", "DELETE"):
+                conn.execute(
+                    f"""
+                    CREATE TRIGGER IF NOT EXISTS users_version_{event.lower()}
+                    AFTER {event} ON users
+                    BEGIN
+                        UPDATE users_version SET version = version + 1 WHERE id = 1;
+                    END
+                    """
+                )
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
 
     def _ensure_default_admin(self):
         if not self.get_user(DEFAULT_ADMIN_USERNAME):
             self.create_user(DEFAULT_ADMIN_USERNAME, DEFAULT_ADMIN_PASSWORD, role="admin")
 
     def get_user(self, username: str) -> Optional[Dict[str, str]]:
+        with self._lock:
+            self._check_stamp()
+            user = self._cache.get(username)
+            if user is None:
+                user = self._load_user(username)
+            return dict(user) if user else None
+
+    def _load_user(self, username: str) -> Optional[Dict[str, str]]:
         conn = self._connect()
+        # row and stamp from one snapshot, so a cached row is never
+        # newer or older than the version it is filed under
+        conn.execute("BEGIN")
         try:
-            cur = conn.execute(
+            version = conn.execute("SELECT version FROM users_version WHERE id = 1").fetchone()[0]
+            row = conn.execute(
                 "SELECT username, password_hash, role FROM users WHERE username = ?",
                 (username,),
-            )
-            row = cur.fetchone()
-            if row:
-                return {"username": row[0], "password_hash": row[1], "role": row[2]}
-            return None
+            ).fetchone()
         finally:
-            conn.close()
+            conn.rollback()
+        if version != self._cache_version:
+            self._cache.clear()
+            self._cache_version = version
+        if row:
+            # unknown names are not cached: anyone can make those up
+            user = self._cache[username] = {"username": row[0], "password_hash": row[1], "role": row[2]}
+            return user
+        return None
+
+    def _check_stamp(self):
+        """Drop the cache if the users table changed since it was filled."""
+        conn = self._connect()
+        # data_version moves with other connections' commits only, and
+        # total_changes with this connection's own writes
+        changes = (conn.execute("PRAGMA data_version").fetchone()[0], conn.total_changes)
+        seen = getattr(self._seen, "state", None)
+        if seen is not None and seen[0] is conn and seen[1] == changes and seen[2] == self._cache_version:
+            return
+        version = conn.execute("SELECT version FROM users_version WHERE id = 1").fetchone()[0]
+        self._seen.state = (conn, changes, version)
+        if version != self._cache_version:
+            self._cache.clear()
+            self._cache_version = version
+
+    def invalidate_cache(self):
+        with self._lock:
+            self._cache.clear()
+            self._cache_version = None
 
     def list_users(self) -> List[Dict[str, str]]:
         conn = self._connect()
-        try:
-            cur = conn.execute(
-                "SELECT username, role, created_at FROM users ORDER BY created_at ASC"
-            )
-            return [
-                {"username": row[0], "role": row[1], "created_at": row[2]}
-                for row in cur.fetchall()
-            ]
-        finally:
-            conn.close()
+        cur = conn.execute(
+            "SELECT username, role, created_at FROM users ORDER BY created_at ASC"
+        )
+        return [
+            {"username": row[0], "role": row[1], "created_at": row[2]}
+            for row in cur.fetchall()
+        ]
 
     def create_user(self, username: str, password: str, role: str = "user"):
         username = (username or "").strip()
@@ -102,14 +175,11 @@ class UserManager:
             raise ValueError("Username already exists.")
 
         conn = self._connect()
-        try:
-            conn.execute(
-                "INSERT INTO users (username, password_hash, role) VALUES (?, ?, ?)",
-                (username, hash_password(password), role),
-            )
-            conn.commit()
-        finally:
-            conn.close()
+        conn.execute(
+            "INSERT INTO users (username, password_hash, role) VALUES (?, ?, ?)",
+            (username, hash_password(password), role),
+        )
+        self.invalidate_cache()
 
     def authenticate(self, username: str, password: str) -> bool:
         user = self.get_user(username)
@@ -123,14 +193,11 @@ class UserManager:
         if not self.get_user(username):
             raise ValueError("User does not exist.")
         conn = self._connect()
-        try:
-            conn.execute(
-                "UPDATE users SET password_hash = ? WHERE username = ?",
-                (hash_password(new_password), username),
-            )
-            conn.commit()
-        finally:
-            conn.close()
+        conn.execute(
+            "UPDATE users SET password_hash = ? WHERE username = ?",
+            (hash_password(new_password), username),
+        )
+        self.invalidate_cache()
 
     def reset_password(self, target_username: str, new_password: str):
         self.change_password(target_username, new_password)
@@ -141,11 +208,8 @@ class UserManager:
         if self.is_last_admin(target_username):
             raise ValueError("Cannot delete the last admin account.")
         conn = self._connect()
-        try:
-            conn.execute("DELETE FROM users WHERE username = ?", (target_username,))
-            conn.commit()
-        finally:
-            conn.close()
+        conn.execute("DELETE FROM users WHERE username = ?", (target_username,))
+        self.invalidate_cache()
 
     def is_admin(self, username: str) -> bool:
         user = self.get_user(username)
@@ -156,10 +220,7 @@ class UserManager:
         if not user or user.get("role") != "admin":
             return False
         conn = self._connect()
-        try:
-            cur = conn.execute("SELECT COUNT(*) FROM users WHERE role = 'admin'")
-            count = cur.fetchone()[0]
-            return count == 1
-        finally:
-            conn.close()
+        cur = conn.execute("SELECT COUNT(*) FROM users WHERE role = 'admin'")
+        count = cur.fetchone()[0]
+        return count == 1
 